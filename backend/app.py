@@ -2,22 +2,36 @@
 
 # --- Core Flask Imports ---
 # Ensure Flask, request, AND jsonify are imported
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context, g
 from flask_cors import CORS
 import json
 
 # --- Standard Library Imports ---
 import sqlite3  # <--- FIX for "Unresolved reference 'sqlite3'"
 import datetime #
+import logging
+import os
+import queue
+import threading
 
 # --- Project-specific Imports ---
 from scanner.utils import validate_and_normalize_url
-from scanner.header_scanner import check_security_headers
-from scanner.port_scanner import check_common_ports
-# Ensure the SQLi scanner function IS imported
-from scanner.sqli_scanner import check_sqli_potential # <--- FIX for "Unresolved reference 'check_sqli_potential'"
-# Ensure the XSS scanner function IS imported
-from scanner.xss_scanner import check_xss_potential
+# Header, port, SQLi and XSS checks are run together by the pipeline
+from scanner.pipeline import run_checks, normalize_checks, configure_pipeline, CHECKS
+from jobs import JobQueue, JOB_QUEUED
+from batch import BatchRunner, prepare_batch_urls
+from history import host_from_url, fetch_history_page, HistoryQueryError
+import db
+from result_cache import ResultCache, utc_timestamp
+from incremental import IncrementalPlan, load_previous_scan, results_from_row, diff_scans, page_state_columns
+from scanner.context import ScanContext
+from scanner.resolver import get_resolver
+from scanner import timing
+from scanner.metrics import Gauge, Counter, Histogram, REGISTRY, CONTENT_TYPE as METRICS_CONTENT_TYPE
+import logs
+from findings import insert_children, hosts_with_open_port, open_port_summary, finding_summary, list_findings
+
+logger = logging.getLogger(__name__)
 
 # --- Global Variables / Constants ---
 app = Flask(__name__)
@@ -26,96 +40,299 @@ CORS(app) # Allow requests from React frontend (adjust origins in production)
 # Define the database file name
 DATABASE = 'scanner_history.db' # <--- FIX for "Unresolved reference 'DATABASE'"
 
-# --- Database Initialization Function (Should be present from previous steps) ---
+# Parse workers (scanner/parse_pool.py) are spawned, and re-import this file as
+# __mp_main__ when it is run directly. They only parse, so they skip the
+# process-wide setup of the server.
+if __name__ != '__mp_main__':
+    # Leveled logging through a background writer for every module (LOG_LEVEL, LOG_FORMAT=text|json)
+    logs.configure_logging()
+    db.configure(DATABASE) # Pooled connections; init_db() applies migrations
+
+# Number of background threads running queued scans
+SCAN_WORKERS = int(os.environ.get('SCAN_WORKERS', 4))
+
+# Batch scans: targets scanned at once overall, and against any single host
+BATCH_MAX_CONCURRENCY = int(os.environ.get('BATCH_MAX_CONCURRENCY', 16))
+BATCH_PER_HOST_LIMIT = int(os.environ.get('BATCH_PER_HOST_LIMIT', 2))
+MAX_BATCH_SIZE = 5000
+
+# Job workers and batch slots can all be scanning at once; the check pool is sized for them
+# (plus SCAN_CONCURRENCY_EXTRA for scans run directly by /api/scan and /api/scan/stream)
+SCAN_CONCURRENCY_EXTRA = int(os.environ.get('SCAN_CONCURRENCY_EXTRA', 4))
+configure_pipeline(scan_concurrency=SCAN_WORKERS + BATCH_MAX_CONCURRENCY + SCAN_CONCURRENCY_EXTRA)
+
+# Scan-level metrics; per-check and per-request ones live in scanner/timing.py
+SCANS_IN_FLIGHT = Gauge('scanner_scans_in_flight', 'Scans currently running.')
+SCANS_FINISHED = Counter('scanner_scans', 'Finished scans by outcome (ok, failed).', labels=('outcome',))
+SCAN_SECONDS = Histogram('scanner_scan_duration_seconds', 'Wall time of whole scans, saving excluded.')
+
+# --- Database Initialization Function ---
 def init_db():
-    conn = None
     try:
         # Use the defined DATABASE constant
-        conn = sqlite3.connect(DATABASE)
-        cursor = conn.cursor()
-        print("Initializing database...")
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS scan_results (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                target_url TEXT NOT NULL,
-                scan_timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                is_link_valid BOOLEAN,
-                vulnerabilities_test_ran BOOLEAN,
-                sqli_potential BOOLEAN,
-                xss_potential BOOLEAN,
-                open_ports TEXT,
-                header_x_frame BOOLEAN,
-                header_hsts BOOLEAN,
-                header_policy BOOLEAN,
-                header_xxss BOOLEAN,
-                header_nonsnif BOOLEAN,
-                scan_errors TEXT,
-                details TEXT
-            )
-        ''')
-        conn.commit()
-        print("Database initialized successfully.")
+        db.configure(DATABASE)
+        logger.info("Initializing database...")
+        version = db.migrate() # Creates/upgrades scan_results, history indexes and scan_jobs
+        logger.info("Database initialized successfully (schema version %d).", version)
     except sqlite3.Error as e:
-        print(f"Database error during initialization: {e}")
-    finally:
-        if conn:
-            conn.close()
+        logger.error("Database error during initialization: %s", e)
 
 # --- Database Saving Function (Use the corrected version from the previous response) ---
-def save_scan_to_db(target_url, results, errors):
-    conn = None
+def save_scan_to_db(target_url, results, errors, checks=CHECKS, page_state=None, timings=None, checked_at=None):
+    """
+    Queues the scan's row (and its normalized child rows) on the group-commit
+    writer. checked_at maps checks served from a cache to when their result
+    was produced; the other checks are stamped with the current time.
+    """
     try:
-        # Use the defined DATABASE constant
-        conn = sqlite3.connect(DATABASE)
-        cursor = conn.cursor()
+        # Columns of checks that were not part of this scan stay NULL rather than False
+        def value(name, key):
+            return results.get(key, False) if name in checks else None
 
-        open_ports_json = json.dumps(results.get("Scan Ports", []))
+        open_ports_json = json.dumps(results.get("Scan Ports", [])) if "ports" in checks else None
+        services_json = json.dumps(results["services"]) if "ports" in checks and "services" in results else None
         errors_json = json.dumps(errors) if errors else None
 
         details_data = {
             "sqli": results.get("sqli_details"),
-            "xss": results.get("xss_details")
+            "sqli_findings": results.get("sqli_findings"),
+            "xss": results.get("xss_details"),
+            "crawl": results.get("crawl_findings"),
+            "tls": results.get("tls_details"),
+            "tls_findings": results.get("tls_findings")
         }
         details_json = json.dumps({k: v for k, v in details_data.items() if v})
 
-        cursor.execute('''
-            INSERT INTO scan_results (
-                target_url, is_link_valid, vulnerabilities_test_ran,
-                sqli_potential, xss_potential, open_ports,
-                header_x_frame, header_hsts, header_policy, header_xxss,
-                header_nonsnif,
-                scan_errors, details
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
+        row = (
             target_url,
             results.get("Check if the link is valid or not", False),
             results.get("Vulnerabilities Test", False),
-            results.get("SQL Injection Test", False), # Use False default
-            results.get("XSS Test", False),          # Use False default
+            value("sqli", "SQL Injection Test"), # Use False default
+            value("xss", "XSS Test"),            # Use False default
             open_ports_json,
-            results.get("Header of x-frame", False), # Use False default
-            results.get("Header of hsts", False),    # Use False default
-            results.get("Header of policy", False),  # Use False default
-            results.get("Header of xxss", False),    # Use False default
-            results.get("Header of nonsnif", False), # Use False default
+            value("headers", "Header of x-frame"), # Use False default
+            value("headers", "Header of hsts"),    # Use False default
+            value("headers", "Header of policy"),  # Use False default
+            value("headers", "Header of xxss"),    # Use False default
+            value("headers", "Header of nonsnif"), # Use False default
             errors_json,
-            details_json
-        ))
-        conn.commit()
-        print(f"Successfully saved scan results for {target_url} to database.")
+            details_json,
+            host_from_url(target_url)
+        )
+        # Baseline page validators/hashes and check timestamps used by incremental rescans
+        page_state = page_state or {}
+        state_columns = ['etag', 'last_modified', 'content_hash', 'param_signature', 'ports_scanned_at', 'probed_at']
+        row += tuple(page_state.get(column) for column in state_columns)
+        row += (json.dumps(timings) if timings else None, services_json)
+        # Per check, so a cached result saved again here keeps its age (see result_cache.check_time)
+        now = utc_timestamp()
+        check_times = {name: (checked_at or {}).get(name, now) for name in checks}
+        row += (json.dumps({name: moment for name, moment in check_times.items() if moment}),)
+
+        def insert(conn):
+            scan_id = conn.execute('''
+                INSERT INTO scan_results (
+                    target_url, is_link_valid, vulnerabilities_test_ran,
+                    sqli_potential, xss_potential, open_ports,
+                    header_x_frame, header_hsts, header_policy, header_xxss,
+                    header_nonsnif,
+                    scan_errors, details, target_host,
+                    etag, last_modified, content_hash, param_signature, ports_scanned_at, probed_at,
+                    timings, services, checked_at
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', row).lastrowid
+            # Ports, forms and findings go to the normalized tables in the same transaction
+            insert_children(conn, scan_id, target_url, results, errors)
+            return scan_id
+
+        # Queued on the group-commit writer, which batches concurrent scans into one transaction
+        scan_id = db.submit(insert)
+        logger.info("Saved scan %s of %s to database.", scan_id, target_url)
+        return scan_id
 
     except sqlite3.Error as e:
-        print(f"Database error while saving scan for {target_url}: {e}")
-    finally:
-        if conn:
-            conn.close()
+        logger.error("Database error while saving scan for %s: %s", target_url, e)
+    return None
 
 # --- Flask Routes ---
 
+@app.before_request
+def start_request_correlation():
+    # Everything logged while handling the request (including its scan) shares this id
+    correlation_id = request.headers.get('X-Request-ID') or logs.new_correlation_id()
+    g.correlation_token = logs.set_correlation_id(correlation_id[:64])
+
+
+@app.after_request
+def add_correlation_header(response):
+    response.headers['X-Request-ID'] = logs.get_correlation_id() or ''
+    return response
+
+
+@app.teardown_request
+def end_request_correlation(exc):
+    token = g.pop('correlation_token', None)
+    if token is not None:
+        logs.reset_correlation_id(token)
+
+
 @app.route('/')
 def index():
     return "Tonia Vuln Scanner Backend is running!"
 
+def run_scan(target_url, on_progress=None, on_event=None, checks=None, force=False, incremental=False):
+    """
+    Runs every check (or the names in `checks`) against an already-normalized
+    URL and saves the result. Checks with a fresh result in result_cache are
+    answered from it unless `force` is set. With `incremental`, checks that
+    cannot have changed since the previous scan reuse its results (see
+    incremental.py) and the response carries a 'diff' against that scan.
+    on_progress(results) is called after each check with the results so
+    far; on_event(event, data) receives the pipeline's streaming events.
+    Timing spans (per check and per request phase) are collected while it
+    runs and returned and saved as 'timings'.
+    Log records of the scan carry a correlation id (the request's, if
+    called while handling one), also returned as 'correlation_id'.
+    Returns (response_data, scan_id); scan_id is None when every check came
+    from the cache, as nothing new was learned to save.
+    """
+    with logs.correlation() as correlation_id:
+        response_data, scan_id = _run_scan(target_url, on_progress, on_event, checks, force, incremental)
+        response_data["correlation_id"] = correlation_id
+        return response_data, scan_id
+
+
+def _run_scan(target_url, on_progress, on_event, checks, force, incremental):
+    logger.info("Scanning %s", target_url)
+    checks = normalize_checks(checks)
+    cached_checks = []
+    previous = None
+    plan = None
+    context = ScanContext(target_url)
+    timings = timing.ScanTimings()
+
+    def handle_event(event, data):
+        if event == "cached":
+            cached_checks.append(data["check"])
+        if on_event:
+            on_event(event, data)
+
+    def report_progress(check_name, results_so_far, errors_so_far):
+        logger.debug("Finished %s check for %s", check_name, target_url)
+        if on_progress:
+            on_progress(results_so_far)
+
+    SCANS_IN_FLIGHT.inc()
+    try:
+        with timing.collect(timings):
+            if incremental and not force:
+                previous = load_previous_scan(db.get_connection(), target_url)
+                if previous is not None:
+                    # Sends the conditional baseline request and decides what can be reused
+                    plan = IncrementalPlan(db.get_connection(), target_url, previous, checks, cache=result_cache).prepare()
+                    context = plan.context
+                else:
+                    logger.info("No previous scan of %s; running a full scan.", target_url)
+            # All checks run concurrently; the slowest one sets the scan time
+            results, errors = run_checks(target_url, on_result=report_progress, on_event=handle_event,
+                                         checks=checks, cache=plan or result_cache, force=force, context=context)
+    except Exception as e:
+        logger.exception("Error during scanning process for %s: %s", target_url, e)
+        results = {"Check if the link is valid or not": True}
+        errors = {"ScanProcessError": str(e)}
+        results["Vulnerabilities Test"] = False # Mark as Fail if scan crashes
+    finally:
+        SCANS_IN_FLIGHT.dec()
+    timings.finish()
+    SCAN_SECONDS.observe(timings.finished - timings.started)
+    SCANS_FINISHED.inc(outcome="ok" if results.get("Vulnerabilities Test") else "failed")
+
+    # --- Define response_data before using it ---
+    response_data = { # <--- FIX for "Unresolved reference 'response_data'"
+        "message": "Scan completed",
+        "results": results,
+        "errors": errors if errors else None,
+        "cached_checks": cached_checks,
+        "timings": timings.as_dict()
+    }
+    if incremental:
+        diff = None
+        if plan is not None:
+            diff = diff_scans(results_from_row(db.get_connection(), previous), results, checks)
+            diff.update({
+                "previous_scan_id": previous['id'],
+                "previous_scan_timestamp": previous['scan_timestamp'],
+                "page": plan.page_state,
+                "reused_checks": plan.reused
+            })
+        response_data["diff"] = diff
+
+    # Full result dumps are only built at DEBUG, and then only for a sample of scans
+    logs.log_payload(logger, "Scan response", lambda: response_data)
+
+    # Incremental rescans are always recorded: they are the monitoring trail
+    if len(cached_checks) == len(checks) and plan is None:
+        logger.info("All checks for %s served from cache; not saving a new scan.", target_url)
+        return response_data, None
+
+    ran = [name for name in checks if name not in cached_checks]
+    try:
+        page_state = page_state_columns(target_url, context, checks, ran, previous)
+    except Exception as e:
+        logger.warning("Could not record page state for %s: %s", target_url, e)
+        page_state = None
+
+    # Served results keep their original time; None (evicted meanwhile) leaves it unknown, i.e. not reusable
+    source = plan or result_cache
+    checked_at = {name: source.checked_at(target_url, name) for name in cached_checks}
+
+    # Save results to database (regardless of scan success/failure)
+    scan_id = save_scan_to_db(target_url, results, errors, checks, page_state, response_data["timings"], checked_at)
+
+    return response_data, scan_id
+
+
+# Recent per-check results; repeat scans within a check's TTL skip the target
+result_cache = ResultCache()
+
+
+def parse_scan_options(source):
+    """
+    Scan options from a JSON body or query args: 'checks' (list or
+    comma-separated names), 'crawl' (adds the crawler stage), 'tls' (adds
+    the TLS/certificate check), 'force' and 'incremental'. Raises
+    ValueError for bad input.
+    """
+    raw_checks = source.get('checks')
+    if isinstance(raw_checks, str):
+        raw_checks = [name.strip() for name in raw_checks.split(',') if name.strip()]
+    elif raw_checks is not None and not isinstance(raw_checks, list):
+        raise ValueError("'checks' must be a list of check names")
+    options = {}
+    if raw_checks:
+        options["checks"] = list(normalize_checks(raw_checks))
+    for optional in ('crawl', 'tls'):
+        if source.get(optional) in (True, 'true', '1', 'yes'):
+            # Shorthand for the default checks plus the optional stage
+            options["checks"] = list(normalize_checks(list(options.get("checks") or CHECKS) + [optional]))
+    for flag in ('force', 'incremental'):
+        value = source.get(flag)
+        if isinstance(value, str):
+            value = value.lower() in ('1', 'true', 'yes')
+        if value:
+            options[flag] = True
+    return options
+
+
+# Background job queue; workers call run_scan for each queued job
+job_queue = JobQueue(run_scan, workers=SCAN_WORKERS)
+
+
+# Batch scans share run_scan but bypass the job queue so per-host limits apply
+batch_runner = BatchRunner(run_scan, max_concurrency=BATCH_MAX_CONCURRENCY,
+                           per_host_limit=BATCH_PER_HOST_LIMIT)
+
+
 @app.route('/api/scan', methods=['POST'])
 def handle_scan():
     if not request.is_json:
@@ -129,9 +346,6 @@ def handle_scan():
 
     target_url = validate_and_normalize_url(target_url_raw)
 
-    results = {}
-    errors = {}
-
     if not target_url:
         # Prepare specific response for invalid initial URL
         response_data_invalid = { # Define the variable before use
@@ -143,82 +357,266 @@ def handle_scan():
         # save_scan_to_db(target_url_raw, {"Check if the link is valid or not": False}, {"Validation": "Invalid URL format provided."})
         return jsonify(response_data_invalid), 400 # Use the defined variable
 
-    print(f"Received scan request for: {target_url}")
+    # Optional "checks" subset, "force" (bypass the result cache) and "incremental"
+    try:
+        options = parse_scan_options(data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    logger.info("Received scan request for %s", target_url)
+
+    # "wait": true keeps the old blocking behaviour for scripts and tests
+    if data.get('wait'):
+        response_data, _ = run_scan(target_url, **options)
+        return jsonify(response_data)
+
+    job_queue.start()
+    job_id = job_queue.enqueue(target_url, options)
+    return jsonify({
+        "message": "Scan queued",
+        "job_id": job_id,
+        "status": JOB_QUEUED,
+        "status_url": f"/api/scans/jobs/{job_id}"
+    }), 202
+
+
+def format_sse(event, data):
+    """One Server-Sent Events message."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.route('/api/scan/stream', methods=['GET'])
+def stream_scan():
+    """
+    Runs a scan and streams each result as a Server-Sent Event the moment it
+    is known: headers, each open port, each SQLi form/finding, each XSS
+    finding and any errors, then a final 'summary' event holding the same
+    response as POST /api/scan with "wait": true.
+    """
+    target_url_raw = request.args.get('url')
+    if not target_url_raw:
+        return jsonify({"error": "URL is required"}), 400
+
+    target_url = validate_and_normalize_url(target_url_raw)
+    if not target_url:
+        return jsonify({
+            "message": "nothing to view",
+            "results": None,
+            "error": "Invalid URL format provided."
+        }), 400
 
     try:
-        # Perform checks
-        results["Check if the link is valid or not"] = True # If validation passed, it's valid structurally
+        options = parse_scan_options(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    logger.info("Received streaming scan request for %s", target_url)
+    events = queue.Queue()
+
+    def scan_in_background():
+        try:
+            response_data, scan_id = run_scan(target_url, on_event=lambda event, data: events.put((event, data)),
+                                              **options)
+            response_data = dict(response_data, scan_id=scan_id)
+            events.put(("summary", response_data))
+        except Exception as e:
+            events.put(("summary", {"message": "Scan failed", "results": None, "errors": {"ScanProcessError": str(e)}}))
+        events.put(None) # End of stream
+
+    # The scan keeps running (and is saved) even if the client goes away
+    # bind() keeps the request's correlation id (and timing context) in the scan thread
+    threading.Thread(target=timing.bind(scan_in_background), name="scan-stream", daemon=True).start()
+
+    def generate():
+        yield format_sse("started", {"target_url": target_url})
+        while True:
+            item = events.get()
+            if item is None:
+                return
+            yield format_sse(*item)
+
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no' # Don't let a reverse proxy buffer the stream
+    return response
+
+
+@app.route('/api/scans/jobs/<job_id>', methods=['GET'])
+def get_scan_job(job_id):
+    """Status of a queued scan. 'partial_results' fills in as checks finish; 'result' holds the final response."""
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify({
+        "job_id": job["id"],
+        "target_url": job["target_url"],
+        "status": job["status"],
+        "created_at": job["created_at"],
+        "started_at": job["started_at"],
+        "finished_at": job["finished_at"],
+        "scan_id": job["scan_id"],
+        "partial_results": job["partial_results"],
+        "result": job["result"],
+        "error": job["error"]
+    })
+
+
+@app.route('/api/scans/jobs', methods=['GET'])
+def get_scan_job_counts():
+    """Queue depth: number of jobs per status."""
+    return jsonify(job_queue.counts())
+
+
+@app.route('/api/scans/batch', methods=['POST'])
+def handle_batch_scan():
+    """
+    Starts a batch scan. Accepts JSON {"urls": [...]} or a multipart upload
+    with a text file under 'file' (one URL per line, '#' for comments).
+    """
+    if request.is_json:
+        source = request.get_json() or {}
+        raw_urls = source.get('urls')
+        if not isinstance(raw_urls, list):
+            return jsonify({"error": "'urls' must be a list"}), 400
+    elif 'file' in request.files:
+        source = request.form
+        raw_urls = request.files['file'].read().decode('utf-8', errors='replace').splitlines()
+    else:
+        return jsonify({"error": "Provide JSON 'urls' or an uploaded 'file'"}), 400
 
-        print("Checking Headers...")
-        results.update(check_security_headers(target_url))
+    try:
+        options = parse_scan_options(source)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    urls, invalid, duplicates = prepare_batch_urls(raw_urls)
+    if not urls:
+        return jsonify({"error": "No valid URLs provided", "invalid_urls": invalid}), 400
+    if len(urls) > MAX_BATCH_SIZE:
+        return jsonify({"error": f"Batch too large (max {MAX_BATCH_SIZE} URLs)"}), 400
+
+    batch = batch_runner.submit(urls, options)
+    logger.info("Started batch %s with %d target(s).", batch.id, len(urls))
+    response_data = batch.progress()
+    response_data.update({
+        "invalid_urls": invalid,
+        "duplicates_removed": duplicates,
+        "results_url": f"/api/scans/batch/{batch.id}/results"
+    })
+    return jsonify(response_data), 202
+
+
+@app.route('/api/scans/batch/<batch_id>', methods=['GET'])
+def get_batch_progress(batch_id):
+    """Progress counters (done/failed/pending) and throughput of a batch."""
+    batch = batch_runner.get(batch_id)
+    if batch is None:
+        return jsonify({"error": "Batch not found"}), 404
+    return jsonify(batch.progress())
+
+
+@app.route('/api/scans/batch/<batch_id>/results', methods=['GET'])
+def stream_batch_results(batch_id):
+    """Streams one JSON line per target as it finishes (newline-delimited JSON)."""
+    batch = batch_runner.get(batch_id)
+    if batch is None:
+        return jsonify({"error": "Batch not found"}), 404
+
+    def generate():
+        for entry in batch.iter_results():
+            yield json.dumps(entry) + "\n"
+        yield json.dumps({"summary": batch.progress()}) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+
+# History Endpoint: newest first, cursor-paginated, filterable
+@app.route('/api/scans/history', methods=['GET'])
+def get_scan_history():
+    """
+    Query args: limit, cursor (from the previous page's next_cursor), target,
+    host, since, until, finding (sqli, xss, open_ports, missing_headers,
+    errors) and fields (columns to return; 'details' is left out by default).
+    """
+    try:
+        return jsonify(fetch_history_page(db.get_connection(), request.args)) # Use imported jsonify
+    except HistoryQueryError as e:
+        return jsonify({"error": str(e)}), 400
+    except sqlite3.Error as e:
+        logger.error("Database error fetching history: %s", e)
+        return jsonify({"error": "Failed to retrieve scan history", "details": str(e)}), 500 # Use imported jsonify
 
-        print("Checking Ports...")
-        port_results = check_common_ports(target_url)
-        if isinstance(port_results, dict):
-            results.update(port_results)
-        else:
-            errors["PortScanFormat"] = "Unexpected port scan result format"
 
-        print("Checking SQLi Potential...")
-        sqli_result = check_sqli_potential(target_url) # Use the imported function
-        results["SQL Injection Test"] = sqli_result.get("SQL Injection Test", False)
-        results["sqli_details"] = sqli_result.get("sqli_details", [])
-        if sqli_result.get("error_message"):
-             errors["SQLiError"] = sqli_result["error_message"]
+@app.route('/api/scans/<int:scan_id>', methods=['GET'])
+def get_scan(scan_id):
+    """One saved scan with every column, including details."""
+    try:
+        row = db.get_connection().execute("SELECT * FROM scan_results WHERE id = ?", (scan_id,)).fetchone()
+        if row is None:
+            return jsonify({"error": "Scan not found"}), 404
+        return jsonify(dict(row))
+    except sqlite3.Error as e:
+        logger.error("Database error fetching scan %s: %s", scan_id, e)
+        return jsonify({"error": "Failed to retrieve scan", "details": str(e)}), 500
 
-        print("Checking XSS Potential...")
-        xss_result = check_xss_potential(target_url) # Use the imported function
-        results["XSS Test"] = xss_result.get("XSS Test", False)
-        results["xss_details"] = xss_result.get("xss_details") # Assuming xss returns details string
-        if xss_result.get("error_message"):
-             errors["XSSError"] = xss_result["error_message"]
 
+@app.route('/api/scans/cache', methods=['GET'])
+def get_cache_stats():
+    """Result cache size, TTLs and hit/miss counts per check, plus the DNS cache counters."""
+    stats = result_cache.stats()
+    stats["dns"] = get_resolver().stats()
+    return jsonify(stats)
 
-        # Mark main vulnerability test as ran successfully at this point
-        results["Vulnerabilities Test"] = True
 
-    except Exception as e:
-        print(f"Error during scanning process for {target_url}: {e}")
-        errors["ScanProcessError"] = str(e)
-        results["Vulnerabilities Test"] = False # Mark as Fail if scan crashes
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Prometheus scrape endpoint: scans in flight, request counts, phase and per-check latencies, errors."""
+    return Response(REGISTRY.render(), content_type=METRICS_CONTENT_TYPE)
 
-    # --- Define response_data before using it ---
-    response_data = { # <--- FIX for "Unresolved reference 'response_data'"
-        "message": "Scan completed",
-        "results": results,
-        "errors": errors if errors else None
-    }
 
-    print(f"Sending results: {json.dumps(response_data, indent=2)}")
+# Estate-wide queries over the normalized findings tables
+@app.route('/api/findings/summary', methods=['GET'])
+def get_findings_summary():
+    """Counts per finding type and the most common open ports across all scans."""
+    try:
+        conn = db.get_connection()
+        return jsonify({"findings": finding_summary(conn), "open_ports": open_port_summary(conn)})
+    except sqlite3.Error as e:
+        logger.error("Database error fetching findings summary: %s", e)
+        return jsonify({"error": "Failed to retrieve findings summary", "details": str(e)}), 500
 
-    # Save results to database (regardless of scan success/failure)
-    save_scan_to_db(target_url, results, errors)
 
-    # Return the JSON response
-    return jsonify(response_data) # <--- Use the defined response_data
+@app.route('/api/findings/ports/<int:port>', methods=['GET'])
+def get_hosts_with_port(port):
+    """Hosts that have been seen with the given port open."""
+    try:
+        return jsonify({"port": port, "hosts": hosts_with_open_port(db.get_connection(), port)})
+    except sqlite3.Error as e:
+        logger.error("Database error fetching hosts for port %s: %s", port, e)
+        return jsonify({"error": "Failed to retrieve hosts", "details": str(e)}), 500
 
 
-# Optional History Endpoint (ensure imports/constants are available)
-@app.route('/api/scans/history', methods=['GET'])
-def get_scan_history():
-    conn = None
+@app.route('/api/findings', methods=['GET'])
+def get_findings():
+    """Findings newest first. Query args: type, host, before_id (for paging), limit."""
+    try:
+        limit = max(1, min(int(request.args.get('limit', 100)), 1000))
+        before_id = int(request.args['before_id']) if request.args.get('before_id') else None
+    except ValueError:
+        return jsonify({"error": "'limit' and 'before_id' must be integers"}), 400
     try:
-        conn = sqlite3.connect(DATABASE) # Use constant
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM scan_results ORDER BY scan_timestamp DESC LIMIT 50")
-        scans = cursor.fetchall()
-        scan_history = [dict(scan) for scan in scans]
-        return jsonify(scan_history) # Use imported jsonify
+        rows = list_findings(db.get_connection(), finding_type=request.args.get('type'),
+                             host=request.args.get('host'), before_id=before_id, limit=limit)
+        return jsonify({"findings": rows, "next_before_id": rows[-1]["id"] if len(rows) == limit else None})
     except sqlite3.Error as e:
-        print(f"Database error fetching history: {e}")
-        return jsonify({"error": "Failed to retrieve scan history", "details": str(e)}), 500 # Use imported jsonify
-    finally:
-        if conn:
-            conn.close()
+        logger.error("Database error fetching findings: %s", e)
+        return jsonify({"error": "Failed to retrieve findings", "details": str(e)}), 500
 
 
 # --- Main Execution ---
 if __name__ == '__main__':
     init_db() # Initialize DB when app starts
+    # With the debug reloader only the child process serves requests
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        job_queue.start() # Resume any jobs queued before a restart
     app.run(debug=True, port=5000)
\ No newline at end of file
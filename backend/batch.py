@@ -0,0 +1,195 @@
+# backend/batch.py
+# Batch scanning: many targets per request, scanned concurrently under a
+# global limit and a per-host limit, with results streamed as they finish.
+
+import collections
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from scanner.utils import validate_and_normalize_url, get_hostname_from_url
+from scanner.resolver import get_resolver
+
+logger = logging.getLogger(__name__)
+
+BATCH_RUNNING = 'running'
+BATCH_DONE = 'done'
+
+
+def prepare_batch_urls(raw_urls):
+    """
+    Normalizes and de-duplicates a list of URLs, keeping the original order.
+    Returns (urls, invalid, duplicates) where invalid lists the raw inputs
+    that failed validation and duplicates counts the repeats dropped.
+    """
+    urls = []
+    invalid = []
+    seen = set()
+    duplicates = 0
+    for raw in raw_urls:
+        raw = (raw or '').strip()
+        if not raw or raw.startswith('#'):
+            continue # Blank lines and comments in uploaded files
+        url = validate_and_normalize_url(raw)
+        if not url:
+            invalid.append(raw)
+        elif url in seen:
+            duplicates += 1
+        else:
+            seen.add(url)
+            urls.append(url)
+    return urls, invalid, duplicates
+
+
+class Batch:
+    """Progress and results of a single batch; shared by the runner and the API."""
+
+    def __init__(self, urls, options=None):
+        self.id = uuid.uuid4().hex
+        self.urls = urls
+        self.options = options or {} # Keyword arguments passed on to scan_func
+        self.status = BATCH_RUNNING
+        self.started_at = time.time()
+        self.finished_at = None
+        self.done = 0
+        self.failed = 0
+        self.results = [] # Appended in completion order
+        self.changed = threading.Condition()
+
+    def record(self, entry):
+        with self.changed:
+            self.results.append(entry)
+            if entry['status'] == 'done':
+                self.done += 1
+            else:
+                self.failed += 1
+            if len(self.results) == len(self.urls):
+                self.status = BATCH_DONE
+                self.finished_at = time.time()
+            self.changed.notify_all()
+
+    def progress(self):
+        with self.changed:
+            finished = self.done + self.failed
+            elapsed = (self.finished_at or time.time()) - self.started_at
+            return {
+                "batch_id": self.id,
+                "status": self.status,
+                "total": len(self.urls),
+                "done": self.done,
+                "failed": self.failed,
+                "pending": len(self.urls) - finished,
+                "elapsed_seconds": round(elapsed, 2),
+                "targets_per_minute": round(finished * 60 / elapsed, 2) if elapsed > 0 else 0.0
+            }
+
+    def iter_results(self, timeout=None):
+        """Yields results as they arrive until the batch is finished."""
+        index = 0
+        while True:
+            with self.changed:
+                while index >= len(self.results) and self.status != BATCH_DONE:
+                    if not self.changed.wait(timeout):
+                        return
+                pending = self.results[index:]
+                finished = self.status == BATCH_DONE
+            for entry in pending:
+                yield entry
+            index += len(pending)
+            if finished and index >= len(self.results):
+                return
+
+
+class BatchRunner:
+    """
+    Runs batches of scans. scan_func(target_url, **options) must return
+    (response_data, scan_id), like run_scan in app.py.
+
+    max_concurrency caps scans in flight across all batches; per_host_limit
+    caps scans in flight against the same host name. Finished batches are
+    forgotten after keep_finished_seconds.
+    """
+
+    def __init__(self, scan_func, max_concurrency=16, per_host_limit=2, keep_finished_seconds=3600):
+        self.scan_func = scan_func
+        self.keep_finished_seconds = keep_finished_seconds
+        self.max_concurrency = max_concurrency
+        self.per_host_limit = per_host_limit
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix='batch-scan')
+        self._batches = {}
+        self._lock = threading.Condition()
+        self._in_flight = 0
+        self._host_in_flight = collections.Counter()
+        self._pending = collections.deque() # (batch, url, host)
+        self._dispatcher = None
+
+    def submit(self, urls, options=None):
+        """Queues the given (normalized, unique) URLs and returns the Batch."""
+        batch = Batch(urls, options)
+        with self._lock:
+            self._prune()
+            self._batches[batch.id] = batch
+            for url in urls:
+                self._pending.append((batch, url, get_hostname_from_url(url) or url))
+            # Resolve every distinct host of the batch up front, concurrently; its scans then hit the DNS cache
+            get_resolver().prefetch({get_hostname_from_url(url) for url in urls})
+            if self._dispatcher is None:
+                self._dispatcher = threading.Thread(target=self._dispatch_loop, name='batch-dispatcher', daemon=True)
+                self._dispatcher.start()
+            self._lock.notify_all()
+        if not urls:
+            batch.status = BATCH_DONE
+            batch.finished_at = time.time()
+        return batch
+
+    def _prune(self):
+        cutoff = time.time() - self.keep_finished_seconds
+        for batch_id, batch in list(self._batches.items()):
+            if batch.finished_at and batch.finished_at < cutoff:
+                del self._batches[batch_id]
+
+    def get(self, batch_id):
+        return self._batches.get(batch_id)
+
+    def _next_runnable(self):
+        # First pending target whose host still has a free slot; keeps one
+        # busy host from blocking every other target behind it
+        for index, (_, _, host) in enumerate(self._pending):
+            if self._host_in_flight[host] < self.per_host_limit:
+                item = self._pending[index]
+                del self._pending[index]
+                return item
+        return None
+
+    def _dispatch_loop(self):
+        while True:
+            with self._lock:
+                item = None
+                while item is None:
+                    if self._in_flight < self.max_concurrency:
+                        item = self._next_runnable()
+                    if item is None:
+                        self._lock.wait()
+                batch, url, host = item
+                self._in_flight += 1
+                self._host_in_flight[host] += 1
+            self._executor.submit(self._run_one, batch, url, host)
+
+    def _run_one(self, batch, url, host):
+        started = time.time()
+        try:
+            response_data, scan_id = self.scan_func(url, **batch.options)
+            entry = {"url": url, "status": "done", "scan_id": scan_id, "response": response_data}
+        except Exception as e:
+            logger.exception("Batch scan of %s failed: %s", url, e)
+            entry = {"url": url, "status": "failed", "error": str(e)}
+        entry["duration_seconds"] = round(time.time() - started, 2)
+        with self._lock:
+            self._in_flight -= 1
+            self._host_in_flight[host] -= 1
+            if not self._host_in_flight[host]:
+                del self._host_in_flight[host]
+            self._lock.notify_all()
+        batch.record(entry)
@@ -0,0 +1,355 @@
+# backend/benchmark/run.py
+# Offline benchmark harness. Starts a local target simulator and drives the
+# scanner against it at fixed concurrency levels: full scans through the
+# /api/scan handler, each check_* function on its own, and batch scans.
+# Reports targets/sec, latency percentiles and peak RSS per scenario and
+# concurrency level as JSON, and can compare against a saved baseline.
+#
+# Run from backend/:
+#   python -m benchmark.run --concurrency 1,4,16 --targets 40 --output bench.json
+#   python -m benchmark.run --baseline bench.json  # exit status 1 on a regression (same settings only)
+
+import argparse
+import datetime
+import json
+import logging
+import math
+import os
+import platform
+import resource
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmark.simulator import start_simulator
+
+SCENARIOS = ('handle_scan', 'check_headers', 'check_ports', 'check_sqli', 'check_xss', 'check_crawl', 'batch')
+
+# Report settings that change the numbers; --baseline only fails on regressions when these all match
+COMPARABLE_SETTINGS = ('site', 'port_timeout', 'host_rate', 'parse_workers')
+
+# Fraction by which targets/sec may drop, or p95 latency may rise, before --baseline fails
+DEFAULT_MAX_REGRESSION = 0.2
+
+RSS_SAMPLE_INTERVAL = 0.05
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1, math.ceil(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def _current_rss_bytes():
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return None
+
+
+def _lifetime_peak_rss_bytes():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024 # Bytes on macOS, KiB elsewhere
+
+
+class RssSampler:
+    """
+    Peak resident memory while a scenario runs, sampled from /proc. Where
+    /proc is not available the process-lifetime peak is reported instead.
+    """
+
+    def __init__(self):
+        self.peak = _current_rss_bytes()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(RSS_SAMPLE_INTERVAL):
+            rss = _current_rss_bytes()
+            if rss is not None:
+                self.peak = max(self.peak or 0, rss)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+        rss = _current_rss_bytes()
+        if rss is None:
+            self.peak = _lifetime_peak_rss_bytes()
+        else:
+            self.peak = max(self.peak or 0, rss)
+        return False
+
+
+def _scenario_functions(simulator, app, port_timeout):
+    from scanner.context import ScanContext
+    from scanner.header_scanner import check_security_headers
+    from scanner.port_scanner import check_common_ports
+    from scanner.sqli_scanner import check_sqli_potential
+    from scanner.xss_scanner import check_xss_potential
+    from scanner.crawler import check_crawl
+
+    client = app.app.test_client()
+
+    def handle_scan(url):
+        response = client.post('/api/scan', json={'url': url, 'wait': True, 'force': True})
+        if response.status_code != 200:
+            raise RuntimeError(f"/api/scan returned {response.status_code}")
+
+    def http_check(check):
+        def run(url):
+            check(url, context=ScanContext(url)) # Fresh context: the baseline fetch is part of the cost
+        return run
+
+    def check_ports(url):
+        check_common_ports(url, ports_to_check=simulator.ports, timeout=port_timeout)
+
+    return {
+        'handle_scan': handle_scan,
+        'check_headers': http_check(check_security_headers),
+        'check_ports': check_ports,
+        'check_sqli': http_check(check_sqli_potential),
+        'check_xss': http_check(check_xss_potential),
+        'check_crawl': http_check(check_crawl),
+    }
+
+
+def _run_calls(func, urls, concurrency):
+    """Calls func(url) for every URL with `concurrency` in flight. Returns (latencies, errors)."""
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+
+    def timed(url):
+        started = time.perf_counter()
+        try:
+            func(url)
+        except Exception as e:
+            with lock:
+                errors.append(f"{type(e).__name__}: {e}")
+            return
+        elapsed = time.perf_counter() - started
+        with lock:
+            latencies.append(elapsed)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(timed, urls))
+    return latencies, errors
+
+
+def _run_batch(app, urls, concurrency):
+    from batch import BatchRunner
+
+    latencies = []
+    lock = threading.Lock()
+
+    def timed_scan(url, **options):
+        started = time.perf_counter()
+        outcome = app.run_scan(url, **options)
+        with lock:
+            latencies.append(time.perf_counter() - started)
+        return outcome
+
+    # Every simulated target is on one host, so the per-host limit must not be the bottleneck
+    runner = BatchRunner(timed_scan, max_concurrency=concurrency, per_host_limit=concurrency)
+    batch = runner.submit(urls, {'force': True})
+    errors = [entry.get('error') for entry in batch.iter_results() if entry['status'] != 'done']
+    return latencies, errors
+
+
+def run_scenario(name, functions, app, urls, concurrency):
+    """One measured run. Returns the result dict for the report."""
+    with RssSampler() as rss:
+        started = time.perf_counter()
+        if name == 'batch':
+            latencies, errors = _run_batch(app, urls, concurrency)
+        else:
+            latencies, errors = _run_calls(functions[name], urls, concurrency)
+        seconds = time.perf_counter() - started
+    latencies.sort()
+    return {
+        'scenario': name,
+        'concurrency': concurrency,
+        'targets': len(urls),
+        'errors': len(errors),
+        'error_samples': errors[:3],
+        'seconds': round(seconds, 3),
+        'targets_per_sec': round(len(latencies) / seconds, 3) if seconds > 0 else None,
+        'latency_ms': {
+            'p50': _ms(percentile(latencies, 0.50)),
+            'p95': _ms(percentile(latencies, 0.95)),
+            'p99': _ms(percentile(latencies, 0.99)),
+            'max': _ms(latencies[-1] if latencies else None),
+            'mean': _ms(sum(latencies) / len(latencies) if latencies else None),
+        },
+        'peak_rss_mb': round(rss.peak / (1024 * 1024), 1) if rss.peak else None,
+    }
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 2) if seconds is not None else None
+
+
+def compare(results, baseline, max_regression=DEFAULT_MAX_REGRESSION):
+    """
+    Regressions of `results` against a baseline report: scenarios whose
+    targets/sec fell, or whose p95 latency rose, by more than max_regression.
+    """
+    previous = {(r['scenario'], r['concurrency']): r for r in baseline.get('results', [])}
+    regressions = []
+    for result in results:
+        before = previous.get((result['scenario'], result['concurrency']))
+        if before is None:
+            continue
+        checks = [
+            ('targets_per_sec', before.get('targets_per_sec'), result.get('targets_per_sec'), -1),
+            ('p95_ms', (before.get('latency_ms') or {}).get('p95'), result['latency_ms'].get('p95'), 1),
+        ]
+        for metric, old, new, direction in checks:
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            if change * direction > max_regression:
+                regressions.append({'scenario': result['scenario'], 'concurrency': result['concurrency'],
+                                    'metric': metric, 'baseline': old, 'current': new,
+                                    'change': round(change, 3)})
+    return regressions
+
+
+def _parse_args(argv):
+    parser = argparse.ArgumentParser(description="Offline scanner benchmark against a local target simulator.")
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS),
+                        help=f"comma-separated subset of: {', '.join(SCENARIOS)}")
+    parser.add_argument('--concurrency', default='1,4,16', help="comma-separated concurrency levels")
+    parser.add_argument('--targets', type=int, default=40, help="targets per scenario and concurrency level")
+    parser.add_argument('--warmup', type=int, default=2, help="unmeasured targets before each scenario")
+    parser.add_argument('--latency-ms', type=float, default=0, help="simulated server latency per response")
+    parser.add_argument('--page-kb', type=int, default=16, help="simulated page size")
+    parser.add_argument('--forms', type=int, default=2, help="forms per simulated page")
+    parser.add_argument('--inputs', type=int, default=3, help="text inputs per form")
+    parser.add_argument('--links', type=int, default=20, help="links per simulated page")
+    parser.add_argument('--no-reflect', action='store_true', help="do not reflect parameters (no XSS findings)")
+    parser.add_argument('--sql-errors', action='store_true', help="answer quotes with a SQL error (SQLi findings)")
+    parser.add_argument('--port-timeout', type=float, default=0.5, help="connect timeout for the port check")
+    parser.add_argument('--host-rate', type=float, default=0,
+                        help="per-host scheduler limit in requests/sec (0 = unlimited; every target is one host)")
+    parser.add_argument('--parse-workers', type=int,
+                        help="parse worker processes (0 = parse inline; default: PARSE_WORKERS or the CPU count)")
+    parser.add_argument('--output', help="write the JSON report here instead of stdout")
+    parser.add_argument('--baseline', help="earlier JSON report to compare against")
+    parser.add_argument('--max-regression', type=float, default=DEFAULT_MAX_REGRESSION,
+                        help="allowed fractional drop in targets/sec or rise in p95 latency")
+    parser.add_argument('--verbose', action='store_true', help="keep the scanner's INFO-level logging")
+    args = parser.parse_args(argv)
+    args.scenarios = [name.strip() for name in args.scenarios.split(',') if name.strip()]
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    try:
+        args.concurrency = [int(level) for level in args.concurrency.split(',') if level.strip()]
+    except ValueError:
+        parser.error("--concurrency must be comma-separated integers")
+    return args
+
+
+def main(argv=None):
+    args = _parse_args(argv)
+    site_config = {
+        'latency_ms': args.latency_ms,
+        'page_bytes': args.page_kb * 1024,
+        'forms': args.forms,
+        'inputs_per_form': args.inputs,
+        'links': args.links,
+        'reflect': not args.no_reflect,
+        'sql_errors': args.sql_errors,
+    }
+    report = {
+        'benchmark': 'scanner',
+        'format_version': 1,
+        'started_at': datetime.datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ'),
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+        },
+        'settings': {
+            'scenarios': args.scenarios,
+            'concurrency': args.concurrency,
+            'targets': args.targets,
+            'warmup': args.warmup,
+            'site': site_config,
+            'port_timeout': args.port_timeout,
+            'host_rate': args.host_rate,
+            'parse_workers': args.parse_workers,
+        },
+        'results': [],
+    }
+
+    with tempfile.TemporaryDirectory(prefix='scanner-bench-') as workdir, start_simulator(site_config) as simulator:
+        report['settings']['ports'] = {'open': simulator.open_ports, 'closed': simulator.closed_ports,
+                                       'filtered': simulator.filtered_ports}
+        import app
+        from scanner.scheduler import configure_scheduler
+        # Every simulated target is one host, so the politeness limits would otherwise set the pace
+        configure_scheduler(host_http_rate=args.host_rate, host_connect_rate=args.host_rate,
+                            global_http_rate=0, global_connect_rate=0)
+        if args.parse_workers is not None:
+            from scanner.parse_pool import configure_parse_pool
+            configure_parse_pool(workers=args.parse_workers)
+        # Per-scan log lines are part of the cost being measured only when asked for
+        logging.getLogger().setLevel(logging.INFO if args.verbose else logging.WARNING)
+        app.DATABASE = os.path.join(workdir, 'bench.db')
+        app.init_db()
+        functions = _scenario_functions(simulator, app, args.port_timeout)
+        index = 0
+        for name in args.scenarios:
+            for concurrency in args.concurrency:
+                if args.warmup:
+                    warmup_urls = [simulator.target(index + i) for i in range(args.warmup)]
+                    index += args.warmup
+                    if name == 'batch':
+                        _run_batch(app, warmup_urls, concurrency)
+                    else:
+                        _run_calls(functions[name], warmup_urls, concurrency)
+                # Distinct URLs per run, so nothing is served from an earlier run's caches
+                urls = [simulator.target(index + i) for i in range(args.targets)]
+                index += args.targets
+                result = run_scenario(name, functions, app, urls, concurrency)
+                report['results'].append(result)
+                print(f"{name} x{concurrency}: {result['targets_per_sec']} targets/s, "
+                      f"p95 {result['latency_ms']['p95']} ms", file=sys.stderr)
+
+    status = 0
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+        baseline_settings = baseline.get('settings', {})
+        mismatched = [key for key in COMPARABLE_SETTINGS if baseline_settings.get(key) != report['settings'][key]]
+        report['baseline_settings_match'] = not mismatched
+        report['regressions'] = compare(report['results'], baseline, args.max_regression)
+        if mismatched:
+            # Numbers from a differently configured run are not comparable, so they are reported but never fail
+            print(f"Baseline was run with different settings ({', '.join(mismatched)}); "
+                  f"not failing on {len(report['regressions'])} regression(s)", file=sys.stderr)
+        else:
+            status = 1 if report['regressions'] else 0
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as output:
+            output.write(text + '\n')
+    else:
+        print(text)
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
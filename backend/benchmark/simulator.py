@@ -0,0 +1,213 @@
+# backend/benchmark/simulator.py
+# Local stand-in targets for the benchmark harness: an HTTP site with
+# configurable latency, page size, forms, links, reflected parameters and
+# response headers, plus open, closed and filtered TCP ports on 127.0.0.1.
+# Pages are generated deterministically, so runs are comparable. The
+# simulator runs in a child process (see start_simulator) so its CPU and
+# memory do not count towards the scanner's.
+
+import html
+import http.server
+import multiprocessing
+import socket
+import threading
+import time
+from urllib.parse import urlparse, parse_qs
+
+# Defaults for one simulated site; any key can be overridden per run
+SITE_DEFAULTS = {
+    'latency_ms': 0, # Added before every response
+    'page_bytes': 16 * 1024, # Approximate body size of every page
+    'forms': 2,
+    'inputs_per_form': 3,
+    'links': 20,
+    'reflect': True, # Echo parameter values back unescaped (XSS findings)
+    'sql_errors': False, # Answer a quote in any parameter with a MySQL error (SQLi findings)
+    'headers': {'X-Frame-Options': 'DENY', 'X-Content-Type-Options': 'nosniff'},
+}
+
+# Port layout: listening, refused and dropped (SYNs never answered)
+PORT_DEFAULTS = {
+    'open': 3,
+    'closed': 3,
+    'filtered': 2,
+}
+
+# Greetings sent by the extra open ports, in turn, for the service fingerprinting stage
+SERVICE_BANNERS = [
+    b'SSH-2.0-OpenSSH_8.9p1 Ubuntu-3ubuntu0.6\r\n',
+    b'220 mail.example.test ESMTP Postfix (Ubuntu)\r\n',
+    b'+OK Dovecot ready.\r\n',
+]
+
+FILLER = '<p>Lorem ipsum dolor sit amet, consectetur adipiscing elit, sed do eiusmod tempor.</p>\n'
+
+
+def render_page(config, path, params):
+    """The body for one request: links, forms, reflected values and filler up to page_bytes."""
+    parts = [f'<html><head><title>{html.escape(path)}</title></head><body>\n']
+    for i in range(config['links']):
+        parts.append(f'<a href="/page/{i}?id={i}">page {i}</a>\n')
+    for f in range(config['forms']):
+        method = 'post' if f % 2 else 'get'
+        parts.append(f'<form action="/form/{f}" method="{method}">\n')
+        for i in range(config['inputs_per_form']):
+            parts.append(f'<input type="text" name="field{i}" value="v{i}">\n')
+        parts.append('<input type="submit" value="Send"></form>\n')
+    values = [value for values in params.values() for value in values]
+    if config['reflect']:
+        parts.extend(f'<div class="echo">{value}</div>\n' for value in values)
+    if config['sql_errors'] and any("'" in value for value in values):
+        parts.append('<b>You have an error in your SQL syntax; check the manual near \'\'\' at line 1</b>\n')
+    size = sum(len(part) for part in parts)
+    if size < config['page_bytes']:
+        parts.append(FILLER * ((config['page_bytes'] - size) // len(FILLER)))
+    parts.append('</body></html>\n')
+    return ''.join(parts).encode()
+
+
+def _handler_class(config):
+    class SiteHandler(http.server.BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def setup(self):
+            super().setup()
+            # Headers and body are separate writes; without this, delayed ACKs add ~40 ms per response
+            self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        def log_message(self, *args):
+            pass
+
+        def _respond(self, params):
+            if config['latency_ms']:
+                time.sleep(config['latency_ms'] / 1000)
+            body = render_page(config, urlparse(self.path).path, params)
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+            for name, value in config['headers'].items():
+                self.send_header(name, value)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            self._respond(parse_qs(urlparse(self.path).query, keep_blank_values=True))
+
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            form = self.rfile.read(length).decode('utf-8', errors='replace')
+            params = parse_qs(urlparse(self.path).query, keep_blank_values=True)
+            for name, values in parse_qs(form, keep_blank_values=True).items():
+                params.setdefault(name, []).extend(values)
+            self._respond(params)
+
+    return SiteHandler
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1] # Nothing listens here once closed, so connects are refused
+
+
+def _open_ports(count, sockets):
+    ports = []
+    for _ in range(count):
+        sock = socket.socket()
+        sock.bind(('127.0.0.1', 0))
+        sock.listen(64)
+        sockets.append(sock)
+        ports.append(sock.getsockname()[1])
+
+    def accept_loop(sock, banner):
+        while True:
+            try:
+                conn, _ = sock.accept()
+            except OSError:
+                return
+            with conn:
+                try:
+                    conn.sendall(banner)
+                except OSError:
+                    pass # The scanner hung up first
+
+    for i, sock in enumerate(sockets):
+        banner = SERVICE_BANNERS[i % len(SERVICE_BANNERS)]
+        threading.Thread(target=accept_loop, args=(sock, banner), daemon=True).start()
+    return ports
+
+
+def _filtered_ports(count, sockets):
+    # A listener whose accept queue is full and never drained: Linux drops
+    # further SYNs, so connects time out exactly like a firewalled port
+    ports = []
+    for _ in range(count):
+        sock = socket.socket()
+        sock.bind(('127.0.0.1', 0))
+        sock.listen(0)
+        port = sock.getsockname()[1]
+        sockets.append(sock)
+        for _ in range(2):
+            filler = socket.socket()
+            filler.setblocking(False)
+            filler.connect_ex(('127.0.0.1', port))
+            sockets.append(filler)
+        ports.append(port)
+    return ports
+
+
+def serve(site_config, port_config, ready):
+    """Child-process entry point: starts the site and ports, reports them on `ready`, then serves forever."""
+    config = dict(SITE_DEFAULTS, **(site_config or {}))
+    port_config = dict(PORT_DEFAULTS, **(port_config or {}))
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), _handler_class(config))
+    server.daemon_threads = True
+    sockets = []
+    ready.put({
+        'url': f'http://127.0.0.1:{server.server_address[1]}',
+        'open_ports': [server.server_address[1]] + _open_ports(port_config['open'], sockets),
+        'closed_ports': [_free_port() for _ in range(port_config['closed'])],
+        'filtered_ports': _filtered_ports(port_config['filtered'], sockets),
+        'site': config,
+    })
+    server.serve_forever()
+
+
+class Simulator:
+    """Handle on a running simulator process. Use as a context manager, or call stop()."""
+
+    def __init__(self, site_config=None, port_config=None):
+        context = multiprocessing.get_context('spawn') # No copy of the scanner's state in the child
+        ready = context.Queue()
+        self.process = context.Process(target=serve, args=(site_config, port_config, ready), daemon=True)
+        self.process.start()
+        info = ready.get(timeout=30)
+        self.url = info['url']
+        self.open_ports = info['open_ports']
+        self.closed_ports = info['closed_ports']
+        self.filtered_ports = info['filtered_ports']
+        self.site = info['site']
+
+    @property
+    def ports(self):
+        return self.open_ports + self.closed_ports + self.filtered_ports
+
+    def target(self, index):
+        """The URL of the index-th distinct target: its own path, with a reflected query parameter."""
+        return f'{self.url}/target/{index}?q=item{index}'
+
+    def stop(self):
+        self.process.terminate()
+        self.process.join(timeout=5)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+        return False
+
+
+def start_simulator(site_config=None, port_config=None):
+    """Starts a simulator in a child process and returns its Simulator handle."""
+    return Simulator(site_config, port_config)
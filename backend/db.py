@@ -0,0 +1,315 @@
+# backend/db.py
+# SQLite persistence layer: one pooled connection per thread in WAL mode,
+# versioned schema migrations, and a group-commit writer that batches the
+# inserts of many finished scans into single transactions.
+
+import logging
+import queue
+import sqlite3
+import threading
+import time
+import concurrent.futures
+from concurrent.futures import Future
+
+from history import host_from_url
+from findings import create_findings_tables, backfill_findings
+
+logger = logging.getLogger(__name__)
+
+# Applied to every connection when it is opened
+PRAGMAS = [
+    "PRAGMA journal_mode = WAL", # Readers no longer block the writer (and vice versa)
+    "PRAGMA synchronous = NORMAL", # Safe with WAL; fsync at checkpoints instead of every commit
+    "PRAGMA busy_timeout = 5000",
+    "PRAGMA foreign_keys = ON",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -16000", # ~16 MB page cache per connection
+    "PRAGMA mmap_size = 268435456",
+]
+
+# Group commit: how many queued inserts go into one transaction, and how long
+# the writer waits for more to arrive once it has at least one
+WRITE_BATCH_SIZE = 200
+WRITE_BATCH_WAIT = 0.01
+# Longest submit() waits for its write to be committed
+WRITE_TIMEOUT = 60
+
+_database = None
+_local = threading.local()
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def configure(database):
+    """Points the pool at a database file; connections opened earlier are replaced on next use."""
+    global _database
+    _database = database
+
+
+def get_connection():
+    """
+    This thread's connection to the configured database, opened on first use.
+    Connections are in autocommit mode; use transaction() to group writes.
+    """
+    conn = getattr(_local, 'conn', None)
+    if conn is not None and _local.database == _database:
+        return conn
+    if conn is not None:
+        conn.close()
+    conn = sqlite3.connect(_database, timeout=30, isolation_level=None, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    _local.conn = conn
+    _local.database = _database
+    return conn
+
+
+class transaction:
+    """Context manager: BEGIN (IMMEDIATE by default) ... COMMIT, or ROLLBACK on error."""
+
+    def __init__(self, conn=None, mode='IMMEDIATE'):
+        self.conn = conn or get_connection()
+        self.mode = mode
+
+    def __enter__(self):
+        self.conn.execute(f"BEGIN {self.mode}")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.conn.execute("COMMIT")
+        elif self.conn.in_transaction:
+            self.conn.execute("ROLLBACK")
+        return False
+
+
+# --- Migrations ---
+# Each migration runs once, in order, and bumps PRAGMA user_version. They are
+# written to be harmless on databases created before versioning existed.
+
+def _migration_1_scan_results(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS scan_results (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            target_url TEXT NOT NULL,
+            scan_timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            is_link_valid BOOLEAN,
+            vulnerabilities_test_ran BOOLEAN,
+            sqli_potential BOOLEAN,
+            xss_potential BOOLEAN,
+            open_ports TEXT,
+            header_x_frame BOOLEAN,
+            header_hsts BOOLEAN,
+            header_policy BOOLEAN,
+            header_xxss BOOLEAN,
+            header_nonsnif BOOLEAN,
+            scan_errors TEXT,
+            details TEXT
+        )
+    ''')
+
+
+def _migration_2_history_indexes(cursor):
+    """Adds the target_host column (backfilling old rows) and the indexes the history queries rely on."""
+    columns = {row[1] for row in cursor.execute("PRAGMA table_info(scan_results)")}
+    if 'target_host' not in columns:
+        cursor.execute("ALTER TABLE scan_results ADD COLUMN target_host TEXT")
+        rows = cursor.execute("SELECT id, target_url FROM scan_results").fetchall()
+        cursor.executemany("UPDATE scan_results SET target_host = ? WHERE id = ?",
+                           [(host_from_url(url), scan_id) for scan_id, url in rows])
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_scan_results_time ON scan_results (scan_timestamp, id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_scan_results_target ON scan_results (target_url, scan_timestamp, id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_scan_results_host ON scan_results (target_host, scan_timestamp, id)")
+    # Partial indexes keep "only scans with findings" pages cheap however rare they are
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_scan_results_sqli ON scan_results (scan_timestamp, id) WHERE sqli_potential = 1")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_scan_results_xss ON scan_results (scan_timestamp, id) WHERE xss_potential = 1")
+
+
+def _migration_3_scan_jobs(cursor):
+    """Background scan jobs (see jobs.py)."""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS scan_jobs (
+            id TEXT PRIMARY KEY,
+            target_url TEXT NOT NULL,
+            status TEXT NOT NULL,
+            created_at TIMESTAMP NOT NULL,
+            started_at TIMESTAMP,
+            finished_at TIMESTAMP,
+            scan_id INTEGER,
+            partial_results TEXT,
+            result TEXT,
+            error TEXT
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_scan_jobs_status ON scan_jobs (status, created_at)')
+
+
+def _migration_4_normalized_findings(cursor):
+    """Child tables for ports, forms/inputs and findings (see findings.py), filled from existing rows."""
+    create_findings_tables(cursor)
+    backfill_findings(cursor)
+
+
+def _migration_5_job_options(cursor):
+    """Per-job scan options (check set, force) for queued scans."""
+    columns = {row[1] for row in cursor.execute("PRAGMA table_info(scan_jobs)")}
+    if 'options' not in columns:
+        cursor.execute("ALTER TABLE scan_jobs ADD COLUMN options TEXT")
+
+
+def _migration_6_page_state(cursor):
+    """Baseline page validators and hashes, plus when ports/probes last really ran (see incremental.py)."""
+    columns = {row[1] for row in cursor.execute("PRAGMA table_info(scan_results)")}
+    for column, column_type in [('etag', 'TEXT'), ('last_modified', 'TEXT'), ('content_hash', 'TEXT'),
+                                ('param_signature', 'TEXT'), ('ports_scanned_at', 'TIMESTAMP'),
+                                ('probed_at', 'TIMESTAMP')]:
+        if column not in columns:
+            cursor.execute(f"ALTER TABLE scan_results ADD COLUMN {column} {column_type}")
+
+
+def _migration_7_timings(cursor):
+    """Per-scan timing spans as JSON (see scanner/timing.py)."""
+    columns = {row[1] for row in cursor.execute("PRAGMA table_info(scan_results)")}
+    if 'timings' not in columns:
+        cursor.execute("ALTER TABLE scan_results ADD COLUMN timings TEXT")
+
+
+def _migration_8_services(cursor):
+    """Services fingerprinted on open ports (see scanner/banner_scanner.py), as JSON and per port."""
+    columns = {row[1] for row in cursor.execute("PRAGMA table_info(scan_results)")}
+    if 'services' not in columns:
+        cursor.execute("ALTER TABLE scan_results ADD COLUMN services TEXT")
+    columns = {row[1] for row in cursor.execute("PRAGMA table_info(scan_ports)")}
+    for column in ('service', 'product', 'version', 'banner'):
+        if column not in columns:
+            cursor.execute(f"ALTER TABLE scan_ports ADD COLUMN {column} TEXT")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_scan_ports_service ON scan_ports (service, host)")
+
+
+def _migration_9_check_times(cursor):
+    """When each check's result in a row was actually produced, as JSON (see result_cache.py)."""
+    columns = {row[1] for row in cursor.execute("PRAGMA table_info(scan_results)")}
+    if 'checked_at' not in columns:
+        cursor.execute("ALTER TABLE scan_results ADD COLUMN checked_at TEXT")
+
+
+def _migration_10_job_leases(cursor):
+    """Which queue runs a job and until when its lease holds (see jobs.py)."""
+    columns = {row[1] for row in cursor.execute("PRAGMA table_info(scan_jobs)")}
+    for column, column_type in [('owner', 'TEXT'), ('lease_expires_at', 'TIMESTAMP')]:
+        if column not in columns:
+            cursor.execute(f"ALTER TABLE scan_jobs ADD COLUMN {column} {column_type}")
+
+
+MIGRATIONS = [
+    _migration_1_scan_results,
+    _migration_2_history_indexes,
+    _migration_3_scan_jobs,
+    _migration_4_normalized_findings,
+    _migration_5_job_options,
+    _migration_6_page_state,
+    _migration_7_timings,
+    _migration_8_services,
+    _migration_9_check_times,
+    _migration_10_job_leases,
+]
+
+
+def migrate():
+    """Brings the configured database up to the latest schema version."""
+    conn = get_connection()
+    with transaction(conn, mode='EXCLUSIVE'):
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        cursor = conn.cursor()
+        for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+            logger.info("Applying database migration %d (%s)...", number, migration.__name__)
+            migration(cursor)
+            cursor.execute(f"PRAGMA user_version = {number}")
+    return len(MIGRATIONS)
+
+
+# --- Group-commit writer ---
+
+class GroupCommitWriter:
+    """
+    Single background thread that owns all scan inserts. Callers queue a
+    write function, called as func(conn), and get a Future for its return
+    value. Everything queued within WRITE_BATCH_WAIT is committed in one
+    transaction, so concurrent scans share one commit instead of each
+    taking the write lock.
+    """
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, func):
+        future = Future()
+        self._queue.put((func, future))
+        return future
+
+    def _next_batch(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + WRITE_BATCH_WAIT
+        try:
+            while len(batch) < WRITE_BATCH_SIZE:
+                batch.append(self._queue.get(timeout=max(0, deadline - time.monotonic())))
+        except queue.Empty:
+            pass
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            try:
+                with transaction() as conn:
+                    outcomes = [func(conn) for func, _ in batch]
+            except Exception as e: # Not just sqlite3.Error: a bad write must not kill this thread
+                logger.error("Error in group commit of %d write(s): %s", len(batch), e)
+                self._write_individually(batch)
+                continue
+            # Only now, after COMMIT, are the writes durable
+            for (_, future), outcome in zip(batch, outcomes):
+                future.set_result(outcome)
+
+    def _write_individually(self, batch):
+        # One bad write must not fail every scan that shared its batch
+        for func, future in batch:
+            try:
+                with transaction() as conn:
+                    outcome = func(conn)
+            except Exception as e:
+                future.set_exception(e)
+            else:
+                future.set_result(outcome)
+
+
+def get_writer():
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = GroupCommitWriter()
+    return _writer
+
+
+def submit(func, wait=True, timeout=WRITE_TIMEOUT):
+    """
+    Queues func(conn) on the group-commit writer; it runs inside the shared
+    transaction. Returns func's result once committed if wait is set (raising
+    sqlite3.OperationalError after `timeout` seconds), else a Future.
+    """
+    future = get_writer().submit(func)
+    if not wait:
+        return future
+    try:
+        return future.result(timeout)
+    except concurrent.futures.TimeoutError:
+        raise sqlite3.OperationalError(f"Database write not committed within {timeout}s") from None
+
+
+def write(sql, params, wait=True):
+    """Queues a single INSERT/UPDATE on the group-commit writer. Returns the row id if wait is set."""
+    return submit(lambda conn: conn.execute(sql, params).lastrowid, wait=wait)
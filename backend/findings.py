@@ -0,0 +1,227 @@
+# backend/findings.py
+# Normalized scan storage. Alongside the scan_results row (whose JSON columns
+# are kept for the existing API), every scan writes its open ports, forms,
+# form inputs and findings to indexed child tables so estate-wide questions
+# ("which hosts have port 23 open?") are answered in SQL.
+
+import json
+
+from history import host_from_url
+
+FINDING_SQLI = 'sqli'
+FINDING_XSS = 'xss'
+FINDING_MISSING_HEADER = 'missing_header'
+FINDING_SCAN_ERROR = 'scan_error'
+FINDING_TLS = 'tls'
+
+# Result key -> header name recorded for missing_header findings
+HEADER_RESULT_KEYS = {
+    "Header of x-frame": 'x-frame-options',
+    "Header of hsts": 'strict-transport-security',
+    "Header of policy": 'content-security-policy',
+    "Header of xxss": 'x-xss-protection',
+    "Header of nonsnif": 'x-content-type-options',
+}
+
+FINDING_COLUMNS = ['scan_id', 'host', 'finding_type', 'parameter', 'location', 'method',
+                   'url', 'detail', 'payload', 'evidence']
+
+
+def create_findings_tables(cursor):
+    """Schema for the child tables; run as a migration from db.py."""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS scan_ports (
+            scan_id INTEGER NOT NULL REFERENCES scan_results (id) ON DELETE CASCADE,
+            host TEXT,
+            ip_address TEXT,
+            port INTEGER NOT NULL,
+            latency_ms REAL,
+            service TEXT,
+            product TEXT,
+            version TEXT,
+            banner TEXT
+        )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_scan_ports_port ON scan_ports (port, host)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_scan_ports_host ON scan_ports (host, port)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_scan_ports_scan ON scan_ports (scan_id)")
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS scan_forms (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            scan_id INTEGER NOT NULL REFERENCES scan_results (id) ON DELETE CASCADE,
+            host TEXT,
+            action TEXT,
+            method TEXT
+        )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_scan_forms_scan ON scan_forms (scan_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_scan_forms_host ON scan_forms (host)")
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS scan_form_inputs (
+            form_id INTEGER NOT NULL REFERENCES scan_forms (id) ON DELETE CASCADE,
+            name TEXT,
+            type TEXT
+        )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_scan_form_inputs_form ON scan_form_inputs (form_id)")
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS scan_findings (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            scan_id INTEGER NOT NULL REFERENCES scan_results (id) ON DELETE CASCADE,
+            host TEXT,
+            finding_type TEXT NOT NULL,
+            parameter TEXT,
+            location TEXT,
+            method TEXT,
+            url TEXT,
+            detail TEXT,
+            payload TEXT,
+            evidence TEXT
+        )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_scan_findings_type ON scan_findings (finding_type, host)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_scan_findings_host ON scan_findings (host, finding_type)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_scan_findings_scan ON scan_findings (scan_id)")
+
+
+def _finding_rows(scan_id, host, results, errors):
+    rows = []
+    for finding in results.get("sqli_findings") or []:
+        rows.append((scan_id, host, FINDING_SQLI, finding.get('parameter'), finding.get('location'),
+                     finding.get('method'), finding.get('url'), finding.get('technique'),
+                     finding.get('payload'), finding.get('evidence')))
+    xss_details = results.get("xss_details")
+    if isinstance(xss_details, list):
+        for finding in xss_details:
+            rows.append((scan_id, host, FINDING_XSS, finding.get('parameter'), finding.get('location'),
+                         finding.get('method'), finding.get('url'), finding.get('context'),
+                         finding.get('payload'), None))
+    elif xss_details and results.get("XSS Test"):
+        # Rows saved before XSS findings were structured only kept a message
+        rows.append((scan_id, host, FINDING_XSS, None, None, None, None, None, None, str(xss_details)))
+    # Findings on pages discovered by the crawler; their url names the page
+    for finding in results.get("crawl_findings") or []:
+        finding_type = FINDING_SQLI if finding.get('check') == 'sqli' else FINDING_XSS
+        rows.append((scan_id, host, finding_type, finding.get('parameter'), finding.get('location'),
+                     finding.get('method'), finding.get('url'), finding.get('technique') or finding.get('context'),
+                     finding.get('payload'), finding.get('evidence')))
+    # TLS issues name the endpoint they were found on
+    tls_details = results.get("tls_details") or {}
+    endpoint = f"{tls_details.get('ip_address')}:{tls_details.get('port')}" if tls_details else None
+    for finding in results.get("tls_findings") or []:
+        rows.append((scan_id, host, FINDING_TLS, finding.get('issue'), 'tls', None, None, finding.get('detail'),
+                     None, endpoint))
+    for result_key, header in HEADER_RESULT_KEYS.items():
+        if results.get(result_key) is False:
+            rows.append((scan_id, host, FINDING_MISSING_HEADER, header, 'header', None, None, None, None, None))
+    for error_key, message in (errors or {}).items():
+        rows.append((scan_id, host, FINDING_SCAN_ERROR, error_key, None, None, None, None, None, str(message)))
+    return rows
+
+
+def insert_children(conn, scan_id, target_url, results, errors):
+    """Bulk-inserts the normalized rows for one scan (call inside a transaction)."""
+    host = host_from_url(target_url)
+    latencies = {p['port']: p.get('latency_ms') for p in results.get("port_details") or []}
+    services = {entry['port']: entry for entry in results.get("services") or []}
+    conn.executemany('''
+        INSERT INTO scan_ports (scan_id, host, ip_address, port, latency_ms, service, product, version, banner)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', [(scan_id, host, results.get("ip_address"), port, latencies.get(port),
+           *(services.get(port, {}).get(key) for key in ('service', 'product', 'version', 'banner')))
+          for port in results.get("Scan Ports") or []])
+    for form in results.get("sqli_details") or []:
+        form_id = conn.execute("INSERT INTO scan_forms (scan_id, host, action, method) VALUES (?, ?, ?, ?)",
+                               (scan_id, host, form.get('action'), form.get('method'))).lastrowid
+        conn.executemany("INSERT INTO scan_form_inputs (form_id, name, type) VALUES (?, ?, ?)",
+                         [(form_id, field.get('name'), field.get('type')) for field in form.get('inputs') or []])
+    conn.executemany(f"INSERT INTO scan_findings ({', '.join(FINDING_COLUMNS)}) VALUES ({', '.join('?' * len(FINDING_COLUMNS))})",
+                     _finding_rows(scan_id, host, results, errors))
+
+
+def backfill_findings(cursor):
+    """Fills the child tables from the JSON columns of rows saved before they existed."""
+    rows = cursor.execute('''
+        SELECT id, target_url, open_ports, details, scan_errors, xss_potential,
+               header_x_frame, header_hsts, header_policy, header_xxss, header_nonsnif
+        FROM scan_results
+    ''').fetchall()
+    for (scan_id, target_url, open_ports, details, scan_errors, xss_potential,
+         x_frame, hsts, policy, xxss, nonsnif) in rows:
+        try:
+            details = json.loads(details) if details else {}
+            results = {
+                "Scan Ports": json.loads(open_ports) if open_ports else [],
+                "sqli_details": details.get("sqli"),
+                "sqli_findings": details.get("sqli_findings"),
+                "xss_details": details.get("xss"),
+                "XSS Test": bool(xss_potential),
+            }
+            errors = json.loads(scan_errors) if scan_errors else None
+        except (ValueError, AttributeError):
+            continue # Unreadable legacy row; leave it out of the normalized tables
+        for result_key, value in zip(HEADER_RESULT_KEYS, (x_frame, hsts, policy, xxss, nonsnif)):
+            if value in (0, 1):
+                results[result_key] = bool(value)
+        insert_children(cursor, scan_id, target_url, results, errors if isinstance(errors, dict) else None)
+
+
+# --- Aggregate queries ---
+
+def hosts_with_open_port(conn, port):
+    """Every host seen with `port` open, with how often and when it was last seen."""
+    rows = conn.execute('''
+        SELECT p.host, MAX(p.ip_address) AS ip_address, COUNT(*) AS times_seen,
+               MAX(p.scan_id) AS last_scan_id, MAX(r.scan_timestamp) AS last_seen,
+               MAX(p.service) AS service, MAX(p.product) AS product, MAX(p.version) AS version
+        FROM scan_ports p JOIN scan_results r ON r.id = p.scan_id
+        WHERE p.port = ?
+        GROUP BY p.host
+        ORDER BY last_seen DESC
+    ''', (port,)).fetchall()
+    return [dict(row) for row in rows]
+
+
+def open_port_summary(conn, limit=50):
+    """Most common open ports across the estate, by number of distinct hosts."""
+    rows = conn.execute('''
+        SELECT port, COUNT(DISTINCT host) AS hosts
+        FROM scan_ports
+        GROUP BY port
+        ORDER BY hosts DESC, port
+        LIMIT ?
+    ''', (limit,)).fetchall()
+    return [dict(row) for row in rows]
+
+
+def finding_summary(conn):
+    """Per finding type: total findings, distinct hosts and scans affected."""
+    rows = conn.execute('''
+        SELECT finding_type, COUNT(*) AS findings, COUNT(DISTINCT host) AS hosts,
+               COUNT(DISTINCT scan_id) AS scans
+        FROM scan_findings
+        GROUP BY finding_type
+        ORDER BY finding_type
+    ''').fetchall()
+    return [dict(row) for row in rows]
+
+
+def list_findings(conn, finding_type=None, host=None, before_id=None, limit=100):
+    """Findings newest first, optionally filtered; page with before_id (the last id seen)."""
+    where = []
+    params = []
+    if finding_type:
+        where.append("finding_type = ?")
+        params.append(finding_type)
+    if host:
+        where.append("host = ?")
+        params.append(host.lower())
+    if before_id:
+        where.append("id < ?")
+        params.append(before_id)
+    sql = "SELECT id, " + ', '.join(FINDING_COLUMNS) + " FROM scan_findings"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY id DESC LIMIT ?"
+    params.append(limit)
+    return [dict(row) for row in conn.execute(sql, params).fetchall()]
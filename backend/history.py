@@ -0,0 +1,133 @@
+# backend/history.py
+# Scan history queries: keyset (cursor) pagination, filters and column
+# projection over the scan_results table. The indexes they rely on are
+# created by the migrations in db.py.
+
+import base64
+import datetime
+import json
+from urllib.parse import urlparse
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+HISTORY_COLUMNS = [
+    'id', 'target_url', 'target_host', 'scan_timestamp', 'is_link_valid',
+    'vulnerabilities_test_ran', 'sqli_potential', 'xss_potential', 'open_ports',
+    'header_x_frame', 'header_hsts', 'header_policy', 'header_xxss',
+    'header_nonsnif', 'scan_errors', 'details', 'timings', 'services',
+]
+
+# List views skip the large details, timings and services blobs unless they are asked for with ?fields=
+LIST_COLUMNS = [column for column in HISTORY_COLUMNS if column not in ('details', 'timings', 'services')]
+
+# ?finding= values and the WHERE clause each one adds
+FINDING_FILTERS = {
+    'sqli': "sqli_potential = 1",
+    'xss': "xss_potential = 1",
+    'open_ports': "open_ports IS NOT NULL AND open_ports != '[]'",
+    'missing_headers': ("(header_x_frame = 0 OR header_hsts = 0 OR header_policy = 0"
+                        " OR header_xxss = 0 OR header_nonsnif = 0)"),
+    'errors': "scan_errors IS NOT NULL",
+}
+
+
+class HistoryQueryError(ValueError):
+    """Raised for bad query-string parameters; the message is safe to return to the client."""
+
+
+def host_from_url(url):
+    try:
+        return (urlparse(url).hostname or '').lower() or None
+    except ValueError:
+        return None
+
+
+def encode_cursor(row):
+    raw = json.dumps([row['scan_timestamp'], row['id']]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor_token):
+    try:
+        padded = cursor_token + '=' * (-len(cursor_token) % 4)
+        timestamp, scan_id = json.loads(base64.urlsafe_b64decode(padded))
+        return str(timestamp), int(scan_id)
+    except (ValueError, TypeError):
+        raise HistoryQueryError("Invalid cursor")
+
+
+def _parse_time(value, name):
+    """Naive times are taken as UTC, like the stored timestamps; others are converted to UTC."""
+    value = value.strip()
+    if value.endswith(('Z', 'z')):
+        value = value[:-1] + '+00:00'
+    try:
+        parsed = datetime.datetime.fromisoformat(value)
+    except ValueError:
+        raise HistoryQueryError(f"Invalid '{name}' date; use ISO format such as 2024-01-31 or 2024-01-31T12:00:00")
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(datetime.timezone.utc)
+    # Same text format as CURRENT_TIMESTAMP so the comparison can use the index
+    return parsed.strftime('%Y-%m-%d %H:%M:%S')
+
+
+def build_history_query(args):
+    """
+    Turns request args into (sql, params, limit). Supported args: limit,
+    cursor, target, host, since, until, finding (comma-separated keys of
+    FINDING_FILTERS) and fields (comma-separated column names).
+    """
+    try:
+        limit = int(args.get('limit', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        raise HistoryQueryError("'limit' must be an integer")
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+
+    columns = LIST_COLUMNS
+    if args.get('fields'):
+        columns = [field.strip() for field in args['fields'].split(',') if field.strip()]
+        unknown = set(columns) - set(HISTORY_COLUMNS)
+        if unknown:
+            raise HistoryQueryError(f"Unknown fields: {', '.join(sorted(unknown))}")
+    # id and scan_timestamp are always needed to build the next cursor
+    select_columns = list(dict.fromkeys(['id', 'scan_timestamp'] + columns))
+
+    where = []
+    params = []
+    if args.get('target'):
+        where.append("target_url = ?")
+        params.append(args['target'])
+    if args.get('host'):
+        where.append("target_host = ?")
+        params.append(args['host'].lower())
+    if args.get('since'):
+        where.append("scan_timestamp >= ?")
+        params.append(_parse_time(args['since'], 'since'))
+    if args.get('until'):
+        where.append("scan_timestamp < ?")
+        params.append(_parse_time(args['until'], 'until'))
+    for finding in filter(None, (f.strip() for f in args.get('finding', '').split(','))):
+        if finding not in FINDING_FILTERS:
+            raise HistoryQueryError(f"Unknown finding type '{finding}'; use one of: {', '.join(FINDING_FILTERS)}")
+        where.append(FINDING_FILTERS[finding])
+    if args.get('cursor'):
+        timestamp, scan_id = decode_cursor(args['cursor'])
+        where.append("(scan_timestamp, id) < (?, ?)")
+        params.extend([timestamp, scan_id])
+
+    sql = f"SELECT {', '.join(select_columns)} FROM scan_results"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY scan_timestamp DESC, id DESC LIMIT ?"
+    params.append(limit + 1) # One extra row tells us whether there is a next page
+    return sql, params, limit, columns
+
+
+def fetch_history_page(conn, args):
+    """Runs one history page query on a connection with sqlite3.Row rows. Returns {'scans': [...], 'next_cursor': str or None}."""
+    sql, params, limit, columns = build_history_query(args)
+    rows = conn.execute(sql, params).fetchall()
+    next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    scans = [{column: row[column] for column in columns} for row in rows[:limit]]
+    return {"scans": scans, "next_cursor": next_cursor}
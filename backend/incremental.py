@@ -0,0 +1,232 @@
+# backend/incremental.py
+# Incremental rescans for continuous monitoring. The previous scan_results
+# row of a target records the baseline page's ETag/Last-Modified, a hash of
+# its body and of its parameter set, and when ports and injection probes
+# last really ran. A rescan sends a conditional request and re-runs only
+# what may have changed; the result is reported as a diff against the
+# previous scan.
+
+import datetime
+import os
+
+from scanner.context import ScanContext, parameter_signature
+from scanner.pipeline import CHECKS, merge_check_result
+from result_cache import check_result_from_row, check_time
+from findings import HEADER_RESULT_KEYS
+
+# Ports are re-swept at most this often, and injection probes are repeated
+# at least this often even when the page looks unchanged (seconds)
+PORT_RESWEEP_INTERVAL = float(os.environ.get('INCREMENTAL_PORT_INTERVAL', 7 * 24 * 3600))
+PROBE_REFRESH_INTERVAL = float(os.environ.get('INCREMENTAL_PROBE_INTERVAL', 7 * 24 * 3600))
+
+# Baseline page states, from cheapest to detect to most expensive
+PAGE_NOT_MODIFIED = 'not_modified' # 304 to the conditional request
+PAGE_SAME_CONTENT = 'same_content' # 200 with an identical body hash
+PAGE_SAME_PARAMETERS = 'same_parameters' # Body changed but the same parameters and form fields (probes re-run)
+PAGE_CHANGED = 'changed'
+
+# Fields that identify "the same" finding across two scans
+SQLI_FINDING_KEY = ('parameter', 'location', 'method', 'url', 'technique')
+XSS_FINDING_KEY = ('parameter', 'location', 'method', 'url', 'context')
+
+
+def _utcnow():
+    return datetime.datetime.utcnow()
+
+
+def _timestamp(moment):
+    # Same text format as CURRENT_TIMESTAMP in scan_results
+    return moment.strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _age_seconds(timestamp):
+    if not timestamp:
+        return None
+    try:
+        return (_utcnow() - datetime.datetime.fromisoformat(str(timestamp))).total_seconds()
+    except ValueError:
+        return None
+
+
+def load_previous_scan(conn, target_url):
+    """The newest scan_results row for target_url, or None."""
+    return conn.execute('''
+        SELECT * FROM scan_results
+        WHERE target_url = ?
+        ORDER BY scan_timestamp DESC, id DESC
+        LIMIT 1
+    ''', (target_url,)).fetchone()
+
+
+def results_from_row(conn, row):
+    """The results dict of a saved scan, for the checks that ran successfully in it."""
+    results = {}
+    for name in CHECKS:
+        check_result = check_result_from_row(conn, row, name)
+        if check_result is not None:
+            merge_check_result(name, check_result, results, {})
+    return results
+
+
+class IncrementalPlan:
+    """
+    Decides which checks of one rescan can reuse the previous scan's result.
+
+    prepare() sends the conditional baseline request and fills `reused`
+    (check name -> reason). The plan is then passed to run_checks as its
+    cache: get() returns the previous result for reused checks and defers
+    to the wrapped cache (the regular result cache) for the rest.
+    """
+
+    def __init__(self, conn, target_url, previous, checks, cache=None):
+        self.target_url = target_url
+        self.previous = previous
+        self.checks = checks
+        self.cache = cache
+        self.context = None
+        self.page_state = None
+        self.reused = {}
+        self._previous_results = {name: check_result_from_row(conn, previous, name) for name in CHECKS}
+
+    def _reuse(self, name, reason):
+        if name in self.checks and self._previous_results.get(name) is not None:
+            self.reused[name] = reason
+
+    def prepare(self):
+        previous = self.previous
+
+        # Ports change rarely and are the most expensive check; sweep them on a slower schedule
+        ports_age = _age_seconds(previous['ports_scanned_at'] or previous['scan_timestamp'])
+        if ports_age is not None and ports_age < PORT_RESWEEP_INTERVAL:
+            self._reuse("ports", f"ports swept {ports_age / 3600:.1f}h ago")
+
+        http_checks = [name for name in self.checks if name != "ports"]
+        conditional = {}
+        if previous['etag']:
+            conditional['If-None-Match'] = previous['etag']
+        if previous['last_modified']:
+            conditional['If-Modified-Since'] = previous['last_modified']
+        self.context = ScanContext(self.target_url, request_headers=conditional or None)
+        if not http_checks or self.context.response is None:
+            return self
+
+        if self.context.not_modified:
+            self.page_state = PAGE_NOT_MODIFIED
+        elif previous['content_hash'] and self.context.content_hash == previous['content_hash']:
+            self.page_state = PAGE_SAME_CONTENT
+        elif (previous['param_signature'] and ("sqli" in self.checks or "xss" in self.checks)
+              and parameter_signature(self.target_url, self.context) == previous['param_signature']):
+            self.page_state = PAGE_SAME_PARAMETERS
+        else:
+            self.page_state = PAGE_CHANGED
+
+        if self.page_state == PAGE_NOT_MODIFIED:
+            self._reuse("headers", "page not modified")
+        probe_age = _age_seconds(previous['probed_at'] or previous['scan_timestamp'])
+        # Injection results hold only for the very same body: a changed body can reflect or
+        # query the same parameters differently, so same_parameters still re-probes
+        if (self.page_state in (PAGE_NOT_MODIFIED, PAGE_SAME_CONTENT)
+                and probe_age is not None and probe_age < PROBE_REFRESH_INTERVAL):
+            reason = self.page_state.replace('_', ' ')
+            self._reuse("sqli", f"page {reason}")
+            self._reuse("xss", f"page {reason}")
+
+        if self.context.not_modified and any(name not in self.reused for name in http_checks):
+            # A 304 has no body to test; checks that still have to run need the real page
+            self.context = ScanContext(self.target_url)
+        return self
+
+    def get(self, url, name):
+        if name in self.reused:
+            return self._previous_results[name]
+        return self.cache.get(url, name) if self.cache is not None else None
+
+    def checked_at(self, url, name):
+        if name in self.reused:
+            return check_time(self.previous, name)
+        return self.cache.checked_at(url, name) if self.cache is not None else None
+
+    def put(self, url, name, check_result):
+        if self.cache is not None:
+            self.cache.put(url, name, check_result)
+
+
+def page_state_columns(target_url, context, checks, ran, previous=None):
+    """
+    Values for the page-state columns of a new scan_results row. `ran` is
+    the set of checks that actually ran (not served from a cache or reused);
+    timestamps of the others are carried over from `previous`.
+    """
+    now = _timestamp(_utcnow())
+    columns = {
+        'etag': None, 'last_modified': None, 'content_hash': None, 'param_signature': None,
+        'ports_scanned_at': now if "ports" in ran else None,
+        'probed_at': now if {"sqli", "xss"} <= set(ran) else None,
+    }
+    if previous is not None:
+        if columns['ports_scanned_at'] is None and "ports" in checks:
+            columns['ports_scanned_at'] = previous['ports_scanned_at'] or previous['scan_timestamp']
+        if columns['probed_at'] is None and ("sqli" in checks or "xss" in checks):
+            columns['probed_at'] = previous['probed_at'] or previous['scan_timestamp']
+
+    if context is None or not context.fetched or context.response is None:
+        return columns
+    response = context.response
+    if response.status_code == 304 and previous is not None:
+        for column in ('etag', 'last_modified', 'content_hash', 'param_signature'):
+            columns[column] = previous[column]
+        columns['etag'] = response.headers.get('ETag') or columns['etag']
+        return columns
+
+    columns['etag'] = response.headers.get('ETag')
+    columns['last_modified'] = response.headers.get('Last-Modified')
+    columns['content_hash'] = context.content_hash
+    if previous is not None and columns['content_hash'] == previous['content_hash']:
+        columns['param_signature'] = previous['param_signature']
+    elif "sqli" in checks or "xss" in checks:
+        columns['param_signature'] = parameter_signature(target_url, context) # Forms are already parsed
+    return columns
+
+
+def _finding_diff(before, after, key_fields):
+    def key(finding):
+        return tuple(finding.get(field) for field in key_fields)
+    before_keys = {key(f) for f in before or []}
+    after_keys = {key(f) for f in after or []}
+    return {
+        "new": [f for f in after or [] if key(f) not in before_keys],
+        "resolved": [f for f in before or [] if key(f) not in after_keys],
+    }
+
+
+def _form_key(form):
+    return (form.get('action'), form.get('method'), tuple(sorted(str(i.get('name')) for i in form.get('inputs') or [])))
+
+
+def diff_scans(before, after, checks):
+    """
+    What changed between two results dicts, per check. Checks missing from
+    `before` (not run or failed then) are left out. 'changed' is True if
+    anything differs.
+    """
+    diff = {}
+    if "headers" in checks and any(key in before for key in HEADER_RESULT_KEYS):
+        diff["headers"] = {key: {"before": before.get(key), "after": after.get(key)}
+                           for key in HEADER_RESULT_KEYS if before.get(key) != after.get(key)}
+    if "ports" in checks and "Scan Ports" in before:
+        before_ports = set(before.get("Scan Ports") or [])
+        after_ports = set(after.get("Scan Ports") or [])
+        diff["ports"] = {"opened": sorted(after_ports - before_ports), "closed": sorted(before_ports - after_ports)}
+    if "sqli" in checks and "SQL Injection Test" in before:
+        diff["sqli"] = _finding_diff(before.get("sqli_findings"), after.get("sqli_findings"), SQLI_FINDING_KEY)
+        before_forms = {_form_key(f) for f in before.get("sqli_details") or []}
+        after_forms = {_form_key(f) for f in after.get("sqli_details") or []}
+        diff["forms"] = {
+            "added": [f for f in after.get("sqli_details") or [] if _form_key(f) not in before_forms],
+            "removed": [f for f in before.get("sqli_details") or [] if _form_key(f) not in after_forms],
+        }
+    if "xss" in checks and "XSS Test" in before:
+        diff["xss"] = _finding_diff(before.get("xss_details"), after.get("xss_details"), XSS_FINDING_KEY)
+    diff["changed"] = any(bool(part) if name == "headers" else any(part.values())
+                          for name, part in diff.items())
+    return diff
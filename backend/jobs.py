@@ -0,0 +1,170 @@
+# backend/jobs.py
+# Background scan jobs. Jobs live in the scan_jobs table of the main SQLite
+# database (schema in db.py), so anything still queued (or interrupted
+# mid-run) is picked up again when the backend restarts. Each queue holds a
+# lease on the jobs it runs and renews it while they run. Several processes
+# can share the database: only jobs whose lease ran out (their process died)
+# are handed to another worker.
+
+import datetime
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+
+import db
+
+logger = logging.getLogger(__name__)
+
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_DONE = 'done'
+JOB_FAILED = 'failed'
+
+# Seconds a claimed job stays leased without a heartbeat; renewed every third of that
+JOB_LEASE_SECONDS = float(os.environ.get('JOB_LEASE_SECONDS', 60))
+
+
+def _now(offset=0):
+    moment = datetime.datetime.utcnow() + datetime.timedelta(seconds=offset)
+    return moment.isoformat(sep=' ', timespec='milliseconds')
+
+
+class JobQueue:
+    """
+    SQLite-backed scan queue with a pool of worker threads.
+
+    scan_func(target_url, on_progress, **options) must return a
+    (response_data, scan_id) tuple; on_progress(partial_results) may be
+    called any number of times while the scan runs. options are the
+    JSON-serializable keyword arguments given to enqueue. Claimed jobs are
+    leased to this queue's owner id for lease_seconds and kept alive by a
+    heartbeat thread.
+    """
+
+    def __init__(self, scan_func, workers=4, poll_interval=1.0, lease_seconds=JOB_LEASE_SECONDS):
+        self.scan_func = scan_func
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._wakeup = threading.Condition()
+        self._threads = []
+        self._start_lock = threading.Lock()
+
+    def start(self):
+        """Starts the worker threads (safe to call more than once)."""
+        with self._start_lock:
+            if self._threads:
+                return
+            self._requeue_expired()
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._worker_loop, name=f"scan-worker-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            heartbeat = threading.Thread(target=self._heartbeat_loop, name="scan-job-heartbeat", daemon=True)
+            heartbeat.start()
+            self._threads.append(heartbeat)
+            logger.info("Started %d scan worker(s) as %s.", self.workers, self.owner)
+
+    def _requeue_expired(self):
+        # Running jobs whose lease ran out belong to a process that died; run them again.
+        # Jobs from before leases existed have none and count as expired.
+        try:
+            cursor = db.get_connection().execute('''
+                UPDATE scan_jobs SET status = ?, started_at = NULL, owner = NULL, lease_expires_at = NULL
+                WHERE status = ? AND (lease_expires_at IS NULL OR lease_expires_at < ?)
+            ''', (JOB_QUEUED, JOB_RUNNING, _now()))
+        except sqlite3.Error as e:
+            logger.error("Database error while re-queuing interrupted scan jobs: %s", e)
+            return
+        if cursor.rowcount:
+            logger.warning("Re-queued %d interrupted scan job(s).", cursor.rowcount)
+            with self._wakeup:
+                self._wakeup.notify_all()
+
+    def _heartbeat_loop(self):
+        while True:
+            time.sleep(self.lease_seconds / 3)
+            try:
+                db.get_connection().execute("UPDATE scan_jobs SET lease_expires_at = ? WHERE owner = ? AND status = ?",
+                                            (_now(self.lease_seconds), self.owner, JOB_RUNNING))
+            except sqlite3.Error as e:
+                logger.error("Database error while renewing scan job leases: %s", e)
+            self._requeue_expired()
+
+    def enqueue(self, target_url, options=None):
+        """Adds a scan job and returns its id."""
+        job_id = uuid.uuid4().hex
+        db.get_connection().execute("INSERT INTO scan_jobs (id, target_url, status, created_at, options) VALUES (?, ?, ?, ?, ?)",
+                                    (job_id, target_url, JOB_QUEUED, _now(), json.dumps(options) if options else None))
+        with self._wakeup:
+            self._wakeup.notify()
+        return job_id
+
+    def get(self, job_id):
+        """Returns the job as a dict (JSON columns decoded), or None."""
+        row = db.get_connection().execute("SELECT * FROM scan_jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        for key in ('partial_results', 'result', 'options'):
+            job[key] = json.loads(job[key]) if job[key] else None
+        return job
+
+    def counts(self):
+        """Number of jobs per status."""
+        rows = db.get_connection().execute("SELECT status, COUNT(*) FROM scan_jobs GROUP BY status").fetchall()
+        return {status: count for status, count in rows}
+
+    def _claim_next(self):
+        try:
+            # IMMEDIATE takes the write lock up front, serialising claims across threads and processes
+            with db.transaction() as conn:
+                row = conn.execute("SELECT id, target_url, options FROM scan_jobs WHERE status = ? ORDER BY created_at LIMIT 1",
+                                   (JOB_QUEUED,)).fetchone()
+                if row is None:
+                    return None
+                conn.execute("UPDATE scan_jobs SET status = ?, started_at = ?, owner = ?, lease_expires_at = ? WHERE id = ?",
+                             (JOB_RUNNING, _now(), self.owner, _now(self.lease_seconds), row['id']))
+            return row['id'], row['target_url'], json.loads(row['options']) if row['options'] else {}
+        except sqlite3.Error as e:
+            logger.error("Database error while claiming scan job: %s", e)
+            return None
+
+    def _update(self, job_id, **fields):
+        # Only while the job is still ours: once the lease is lost, another worker owns it
+        assignments = ', '.join(f"{column} = ?" for column in fields)
+        try:
+            cursor = db.get_connection().execute(f"UPDATE scan_jobs SET {assignments} WHERE id = ? AND owner = ?",
+                                                 (*fields.values(), job_id, self.owner))
+        except sqlite3.Error as e:
+            logger.error("Database error while updating scan job %s: %s", job_id, e)
+            return
+        if not cursor.rowcount:
+            logger.warning("Lost the lease on scan job %s; not recording its update.", job_id)
+
+    def _worker_loop(self):
+        while True:
+            job = self._claim_next()
+            if job is None:
+                with self._wakeup:
+                    self._wakeup.wait(self.poll_interval)
+                continue
+            self._run(*job)
+
+    def _run(self, job_id, target_url, options):
+        def on_progress(partial_results):
+            self._update(job_id, partial_results=json.dumps(partial_results))
+
+        try:
+            response_data, scan_id = self.scan_func(target_url, on_progress, **options)
+            self._update(job_id, status=JOB_DONE, finished_at=_now(), scan_id=scan_id,
+                         result=json.dumps(response_data))
+        except Exception as e:
+            logger.exception("Scan job %s for %s failed: %s", job_id, target_url, e)
+            self._update(job_id, status=JOB_FAILED, finished_at=_now(), error=str(e))
@@ -0,0 +1,159 @@
+# backend/logs.py
+# Structured, leveled logging for the backend and the scanner package.
+# Modules log through logging.getLogger(__name__); configure_logging()
+# routes every record through a bounded queue to a single background
+# thread, which formats (text or JSON lines) and writes them, so a scan
+# thread never blocks on stderr. Each record carries the correlation id
+# of the request or scan it belongs to, and large debug payloads are only
+# built for a sampled fraction of scans.
+
+import atexit
+import contextlib
+import contextvars
+import datetime
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+import uuid
+
+from scanner.metrics import Counter
+
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = os.environ.get('LOG_FORMAT', 'text').lower() # 'text' or 'json'
+LOG_QUEUE_SIZE = int(os.environ.get('LOG_QUEUE_SIZE', 10000)) # Records waiting to be written; extras are dropped
+# Fraction of log_payload() calls that actually build and log their payload (at DEBUG)
+LOG_PAYLOAD_SAMPLE_RATE = float(os.environ.get('LOG_PAYLOAD_SAMPLE_RATE', 0.01))
+
+_correlation_id = contextvars.ContextVar('correlation_id', default=None)
+
+# Attributes every LogRecord has; anything else was passed with extra= and goes into JSON output
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'correlation_id'}
+
+LOG_RECORDS_DROPPED = Counter('log_records_dropped', 'Log records dropped because the log queue was full.')
+
+_listener = None
+_configure_lock = threading.Lock()
+
+
+def new_correlation_id():
+    return uuid.uuid4().hex[:12]
+
+
+def get_correlation_id():
+    """The correlation id of the current request or scan, or None."""
+    return _correlation_id.get()
+
+
+@contextlib.contextmanager
+def correlation(correlation_id=None):
+    """
+    Tags every record logged inside the block (and in work bound to this
+    context, see scanner.timing.bind) with a correlation id. An id that is
+    already set is kept unless a new one is passed explicitly.
+    """
+    correlation_id = correlation_id or _correlation_id.get() or new_correlation_id()
+    token = _correlation_id.set(correlation_id)
+    try:
+        yield correlation_id
+    finally:
+        _correlation_id.reset(token)
+
+
+def set_correlation_id(correlation_id):
+    """Sets the id without a block; returns a token for reset_correlation_id()."""
+    return _correlation_id.set(correlation_id)
+
+
+def reset_correlation_id(token):
+    _correlation_id.reset(token)
+
+
+class CorrelationFilter(logging.Filter):
+    """Stamps records with the correlation id of the thread that logged them."""
+
+    def filter(self, record):
+        record.correlation_id = _correlation_id.get() or '-'
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message, correlation id and any extra= fields."""
+
+    def format(self, record):
+        entry = {
+            'time': datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'correlation_id': getattr(record, 'correlation_id', '-'),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+TEXT_FORMAT = '%(asctime)s %(levelname)-7s [%(correlation_id)s] %(name)s: %(message)s'
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler for a bounded queue that never blocks: when the writer
+    falls behind, new records are dropped and counted (log_records_dropped
+    in /metrics) instead.
+    """
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_RECORDS_DROPPED.inc()
+
+
+def configure_logging(level=None, log_format=None, stream=None):
+    """
+    Installs the queue handler on the root logger and starts the writer
+    thread. Safe to call more than once; later calls only change the level.
+    """
+    global _listener
+    root = logging.getLogger()
+    level = level or LOG_LEVEL
+    root.setLevel(level.upper() if isinstance(level, str) else level)
+    with _configure_lock:
+        if _listener is not None:
+            return
+        output = logging.StreamHandler(stream or sys.stderr)
+        if (log_format or LOG_FORMAT) == 'json':
+            output.setFormatter(JsonFormatter())
+        else:
+            output.setFormatter(logging.Formatter(TEXT_FORMAT))
+        handler = DroppingQueueHandler(queue.Queue(LOG_QUEUE_SIZE))
+        handler.addFilter(CorrelationFilter())
+        root.addHandler(handler)
+        _listener = logging.handlers.QueueListener(handler.queue, output, respect_handler_level=True)
+        _listener.start()
+        atexit.register(_listener.stop) # Flush what is queued on exit
+
+
+def log_payload(logger, message, build_payload, sample_rate=None, **fields):
+    """
+    Logs a large payload (e.g. a whole scan response) at DEBUG for a sampled
+    fraction of calls. build_payload is only called, and its result only
+    serialized, when the record will actually be written, so at INFO this
+    costs a level check and nothing else.
+    """
+    if not logger.isEnabledFor(logging.DEBUG):
+        return
+    rate = LOG_PAYLOAD_SAMPLE_RATE if sample_rate is None else sample_rate
+    if rate < 1 and random.random() >= rate:
+        return
+    logger.debug("%s: %s", message, json.dumps(build_payload(), default=str), extra=fields)
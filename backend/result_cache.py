@@ -0,0 +1,232 @@
+# backend/result_cache.py
+# Cache of recent check results, so repeat scans of the same URL within a
+# check's TTL are answered without touching the target. Results are keyed by
+# (normalized URL, check name); a scan's check set is served check by check.
+# A bounded in-memory LRU sits in front of the scan_results history, which
+# keeps results warm across restarts. A scan saves cached results along with
+# fresh ones, so ages come from each check's own checked_at time, not from
+# the row's scan_timestamp.
+
+import collections
+import datetime
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+import db
+
+logger = logging.getLogger(__name__)
+
+# Seconds a result stays fresh, per check. Overridable with CACHE_TTL_<CHECK>
+# (e.g. CACHE_TTL_PORTS=7200); 0 disables caching for that check.
+DEFAULT_TTLS = {
+    "headers": 300,
+    "ports": 3600,
+    "sqli": 900,
+    "xss": 900,
+    "tls": 3600,
+}
+
+CACHE_MAX_ENTRIES = int(os.environ.get('CACHE_MAX_ENTRIES', 2048))
+
+
+def _ttls_from_env():
+    return {name: float(os.environ.get(f'CACHE_TTL_{name.upper()}', ttl)) for name, ttl in DEFAULT_TTLS.items()}
+
+
+def _loads(value, default):
+    try:
+        return json.loads(value) if value else default
+    except ValueError:
+        return default
+
+
+def utc_timestamp(moment=None):
+    """A UTC time (default now) in the text format of CURRENT_TIMESTAMP in scan_results."""
+    return (moment or datetime.datetime.utcnow()).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def check_time(row, name):
+    """
+    When check `name` of a scan_results row was produced, or None if unknown.
+    Rows saved before checked_at existed only have their scan_timestamp.
+    """
+    if row['checked_at'] is None:
+        return row['scan_timestamp']
+    return _loads(row['checked_at'], {}).get(name)
+
+
+def load_from_history(conn, target_url, name, max_age):
+    """
+    Rebuilds one check's result from the newest saved scan of target_url
+    that is at most max_age seconds old, if that check's result in it (see
+    check_time) is too. Returns (check_result, checked_at, age in seconds),
+    or None. Scans where the check did not run, or reported an error, do
+    not count.
+    """
+    now = datetime.datetime.utcnow()
+    cutoff = utc_timestamp(now - datetime.timedelta(seconds=max_age))
+    row = conn.execute('''
+        SELECT id, scan_timestamp, sqli_potential, xss_potential, open_ports,
+               header_x_frame, header_hsts, header_policy, header_xxss, header_nonsnif,
+               scan_errors, details, services, checked_at
+        FROM scan_results
+        WHERE target_url = ? AND scan_timestamp >= ?
+        ORDER BY scan_timestamp DESC, id DESC
+        LIMIT 1
+    ''', (target_url, cutoff)).fetchone()
+    if row is None:
+        return None
+    checked_at = check_time(row, name)
+    if checked_at is None:
+        return None
+    try:
+        age = (now - datetime.datetime.fromisoformat(str(checked_at))).total_seconds()
+    except ValueError:
+        return None
+    if age > max_age:
+        return None # Carried into a newer scan from the cache, but itself too old
+    check_result = check_result_from_row(conn, row, name)
+    if check_result is None:
+        return None
+    return check_result, checked_at, max(age, 0)
+
+
+def check_result_from_row(conn, row, name):
+    """
+    One check's return value rebuilt from a scan_results row, or None if the
+    check did not run or failed in that scan. Also used by incremental scans.
+    """
+    scan_errors = _loads(row['scan_errors'], {})
+    details = _loads(row['details'], {})
+
+    if name == "headers":
+        values = [row['header_x_frame'], row['header_hsts'], row['header_policy'],
+                  row['header_xxss'], row['header_nonsnif']]
+        if any(value not in (0, 1) for value in values) or 'HeaderError' in scan_errors:
+            return None
+        keys = ["Header of x-frame", "Header of hsts", "Header of policy", "Header of xxss", "Header of nonsnif"]
+        return {key: bool(value) for key, value in zip(keys, values)}
+    if name == "ports":
+        if row['open_ports'] is None or 'PortScanError' in scan_errors:
+            return None
+        result = {"Scan Ports": _loads(row['open_ports'], [])}
+        if row['services'] is not None:
+            result["services"] = _loads(row['services'], [])
+        ip_row = conn.execute("SELECT ip_address FROM scan_ports WHERE scan_id = ? LIMIT 1", (row['id'],)).fetchone()
+        if ip_row is not None:
+            result["ip_address"] = ip_row['ip_address']
+        return result
+    if name == "sqli":
+        if row['sqli_potential'] is None or 'SQLiError' in scan_errors:
+            return None
+        return {"SQL Injection Test": bool(row['sqli_potential']),
+                "sqli_details": details.get("sqli") or [],
+                "sqli_findings": details.get("sqli_findings") or []}
+    if name == "xss":
+        xss_details = details.get("xss")
+        if row['xss_potential'] is None or 'XSSError' in scan_errors or not isinstance(xss_details or [], list):
+            return None # Old rows kept only a message, not the findings themselves
+        return {"XSS Test": bool(row['xss_potential']), "xss_details": xss_details or []}
+    if name == "tls":
+        if "tls" not in details or 'TLSError' in scan_errors:
+            return None
+        tls_findings = details.get("tls_findings") or []
+        return {"TLS Test": bool(tls_findings), "tls_details": details["tls"], "tls_findings": tls_findings}
+    return None
+
+
+class ResultCache:
+    """
+    Per-check result cache with a TTL per check name. Lookups try the
+    in-memory LRU first and then the scan history (see load_from_history);
+    history hits are promoted into memory with whatever TTL they have left.
+    Implements the get/put interface run_checks expects, plus checked_at()
+    for saving served results with their original time.
+    """
+
+    def __init__(self, ttls=None, max_entries=CACHE_MAX_ENTRIES, use_history=True):
+        self.ttls = dict(ttls if ttls is not None else _ttls_from_env())
+        self.max_entries = max_entries
+        self.use_history = use_history
+        self._entries = collections.OrderedDict() # (url, name) -> (expires_at, check_result, checked_at)
+        self._lock = threading.Lock()
+        self._stats = {name: collections.Counter() for name in self.ttls}
+
+    def _count(self, name, outcome):
+        with self._lock:
+            self._stats.setdefault(name, collections.Counter())[outcome] += 1
+
+    def get(self, url, name):
+        ttl = self.ttls.get(name, 0)
+        if ttl <= 0:
+            return None
+        key = (url, name)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(key)
+                self._stats.setdefault(name, collections.Counter())['memory_hits'] += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key] # Expired
+
+        if self.use_history:
+            try:
+                found = load_from_history(db.get_connection(), url, name, ttl)
+            except sqlite3.Error as e:
+                logger.warning("Database error reading cached %s result for %s: %s", name, url, e)
+                found = None
+            if found is not None:
+                check_result, checked_at, age = found
+                self._store(key, check_result, ttl - age, checked_at)
+                self._count(name, 'history_hits')
+                return check_result
+
+        self._count(name, 'misses')
+        return None
+
+    def put(self, url, name, check_result):
+        ttl = self.ttls.get(name, 0)
+        if ttl > 0:
+            self._store((url, name), check_result, ttl, utc_timestamp())
+
+    def checked_at(self, url, name):
+        """When the cached result of check `name` for url was produced, or None if it is not cached."""
+        with self._lock:
+            entry = self._entries.get((url, name))
+        return entry[2] if entry is not None else None
+
+    def _store(self, key, check_result, ttl, checked_at):
+        with self._lock:
+            self._entries[key] = (time.time() + ttl, check_result, checked_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Hit/miss counts per check plus overall totals and the current size."""
+        with self._lock:
+            per_check = {name: {'memory_hits': counts['memory_hits'], 'history_hits': counts['history_hits'],
+                                'misses': counts['misses']}
+                         for name, counts in self._stats.items()}
+            entries = len(self._entries)
+        hits = sum(c['memory_hits'] + c['history_hits'] for c in per_check.values())
+        misses = sum(c['misses'] for c in per_check.values())
+        return {
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttls,
+            "hits": hits,
+            "misses": misses,
+            "hit_ratio": round(hits / (hits + misses), 3) if hits + misses else None,
+            "checks": per_check,
+        }
@@ -0,0 +1,217 @@
+# backend/scanner/banner_scanner.py
+# Service fingerprinting on connections the port sweep has already opened.
+# Server-speaks-first protocols (SSH, SMTP, FTP, POP3, IMAP, MySQL) are
+# identified from the banner they send on connect; HTTP and DNS ports, and
+# ports that stay silent, get one lightweight probe instead. Responses are
+# matched against SIGNATURES, compiled once at import, to report the
+# service, product and version. On TLS ports the connection is upgraded
+# first, and the handshake is kept for the TLS check (see handshakes.py).
+
+import asyncio
+import os
+import re
+import ssl
+import string
+import struct
+
+from .handshakes import get_handshakes, describe_handshake, SOURCE_PORT_SCAN
+
+# Overall time allowed for reading a banner and/or probe response on one port
+BANNER_TIMEOUT = float(os.environ.get('BANNER_TIMEOUT', 2))
+# How long a silent port is given to send a banner before it is probed
+BANNER_WAIT = float(os.environ.get('BANNER_WAIT', 0.5))
+BANNER_MAX_BYTES = 4096 # Never read more than this from one service
+BANNER_MAX_CHARS = 200 # Length of the banner text kept in results
+
+# Ports where the client speaks first, so waiting for a banner is pointless
+HTTP_PORTS = {80, 443, 591, 2082, 2083, 2086, 2087, 3000, 4443, 5000, 5601, 5986, 6443, 7001, 7443, 8000,
+              8001, 8002, 8008, 8010, 8080, 8081, 8082, 8088, 8089, 8090, 8181, 8443, 8880, 8888, 9000,
+              9001, 9080, 9090, 9200, 9443, 10000, 10443}
+DNS_PORTS = {53, 5353}
+# Ports that speak TLS from the first byte (HTTPS, SMTPS, LDAPS, FTPS, IMAPS, POP3S, ...)
+TLS_PORTS = {443, 465, 636, 990, 993, 995, 2083, 2087, 4443, 5986, 6443, 7443, 8443, 9443, 10443}
+
+DNS_QUERY_ID = 0xbeef
+# "version.bind" TXT in class CHAOS, framed for DNS over TCP (RFC 1035 4.2.2)
+_dns_question = (struct.pack('>HHHHHH', DNS_QUERY_ID, 0x0100, 1, 0, 0, 0)
+                 + b'\x07version\x04bind\x00' + struct.pack('>HH', 16, 3))
+DNS_PROBE = struct.pack('>H', len(_dns_question)) + _dns_question
+
+# (service, pattern, product): the first matching row wins, so specific
+# products come before the generic row for their protocol. Patterns may
+# capture `product` and `version`; a captured product overrides the fixed one.
+SIGNATURES = [(service, re.compile(pattern, flags), product) for service, pattern, flags, product in [
+    ('ssh', rb'^SSH-[\d.]+-(?P<product>OpenSSH)[_-](?P<version>[\w.]+)', 0, None),
+    ('ssh', rb'^SSH-[\d.]+-(?P<product>dropbear)_(?P<version>[\w.]+)', 0, None),
+    ('ssh', rb'^SSH-[\d.]+-(?P<product>[^\s_-]+)(?:[_-](?P<version>[\w.]+))?', 0, None),
+    ('ftp', rb'^220[- ].*?\(vsFTPd (?P<version>[\d.]+)\)', 0, 'vsFTPd'),
+    ('ftp', rb'^220[- ].*?ProFTPD (?P<version>[\d.]+\w*)', 0, 'ProFTPD'),
+    ('ftp', rb'^220[- ].*?Pure-FTPd', 0, 'Pure-FTPd'),
+    ('ftp', rb'^220[- ].*?FileZilla Server(?: version)? (?P<version>[\d.]+\w*)', 0, 'FileZilla Server'),
+    ('ftp', rb'^220[- ].*?Microsoft FTP Service', 0, 'Microsoft FTP Service'),
+    ('smtp', rb'^220[- ].*?ESMTP Postfix', 0, 'Postfix'),
+    ('smtp', rb'^220[- ].*?\bExim (?P<version>[\d.]+)', 0, 'Exim'),
+    ('smtp', rb'^220[- ].*?Sendmail (?P<version>[\d.]+)', 0, 'Sendmail'),
+    ('smtp', rb'^220[- ].*?Microsoft ESMTP MAIL Service(?:, Version: (?P<version>[\d.]+))?', 0, 'Microsoft Exchange'),
+    ('smtp', rb'^220[- ][^\r\n]*\bE?SMTP\b', re.I, None),
+    ('ftp', rb'^220[- ][^\r\n]*\bFTP\b', re.I, None),
+    ('pop3', rb'^\+OK\b[^\r\n]*\bDovecot\b', 0, 'Dovecot'),
+    ('pop3', rb'^\+OK\b', 0, None),
+    ('imap', rb'^\* OK\b[^\r\n]*\bDovecot\b', 0, 'Dovecot'),
+    ('imap', rb'^\* OK\b', 0, None),
+    ('mysql', rb'^.{3}\x00\x0a(?P<version>[\d.]+-MariaDB)', re.S, 'MariaDB'),
+    ('mysql', rb'^.{3}\x00\x0a(?P<version>[\d.]+)[^\x00]*\x00', re.S, 'MySQL'),
+    ('http', rb'^HTTP/\d(?:\.\d)? \d{3}(?:.*?\r\nServer:[ \t]*(?P<product>[^/\r\n ]+)(?:/(?P<version>[^\s]+))?)?',
+     re.S | re.I, None),
+    ('dns', rb'^.{2}\xbe\xef[\x80-\xff]', re.S, None), # Answer to DNS_PROBE (matching id, QR bit set)
+    ('tls', rb'^\x15\x03[\x00-\x04]', 0, None), # TLS alert in reply to plaintext
+]]
+
+_PRINTABLE = set(string.printable) - set('\t\n\r\x0b\x0c')
+
+
+def probe_for_port(port):
+    """The probe a port gets straight away ('http' or 'dns'), or None to wait for a banner first."""
+    if port in DNS_PORTS:
+        return 'dns'
+    if port in HTTP_PORTS:
+        return 'http'
+    return None
+
+
+def probe_bytes(probe, host):
+    if probe == 'dns':
+        return DNS_PROBE
+    return f'HEAD / HTTP/1.0\r\nHost: {host}\r\nUser-Agent: Mozilla/5.0\r\n\r\n'.encode()
+
+
+def _complete(data, probe):
+    """True once `data` holds enough of the response to match it."""
+    if probe == 'dns':
+        return len(data) >= 2 and len(data) >= 2 + struct.unpack('>H', data[:2])[0]
+    if probe == 'http':
+        return b'\r\n\r\n' in data
+    if b'\n' in data or data.startswith(b'\x15'):
+        return True
+    # Binary greetings (MySQL) are one packet: 3-byte little-endian length, sequence number, payload
+    return len(data) >= 4 and len(data) >= 4 + int.from_bytes(data[:3], 'little')
+
+
+def _dns_txt_answer(data):
+    """The first TXT string of a DNS-over-TCP answer (e.g. BIND's version.bind), or None."""
+    try:
+        message = data[2:]
+        if struct.unpack('>H', message[6:8])[0] == 0:
+            return None # No answers (REFUSED, or version hidden)
+        offset = 12
+        while message[offset] != 0: # Skip the question name
+            offset += message[offset] + 1
+        offset += 5 # Root label, type, class
+        offset += 2 if message[offset] & 0xc0 == 0xc0 else len(message[offset:].split(b'\x00', 1)[0]) + 1
+        rtype, _, _, rdlength = struct.unpack('>HHIH', message[offset:offset + 10])
+        if rtype != 16 or rdlength < 1:
+            return None
+        length = message[offset + 10]
+        return message[offset + 11:offset + 11 + length].decode('ascii', errors='replace') or None
+    except (IndexError, struct.error):
+        return None
+
+
+def banner_text(data):
+    """The first line of a response as printable text, shortened to BANNER_MAX_CHARS."""
+    line = data.split(b'\n', 1)[0].decode('utf-8', errors='replace').rstrip('\r')
+    text = ''.join(char if char in _PRINTABLE else '.' for char in line).strip()
+    return text[:BANNER_MAX_CHARS] or None
+
+
+def match_signature(data):
+    """
+    Matches one response against SIGNATURES. Returns {'service', 'product',
+    'version'} (product and version may be None), or None if nothing matched.
+    """
+    for service, pattern, product in SIGNATURES:
+        match = pattern.match(data)
+        if match is None:
+            continue
+        groups = match.groupdict()
+        found = {
+            'service': service,
+            'product': (groups.get('product') or b'').decode('utf-8', errors='replace') or product,
+            'version': (groups.get('version') or b'').decode('utf-8', errors='replace') or None,
+        }
+        if service == 'dns':
+            found['version'] = _dns_txt_answer(data)
+        return found
+    return None
+
+
+async def _read_response(reader, probe, end_time):
+    """Reads until the response is complete, the peer closes, or end_time. Returns the bytes read."""
+    loop = asyncio.get_running_loop()
+    data = b''
+    while len(data) < BANNER_MAX_BYTES and not _complete(data, probe):
+        remaining = end_time - loop.time()
+        if remaining <= 0:
+            break
+        try:
+            chunk = await asyncio.wait_for(reader.read(BANNER_MAX_BYTES - len(data)), remaining)
+        except (asyncio.TimeoutError, OSError):
+            break
+        if not chunk:
+            break
+        data += chunk
+    return data
+
+
+async def _start_tls(writer, host, port, end_time):
+    """Upgrades the connection to TLS (without verification) and records the handshake. Returns True on success."""
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+    context.check_hostname = False
+    context.verify_mode = ssl.CERT_NONE
+    remaining = end_time - asyncio.get_running_loop().time()
+    if remaining <= 0:
+        return False
+    try:
+        await asyncio.wait_for(writer.start_tls(context, server_hostname=host, ssl_handshake_timeout=remaining),
+                               remaining)
+    except (ssl.SSLError, OSError, asyncio.TimeoutError):
+        return False
+    get_handshakes().record(host, port, describe_handshake(writer.get_extra_info('ssl_object'),
+                                                           writer.get_extra_info('peername'), None,
+                                                           SOURCE_PORT_SCAN))
+    return True
+
+
+async def grab_service(reader, writer, host, port, timeout=None):
+    """
+    Identifies the service on an already connected (reader, writer) pair:
+    on TLS_PORTS it first completes a TLS handshake (with `host` as the
+    server name), then waits up to BANNER_WAIT for a banner, unless the
+    port is one where the client speaks first, then sends the HTTP or DNS
+    probe if still needed. The whole exchange is bounded by `timeout`
+    (default BANNER_TIMEOUT). Returns {'service', 'product', 'version',
+    'banner', 'probe', 'tls'} or None if the port sent nothing.
+    """
+    loop = asyncio.get_running_loop()
+    end_time = loop.time() + (BANNER_TIMEOUT if timeout is None else timeout)
+    tls = port in TLS_PORTS and await _start_tls(writer, host, port, end_time)
+    probe = probe_for_port(port)
+    data = b''
+    if probe is None:
+        data = await _read_response(reader, None, min(end_time, loop.time() + BANNER_WAIT))
+        if not data and not reader.at_eof():
+            probe = 'http' # Silent port: most of these turn out to speak HTTP
+    if probe is not None and loop.time() < end_time:
+        try:
+            writer.write(probe_bytes(probe, host))
+            await asyncio.wait_for(writer.drain(), max(0, end_time - loop.time()))
+            data = await _read_response(reader, probe, end_time)
+        except (asyncio.TimeoutError, OSError):
+            pass
+    if not data:
+        return None
+    found = match_signature(data) or {'service': None, 'product': None, 'version': None}
+    found['banner'] = banner_text(data) if found['service'] != 'dns' else None
+    found['probe'] = probe or 'banner'
+    found['tls'] = tls
+    return found
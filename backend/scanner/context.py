@@ -0,0 +1,171 @@
+import hashlib
+import threading
+from urllib.parse import urljoin, urlparse, urlunparse, parse_qs
+from .utils import make_request, TEXT_CONTENT_TYPES
+from .html_parser import parse_page, declared_encoding
+from .parse_pool import run_parse
+
+class ScanContext:
+    """
+    Per-scan fetch context. The baseline page is requested at most once and
+    the response, its lower-cased headers and its parsed page are shared by
+    every check that receives the context. request_headers are sent with
+    the baseline request (e.g. If-None-Match for a conditional fetch). The
+    body is capped like every make_request body, and not read at all unless
+    it is text, so a context holds at most HTTP_SETTINGS['max_body_bytes'].
+    """
+
+    def __init__(self, url, timeout=10, request_headers=None):
+        self.url = url
+        self.timeout = timeout
+        self.request_headers = request_headers
+        self._lock = threading.Lock()
+        self._fetched = False
+        self._response = None
+        self._headers = None
+        self._parsed = None
+        self._forms = None
+
+    @classmethod
+    def from_page(cls, url, response, forms, timeout=10):
+        """A context for a page that was already fetched and parsed elsewhere (e.g. by the crawler)."""
+        context = cls(url, timeout=timeout)
+        context._response = response
+        context._fetched = True
+        context._forms = forms
+        return context
+
+    @property
+    def response(self):
+        """The baseline response object, or None if the request failed."""
+        with self._lock:
+            if not self._fetched:
+                # Headers are all the header check needs; binary bodies are not worth downloading
+                self._response = make_request(self.url, timeout=self.timeout, headers=self.request_headers,
+                                              accept=TEXT_CONTENT_TYPES)
+                self._fetched = True
+            return self._response
+
+    @property
+    def fetched(self):
+        """True once the baseline request has been made (whether or not it succeeded)."""
+        return self._fetched
+
+    @property
+    def not_modified(self):
+        """True if a conditional baseline request came back 304 Not Modified."""
+        response = self.response
+        return response is not None and response.status_code == 304
+
+    @property
+    def content_hash(self):
+        """SHA-256 of the raw baseline body, or None if there is no response."""
+        response = self.response
+        return hashlib.sha256(response.content).hexdigest() if response is not None else None
+
+    @property
+    def text(self):
+        response = self.response
+        return response.text if response is not None else ""
+
+    @property
+    def headers(self):
+        """Response headers with lower-cased keys (empty dict if no response)."""
+        response = self.response
+        with self._lock:
+            if self._headers is None:
+                if response is None:
+                    self._headers = {}
+                else:
+                    self._headers = {k.lower(): v for k, v in response.headers.items()}
+            return self._headers
+
+    @property
+    def parsed(self):
+        """
+        The baseline body parsed once (see html_parser.parse_page):
+        {'forms', 'links', 'scripts'}, all empty if there is no body.
+        """
+        response = self.response
+        with self._lock:
+            if self._parsed is None:
+                if response is None or not response.content:
+                    self._parsed = {'forms': [], 'links': [], 'scripts': []}
+                else:
+                    self._parsed = run_parse(parse_page, response.content, self.url, declared_encoding(response))
+            return self._parsed
+
+    @property
+    def forms(self):
+        """
+        Forms on the baseline page as dicts with an absolute 'action', an
+        upper-case 'method' and 'inputs' ({'name', 'type', 'value'}), so the
+        SQLi and XSS checks share one extraction pass.
+        """
+        if self._forms is None:
+            self._forms = self.parsed['forms']
+        return self._forms
+
+    @property
+    def links(self):
+        """Absolute link targets on the baseline page."""
+        return self.parsed['links']
+
+
+# Form fields that cannot carry free text
+SKIPPED_INPUT_TYPES = {'submit', 'button', 'image', 'file', 'reset', 'checkbox', 'radio'}
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+
+def url_origin(url):
+    """(scheme, host, port) of a URL with the scheme's default port filled in, or None if it is malformed."""
+    parsed = urlparse(url)
+    try:
+        return parsed.scheme, parsed.hostname, parsed.port or DEFAULT_PORTS.get(parsed.scheme)
+    except ValueError:
+        return None
+
+
+def iter_injection_points(url, context):
+    """
+    Yields (location, method, action_url, base_params, param) for every URL
+    query parameter and every free-text form field on the baseline page.
+    base_params holds the values to send for the other fields. Forms that
+    submit to another origin than url's (a login form posting to an
+    external identity provider, say) are skipped: payloads only go to the
+    scanned target.
+    """
+    parsed_url = urlparse(url)
+    query_params = parse_qs(parsed_url.query, keep_blank_values=True)
+    base_url = urlunparse(parsed_url._replace(query=''))
+    flat_query = {name: values[0] for name, values in query_params.items()}
+    for param in query_params:
+        yield 'query', 'GET', base_url, flat_query, param
+
+    origin = url_origin(url)
+    for form in context.forms:
+        if url_origin(form['action']) != origin:
+            continue
+        fields = {field['name']: field['value'] or 'test' for field in form['inputs'] if field['name']}
+        for field in form['inputs']:
+            if field['name'] and field['type'] not in SKIPPED_INPUT_TYPES:
+                yield 'form', form['method'], form['action'], fields, field['name']
+
+
+def parameter_signature(url, context):
+    """
+    Hash of the page's injection surface: every query parameter and form
+    field as (location, method, action, name). Two pages with the same
+    signature accept the same parameters, whatever else changed.
+    """
+    points = sorted({(location, method, action_url, param)
+                     for location, method, action_url, _, param in iter_injection_points(url, context)})
+    return hashlib.sha256(repr(points).encode()).hexdigest()
+
+
+def get_context(url, context=None):
+    """Returns the given context, or a fresh one for callers that did not pass one."""
+    if context is not None:
+        return context
+    return ScanContext(url)
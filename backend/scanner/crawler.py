@@ -0,0 +1,248 @@
+# backend/scanner/crawler.py
+# Breadth-first crawler stage. Starting from the scanned page it follows
+# same-origin links up to a depth and page limit, politely and with a capped
+# number of concurrent fetches, and hands every discovered page to the SQLi
+# and XSS checks. Links and forms are pulled out of each body in a single
+# streaming parse while it downloads; bodies are dropped as soon as their
+# page has been checked, so memory stays bounded however large the site is.
+
+import collections
+import logging
+import os
+import threading
+import time
+from urllib.parse import urljoin, urlparse, urlunparse, parse_qsl
+
+from .context import ScanContext, iter_injection_points, url_origin, DEFAULT_PORTS
+from .utils import (make_request, run_per_host, check_time_left, shared_host_limit, CUT_SIZE,
+                    CUT_DEADLINE, CUT_CONTENT_TYPE)
+from .sqli_scanner import check_sqli_potential
+from .xss_scanner import check_xss_potential
+from .html_parser import MAX_PARSE_BYTES, StreamingPageParser
+
+logger = logging.getLogger(__name__)
+
+CRAWL_MAX_DEPTH = int(os.environ.get('CRAWL_MAX_DEPTH', 2))
+CRAWL_MAX_PAGES = int(os.environ.get('CRAWL_MAX_PAGES', 30))
+CRAWL_DELAY = float(os.environ.get('CRAWL_DELAY', 0.1)) # Seconds between request starts to the target
+CRAWL_PER_HOST_LIMIT = 4 # Requests in flight per host, page fetches and their checks' probes together
+
+# Memory bounds: URLs remembered for dedup, URLs waiting to be fetched,
+# links kept per page and bytes read per page
+CRAWL_MAX_SEEN = 50000
+CRAWL_MAX_FRONTIER = 5000
+CRAWL_MAX_LINKS_PER_PAGE = 500
+CRAWL_MAX_BODY_BYTES = MAX_PARSE_BYTES
+
+HTML_CONTENT_TYPES = ('text/html', 'application/xhtml+xml')
+
+# Links to these are never fetched
+SKIPPED_EXTENSIONS = (
+    '.png', '.jpg', '.jpeg', '.gif', '.svg', '.ico', '.webp', '.bmp', '.css', '.js', '.json', '.xml',
+    '.pdf', '.zip', '.gz', '.tar', '.rar', '.7z', '.exe', '.dmg', '.mp3', '.mp4', '.avi', '.mov',
+    '.woff', '.woff2', '.ttf', '.eot', '.doc', '.docx', '.xls', '.xlsx', '.ppt', '.pptx',
+)
+
+def canonical_url(url):
+    """An absolute http(s) URL without its fragment, or None for anything else."""
+    try:
+        parsed = urlparse(url.strip())
+    except ValueError:
+        return None
+    if parsed.scheme not in DEFAULT_PORTS or not parsed.netloc:
+        return None
+    return urlunparse(parsed._replace(scheme=parsed.scheme.lower(), netloc=parsed.netloc.lower(), fragment=''))
+
+
+def url_key(url):
+    """
+    Dedup key for the frontier: the path plus the sorted parameter names.
+    /item?id=1 and /item?id=2 are the same page to test, so only the first
+    one seen is crawled.
+    """
+    parsed = urlparse(url)
+    names = sorted({name for name, _ in parse_qsl(parsed.query, keep_blank_values=True)})
+    return f"{parsed.netloc}{parsed.path or '/'}?{'&'.join(names)}"
+
+
+class _Politeness:
+    """Spaces out request starts to the target by at least `delay` seconds."""
+
+    def __init__(self, delay):
+        self.delay = delay
+        self._lock = threading.Lock()
+        self._next_at = 0.0
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            start_at = max(now, self._next_at)
+            self._next_at = start_at + self.delay
+        if start_at > now:
+            time.sleep(start_at - now)
+
+
+def fetch_page(url, timeout=10):
+    """
+    Streams one page through make_request (scheduler, 429/503 backoff and
+    retries, request metrics), parsing links and forms while it downloads.
+    Non-HTML responses are abandoned after the headers and bodies are cut
+    off at CRAWL_MAX_BODY_BYTES, or when `timeout` seconds have passed since
+    the request went out. Returns (response, links, forms) or None.
+    """
+    parser = None
+
+    def feed(response, chunk):
+        nonlocal parser
+        if parser is None:
+            # Links resolve against where redirects ended up
+            parser = StreamingPageParser(response.url, max_links=CRAWL_MAX_LINKS_PER_PAGE)
+        parser.feed(chunk)
+
+    response = make_request(url, timeout=timeout, max_bytes=CRAWL_MAX_BODY_BYTES, accept=HTML_CONTENT_TYPES,
+                            on_chunk=feed)
+    if response is None or response.body_cut == CUT_CONTENT_TYPE:
+        return None
+    if response.body_cut in (CUT_SIZE, CUT_DEADLINE):
+        logger.info("Crawler truncated %s at %d bytes (%s)", url, len(response.content), response.body_cut)
+    if parser is None: # Empty body
+        parser = StreamingPageParser(response.url, max_links=CRAWL_MAX_LINKS_PER_PAGE)
+    parser.close()
+    # The body stays on the response so checks can use it like any other baseline
+    return response, parser.links, parser.forms
+
+
+def crawl(start_url, context=None, on_page=None, max_depth=CRAWL_MAX_DEPTH, max_pages=CRAWL_MAX_PAGES,
+          delay=CRAWL_DELAY, per_host_limit=CRAWL_PER_HOST_LIMIT, time_budget=None):
+    """
+    Breadth-first crawl of start_url's origin (scheme, host and port).
+
+    The start page's links come from `context` if given (no refetch), and
+    start_url itself is not passed to on_page. Every other page is fetched
+    at most once per url_key, and on_page(url, depth, response, forms) is
+    called in the worker thread while its body is still in memory; its
+    return value is kept in that page's summary as 'result'. No new pages
+    are started once time_budget seconds have passed. Returns
+    {'pages': [summaries], 'pages_crawled', 'urls_seen', 'frontier_truncated'}.
+    """
+    started = time.monotonic()
+    origin = url_origin(start_url)
+    politeness = _Politeness(delay)
+    seen = {url_key(start_url)}
+    frontier = collections.deque() # (url, depth), appended in BFS order
+    pages = []
+    truncated = False
+
+    def out_of_time():
+        if time_budget is not None and time.monotonic() - started >= time_budget:
+            return True
+        time_left = check_time_left() # Abandoned by the pipeline
+        return time_left is not None and time_left <= 0
+
+    def enqueue(links, depth):
+        nonlocal truncated
+        for link in links:
+            url = canonical_url(link)
+            if url is None or url_origin(url) != origin or urlparse(url).path.lower().endswith(SKIPPED_EXTENSIONS):
+                continue
+            key = url_key(url)
+            if key in seen:
+                continue
+            if len(seen) >= CRAWL_MAX_SEEN or len(frontier) >= CRAWL_MAX_FRONTIER:
+                truncated = True
+                return
+            seen.add(key)
+            frontier.append((url, depth))
+
+    if context is not None and context.response is not None:
+        enqueue(context.links[:CRAWL_MAX_LINKS_PER_PAGE], 1)
+    else:
+        politeness.wait()
+        fetched = fetch_page(start_url)
+        if fetched is not None:
+            enqueue(fetched[1], 1)
+
+    def visit(item):
+        url, depth = item
+        if out_of_time():
+            return None
+        politeness.wait()
+        fetched = fetch_page(url)
+        if fetched is None:
+            return None
+        response, links, forms = fetched
+        if url_origin(response.url) != origin:
+            return None # Redirected off-site
+        summary = {'url': url, 'depth': depth, 'forms': len(forms)}
+        if on_page:
+            summary['result'] = on_page(url, depth, response, forms)
+        return links, summary
+
+    while frontier and len(pages) < max_pages and not out_of_time():
+        # One BFS level at a time (or as much of it as the page budget allows)
+        depth = frontier[0][1]
+        level = []
+        while frontier and frontier[0][1] == depth and len(level) < max_pages - len(pages):
+            level.append(frontier.popleft())
+        outcomes = run_per_host(level, visit, url_of=lambda item: item[0], per_host_limit=per_host_limit)
+        for outcome in outcomes:
+            if outcome is None:
+                continue
+            links, summary = outcome
+            pages.append(summary)
+            if summary['depth'] < max_depth:
+                enqueue(links, summary['depth'] + 1)
+
+    return {
+        'pages': pages,
+        'pages_crawled': len(pages),
+        'urls_seen': len(seen),
+        'frontier_truncated': truncated,
+    }
+
+
+def check_crawl(url, context=None, time_budget=None):
+    """
+    Crawls the target's origin and runs the SQLi and XSS checks on every
+    page found that has URL parameters or forms. Forms already tested on
+    an earlier page (same action, method and fields) are not tested again.
+    """
+    tested_forms = set()
+    lock = threading.Lock()
+
+    def on_page(page_url, depth, response, forms):
+        with lock:
+            new_forms = []
+            for form in forms:
+                key = (form['action'], form['method'], tuple(sorted(str(f['name']) for f in form['inputs'])))
+                if key not in tested_forms:
+                    tested_forms.add(key)
+                    new_forms.append(form)
+        page_context = ScanContext.from_page(page_url, response, new_forms)
+        if not any(True for _ in iter_injection_points(page_url, page_context)):
+            return None
+        findings = []
+        sqli = check_sqli_potential(page_url, context=page_context)
+        findings.extend(dict(f, check='sqli', page=page_url) for f in sqli.get('sqli_findings') or [])
+        xss = check_xss_potential(page_url, context=page_context)
+        findings.extend(dict(f, check='xss', page=page_url) for f in xss.get('xss_details') or [])
+        return findings
+
+    if context is not None and context.response is None:
+        return {"Crawl Test": False, "crawl_details": None, "crawl_findings": [],
+                "error_message": "Could not fetch original URL."}
+
+    # The SQLi and XSS fan-outs started from on_page draw on the crawl's per-host slots
+    with shared_host_limit(CRAWL_PER_HOST_LIMIT):
+        summary = crawl(url, context=context, on_page=on_page, time_budget=time_budget)
+    findings = []
+    for page in summary['pages']:
+        findings.extend(page.pop('result', None) or [])
+    for finding in findings:
+        logger.info("Potential %s finding on crawled page %s (parameter '%s')",
+                    finding['check'], finding['page'], finding['parameter'])
+    return {
+        "Crawl Test": bool(findings),
+        "crawl_details": summary,
+        "crawl_findings": findings
+    }
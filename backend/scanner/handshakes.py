@@ -0,0 +1,139 @@
+# backend/scanner/handshakes.py
+# Recent TLS handshakes, by server name and port. The pooled HTTPS session
+# (through a hook in urllib3) and the port sweep's service fingerprinting
+# record every handshake they make here, so the TLS check can read the
+# negotiated protocol, cipher, certificate chain and verification outcome
+# instead of connecting again.
+
+import collections
+import os
+import ssl
+import threading
+import time
+
+import urllib3.connection
+
+HANDSHAKE_TTL = float(os.environ.get('TLS_CACHE_TTL', 900))
+HANDSHAKE_MAX_ENTRIES = 4096
+
+# Where a handshake came from
+SOURCE_HTTP = 'http' # The pooled requests session (certificate verified against the CA store)
+SOURCE_PORT_SCAN = 'port_scan' # Service fingerprinting in the port sweep (not verified)
+SOURCE_PROBE = 'probe' # The TLS check's own connection
+
+
+def peer_chain(ssl_object):
+    """
+    The certificates the server sent, leaf first, as getpeercert()-style
+    dicts. Works for unverified connections too; where the interpreter
+    cannot expose the chain, only a verified leaf is returned.
+    """
+    raw = getattr(ssl_object, '_sslobj', None) # SSLSocket and SSLObject both wrap an _ssl._SSLSocket
+    get_chain = getattr(raw, 'get_unverified_chain', None) # Python 3.10+
+    if get_chain is not None:
+        try:
+            return [certificate.get_info() for certificate in get_chain() or []]
+        except (ssl.SSLError, ValueError, AttributeError):
+            pass
+    peer = ssl_object.getpeercert()
+    return [peer] if peer else []
+
+
+def describe_handshake(ssl_object, peer, verified, source, verify_error=None):
+    """The record kept for one completed handshake."""
+    cipher = ssl_object.cipher()
+    return {
+        'ip': peer[0],
+        'port': peer[1],
+        'protocol': ssl_object.version(),
+        'cipher': cipher[0] if cipher else None,
+        'cipher_bits': cipher[2] if cipher else None,
+        'chain': peer_chain(ssl_object),
+        'verified': verified, # True/False, or None when the handshake did not verify
+        'verify_error': verify_error,
+        'source': source,
+    }
+
+
+class HandshakeStore:
+    """
+    Handshake records by (server name, port), kept for `ttl` seconds. A
+    record that knows whether the certificate verified is not replaced by a
+    newer one that does not.
+    """
+
+    def __init__(self, ttl=HANDSHAKE_TTL, max_entries=HANDSHAKE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = collections.OrderedDict() # (server name, port) -> (expires_at, record)
+        self._lock = threading.Lock()
+
+    def record(self, server_name, port, handshake):
+        key = (str(server_name).lower().rstrip('.'), int(port))
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if (entry is not None and entry[0] > now and entry[1]['verified'] is not None
+                    and handshake['verified'] is None):
+                return
+            self._entries[key] = (now + self.ttl, handshake)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get(self, server_name, port):
+        """The freshest handshake with server_name:port, or None."""
+        key = (str(server_name).lower().rstrip('.'), int(port))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= time.monotonic():
+                return None
+            return entry[1]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_store = HandshakeStore()
+
+
+def get_handshakes():
+    """The process-wide HandshakeStore."""
+    return _store
+
+
+def _capturing_ssl_wrap(wrap):
+    def capture(sock, *args, **kwargs):
+        server_name = kwargs.get('server_hostname')
+        try:
+            peer = sock.getpeername()
+        except OSError:
+            peer = None
+        try:
+            wrapped = wrap(sock, *args, **kwargs)
+        except ssl.SSLCertVerificationError as e:
+            if peer is not None:
+                _store.record(server_name or peer[0], peer[1], {
+                    'ip': peer[0], 'port': peer[1], 'protocol': None, 'cipher': None, 'cipher_bits': None,
+                    'chain': [], 'verified': False, 'verify_error': e.verify_message, 'source': SOURCE_HTTP,
+                })
+            raise
+        if peer is not None and isinstance(wrapped.socket, ssl.SSLSocket):
+            _store.record(server_name or peer[0], peer[1],
+                          describe_handshake(wrapped.socket, peer, bool(wrapped.is_verified), SOURCE_HTTP))
+        return wrapped
+
+    capture.captures_handshakes = True
+    return capture
+
+
+def install_urllib3_capture():
+    """
+    Records the handshakes of urllib3's HTTPS connections (urllib3 2.x; a
+    no-op on other versions). Call after install_urllib3_timing, which
+    replaces the same function.
+    """
+    wrap = getattr(urllib3.connection, '_ssl_wrap_socket_and_match_hostname', None)
+    if wrap is not None and not getattr(wrap, 'captures_handshakes', False):
+        urllib3.connection._ssl_wrap_socket_and_match_hostname = _capturing_ssl_wrap(wrap)
@@ -1,7 +1,7 @@
-from .utils import make_request
+from .context import get_context
 
-def check_security_headers(url):
-    """Checks for common security headers."""
+def check_security_headers(url, context=None):
+    """Checks for common security headers. Reuses the baseline response in `context` if given."""
     headers_found = {
         'x-frame-options': False, # Prevents clickjacking
         'strict-transport-security': False, # HSTS - forces HTTPS
@@ -9,11 +9,11 @@ def check_security_headers(url):
         'x-content-type-options': False, # Prevents MIME type sniffing (often 'nosniff')
         'x-xss-protection': False # Deprecated by CSP, but still sometimes present
     }
-    response = make_request(url)
-    if not response:
+    context = get_context(url, context)
+    if not context.response:
         return {hdr: 'Error requesting URL' for hdr in headers_found}
 
-    resp_headers = {k.lower(): v for k, v in response.headers.items()} # Case-insensitive check
+    resp_headers = context.headers # Keys already lower-cased for a case-insensitive check
 
     if 'x-frame-options' in resp_headers:
         headers_found['x-frame-options'] = True # Value could be DENY, SAMEORIGIN
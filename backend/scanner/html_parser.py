@@ -0,0 +1,217 @@
+# backend/scanner/html_parser.py
+# Shared HTML parsing layer. Every check pulls the same few things out of a
+# page (forms and their fields, links, inline scripts), so bodies are parsed
+# with lxml directly and only those elements are visited; no BeautifulSoup
+# tree is built. Bodies larger than MAX_PARSE_BYTES are cut off first.
+
+import logging
+import os
+import threading
+import time
+from urllib.parse import urljoin
+
+from lxml import etree
+
+from .timing import span, record_phase
+
+logger = logging.getLogger(__name__)
+
+MAX_PARSE_BYTES = int(os.environ.get('MAX_PARSE_BYTES', 2 * 1024 * 1024))
+MAX_LINKS_PER_PAGE = 500
+
+LINK_ATTRIBUTES = {'a': 'href', 'area': 'href', 'frame': 'src', 'iframe': 'src'}
+FORM_FIELD_TAGS = ('input', 'textarea', 'select')
+
+_local = threading.local()
+
+
+def _html_parser(encoding):
+    # lxml parsers must not be shared between threads; keep one per thread and encoding
+    parsers = getattr(_local, 'parsers', None)
+    if parsers is None:
+        parsers = _local.parsers = {}
+    parser = parsers.get(encoding)
+    if parser is None:
+        parser = parsers[encoding] = etree.HTMLParser(encoding=encoding, recover=True, no_network=True,
+                                                      remove_comments=True, remove_pis=True)
+    return parser
+
+
+def parse_html(body, encoding=None):
+    """
+    Parses a body (bytes or str) into an lxml element tree, or None if there
+    is nothing to parse. Only the first MAX_PARSE_BYTES are parsed. Without
+    an encoding, lxml takes it from the page's <meta> tag (UTF-8 otherwise).
+    """
+    if not body:
+        return None
+    if len(body) > MAX_PARSE_BYTES:
+        body = body[:MAX_PARSE_BYTES]
+    if isinstance(body, str):
+        encoding = None # Already decoded
+    try:
+        with span('parse'):
+            return etree.fromstring(body, _html_parser(encoding or None))
+    except (etree.LxmlError, ValueError, LookupError) as e:
+        logger.debug("Error parsing HTML: %s", e)
+        return None
+
+
+def declared_encoding(response):
+    """The charset named in a response's Content-Type header, or None."""
+    content_type = response.headers.get('Content-Type', '')
+    for part in content_type.split(';')[1:]:
+        name, _, value = part.partition('=')
+        if name.strip().lower() == 'charset' and value.strip():
+            return value.strip().strip('"\'')
+    return None
+
+
+def _form(element, base_url):
+    action = element.get('action')
+    return {
+        'action': urljoin(base_url, action) if action else base_url,
+        'method': (element.get('method') or 'get').upper(), # Default to GET if not specified
+        'inputs': []
+    }
+
+
+def _field(element):
+    """A form field as {'name', 'type', 'value'}; textarea and select values need the whole element."""
+    tag = element.tag.lower()
+    if tag == 'textarea':
+        return {'name': element.get('name'), 'type': 'textarea', 'value': element.text or ''}
+    if tag == 'select':
+        option = next(element.iter('option'), None)
+        value = '' if option is None else option.get('value', option.text or '')
+        return {'name': element.get('name'), 'type': 'select', 'value': value}
+    return {'name': element.get('name'), 'type': (element.get('type') or 'text').lower(), 'value': element.get('value', '')}
+
+
+def _base_url(root, base_url):
+    base = next(root.iter('base'), None)
+    if base is not None and base.get('href'):
+        return urljoin(base_url, base.get('href'))
+    return base_url
+
+
+def extract_forms(root, base_url):
+    """Every <form> with an absolute 'action', an upper-case 'method' and its 'inputs'."""
+    base_url = _base_url(root, base_url)
+    forms = []
+    for element in root.iter('form'):
+        form = _form(element, base_url)
+        form['inputs'] = [_field(field) for field in element.iter(*FORM_FIELD_TAGS)]
+        forms.append(form)
+    return forms
+
+
+def extract_links(root, base_url, limit=MAX_LINKS_PER_PAGE):
+    """Absolute URLs of a/area hrefs and frame/iframe srcs, in document order."""
+    base_url = _base_url(root, base_url)
+    links = []
+    for element in root.iter(*LINK_ATTRIBUTES):
+        value = element.get(LINK_ATTRIBUTES[element.tag])
+        if value:
+            links.append(urljoin(base_url, value.strip()))
+            if len(links) >= limit:
+                break
+    return links
+
+
+def extract_scripts(root):
+    """Text of every inline <script>."""
+    return [element.text for element in root.iter('script') if element.text]
+
+
+def parse_page(body, base_url, encoding=None):
+    """
+    One parse of a page, reduced to what the checks use:
+    {'forms', 'links', 'scripts'}. The tree itself is not kept.
+    """
+    root = parse_html(body, encoding)
+    if root is None:
+        return {'forms': [], 'links': [], 'scripts': []}
+    return {
+        'forms': extract_forms(root, base_url),
+        'links': extract_links(root, base_url),
+        'scripts': extract_scripts(root),
+    }
+
+
+def reflection_context(body, marker, encoding=None):
+    """
+    Where a marker landed in a page: 'script' inside an inline script,
+    'attribute' inside an event handler or javascript: URL, 'html'
+    anywhere else, or 'raw' if the body could not be parsed.
+    """
+    root = parse_html(body, encoding)
+    if root is None:
+        return 'raw'
+    if root.xpath('boolean(//script[contains(., $marker)])', marker=marker):
+        return 'script'
+    for value in root.xpath('//@*[contains(., $marker)]', marker=marker):
+        if value.attrname.lower().startswith('on') or value.strip().lower().startswith('javascript:'):
+            return 'attribute'
+    return 'html' # Reflected unescaped as markup/text
+
+
+class StreamingPageParser:
+    """
+    Incremental version of parse_page for bodies still downloading: feed()
+    it chunks as they arrive and it collects links and forms in the same
+    shape. Finished elements are cleared as it goes, so memory stays flat.
+    Time spent parsing is recorded as one 'parse' span on close().
+    """
+
+    def __init__(self, base_url, max_links=MAX_LINKS_PER_PAGE):
+        self.base_url = base_url
+        self.max_links = max_links
+        self.links = []
+        self.forms = []
+        self._form = None
+        self._parser = etree.HTMLPullParser(events=('start', 'end'), no_network=True)
+        self.parse_seconds = 0.0
+
+    def feed(self, chunk):
+        started = time.monotonic()
+        self._parser.feed(chunk)
+        self._drain()
+        self.parse_seconds += time.monotonic() - started
+
+    def close(self):
+        started = time.monotonic()
+        try:
+            self._parser.close()
+        except etree.LxmlError:
+            pass # Truncated or broken markup; keep what was parsed
+        self._drain()
+        self.parse_seconds += time.monotonic() - started
+        record_phase('parse', self.parse_seconds)
+
+    def _drain(self):
+        for event, element in self._parser.read_events():
+            if not isinstance(element.tag, str):
+                continue # Comments and processing instructions
+            tag = element.tag.lower()
+            if event == 'start':
+                if tag in LINK_ATTRIBUTES:
+                    value = element.get(LINK_ATTRIBUTES[tag])
+                    if value and len(self.links) < self.max_links:
+                        self.links.append(urljoin(self.base_url, value.strip()))
+                elif tag == 'base' and element.get('href'):
+                    self.base_url = urljoin(self.base_url, element.get('href'))
+                elif tag == 'form':
+                    self._form = _form(element, self.base_url)
+                    self.forms.append(self._form)
+                elif tag == 'input' and self._form is not None:
+                    self._form['inputs'].append(_field(element))
+                continue
+
+            # End events: textarea text and select options are only known now
+            if tag in ('textarea', 'select') and self._form is not None:
+                self._form['inputs'].append(_field(element))
+            elif tag == 'form':
+                self._form = None
+            if tag not in ('option', 'optgroup'):
+                element.clear() # A select still needs its options until it ends
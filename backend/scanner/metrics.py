@@ -0,0 +1,182 @@
+# backend/scanner/metrics.py
+# Minimal in-process metrics registry (counters, gauges, histograms and
+# sliding-window summaries with labels), rendered in the Prometheus text
+# exposition format for the /metrics endpoint. Kept dependency-free so the
+# scanner modules can record into it from any thread.
+
+import bisect
+import collections
+import threading
+
+# Histogram buckets in seconds, from a cached DNS answer to a full scan
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+SUMMARY_QUANTILES = (0.5, 0.9, 0.95, 0.99)
+SUMMARY_WINDOW = 1024 # Most recent observations kept per label set
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _label_text(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labels=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+        self._values = {} # label values tuple -> state
+        (registry if registry is not None else REGISTRY).register(self)
+
+    def _key(self, labels):
+        if set(labels) != set(self.label_names):
+            raise ValueError(f"{self.name} takes labels {self.label_names}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def _samples(self):
+        raise NotImplementedError
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        with self._lock:
+            lines.extend(f'{name}{labels} {_format_value(value)}' for name, labels, value in self._samples())
+        return '\n'.join(lines)
+
+
+class Counter(_Metric):
+    """Monotonically increasing count, e.g. requests sent."""
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def _samples(self):
+        for key, value in sorted(self._values.items()):
+            yield f'{self.name}_total', _label_text(self.label_names, key), value
+
+
+class Gauge(_Metric):
+    """Value that goes up and down, e.g. scans in flight."""
+    kind = 'gauge'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def _samples(self):
+        for key, value in sorted(self._values.items()):
+            yield self.name, _label_text(self.label_names, key), value
+
+
+class Histogram(_Metric):
+    """Cumulative bucket counts plus sum and count of observed values."""
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS, registry=None):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labels, registry)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                state['buckets'][index] += 1
+            state['sum'] += value
+            state['count'] += 1
+
+    def _samples(self):
+        for key, state in sorted(self._values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, state['buckets']):
+                cumulative += count
+                yield f'{self.name}_bucket', _label_text(self.label_names, key, [('le', _format_value(bound))]), cumulative
+            yield f'{self.name}_bucket', _label_text(self.label_names, key, [('le', '+Inf')]), state['count']
+            yield f'{self.name}_sum', _label_text(self.label_names, key), state['sum']
+            yield f'{self.name}_count', _label_text(self.label_names, key), state['count']
+
+
+class Summary(_Metric):
+    """Quantiles over the most recent SUMMARY_WINDOW observations, plus all-time sum and count."""
+    kind = 'summary'
+
+    def __init__(self, name, documentation, labels=(), quantiles=SUMMARY_QUANTILES, window=SUMMARY_WINDOW,
+                 registry=None):
+        self.quantiles = tuple(quantiles)
+        self.window = window
+        super().__init__(name, documentation, labels, registry)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {'recent': collections.deque(maxlen=self.window), 'sum': 0.0, 'count': 0}
+            state['recent'].append(value)
+            state['sum'] += value
+            state['count'] += 1
+
+    def _samples(self):
+        for key, state in sorted(self._values.items()):
+            recent = sorted(state['recent'])
+            for quantile in self.quantiles:
+                value = recent[min(len(recent) - 1, int(quantile * len(recent)))]
+                yield self.name, _label_text(self.label_names, key, [('quantile', quantile)]), value
+            yield f'{self.name}_sum', _label_text(self.label_names, key), state['sum']
+            yield f'{self.name}_count', _label_text(self.label_names, key), state['count']
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            if any(existing.name == metric.name for existing in self._metrics):
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics.append(metric)
+
+    def render(self):
+        """Every registered metric in the Prometheus text format (version 0.0.4)."""
+        with self._lock:
+            metrics = list(self._metrics)
+        return '\n'.join(metric.render() for metric in metrics) + '\n'
+
+
+REGISTRY = Registry()
+
+# Content-Type of render()'s output
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
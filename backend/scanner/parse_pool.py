@@ -0,0 +1,123 @@
+# backend/scanner/parse_pool.py
+# Worker processes for CPU-bound parsing and analysis. Parsing pages and
+# matching signatures is pure Python (or holds the GIL), so under load it
+# starves the threads doing network I/O. run_parse() hands such a task to a
+# process pool instead: the body goes over as bytes and only the compact
+# result (forms and links, a fingerprint, a match) comes back. Small bodies,
+# and any task that finds the queue full or the pool broken, run inline.
+# Spawned workers re-import the parent's main script as __mp_main__, so a
+# script that enables the pool keeps its process-wide setup (logging, the
+# database, threads) out of that path, as app.py does.
+
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from .metrics import Counter
+from .timing import record_phase
+
+logger = logging.getLogger(__name__)
+
+_cpus = os.cpu_count() or 1
+
+PARSE_POOL_SETTINGS = {
+    # Worker processes; 0 runs every task inline
+    'workers': int(os.environ.get('PARSE_WORKERS', _cpus if _cpus > 1 else 0)),
+    # Tasks queued or running in the pool at once; further tasks run inline
+    'queue_size': int(os.environ.get('PARSE_QUEUE_SIZE', 4 * _cpus)),
+    # Bodies shorter than this are handled inline: shipping them costs more than parsing them
+    'inline_below': int(os.environ.get('PARSE_INLINE_BELOW', 16 * 1024)),
+}
+
+PARSE_TASKS = Counter('scanner_parse_tasks', 'Parse and analysis tasks by where they ran (pool, inline, fallback).',
+                      labels=('where',))
+
+
+class ParsePool:
+    """
+    A lazily started ProcessPoolExecutor with a bounded number of tasks in
+    flight. Workers are spawned, not forked, so they never inherit a lock
+    held by one of the parent's threads.
+    """
+
+    def __init__(self, workers, queue_size, inline_below):
+        self.workers = workers
+        self.inline_below = inline_below
+        self._slots = threading.BoundedSemaphore(max(queue_size, 1))
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                     mp_context=multiprocessing.get_context('spawn'))
+            return self._executor
+
+    def _discard(self, executor):
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def run(self, func, body, *args):
+        """
+        func(body, *args), in a worker process when the pool is enabled, the
+        body is at least inline_below bytes and a queue slot is free; inline
+        otherwise. func must be a module-level function and its arguments
+        and result must pickle. Exceptions raised by func propagate.
+        """
+        if not self.workers or len(body or b'') < self.inline_below:
+            PARSE_TASKS.inc(where='inline')
+            return func(body, *args)
+        if not self._slots.acquire(blocking=False):
+            PARSE_TASKS.inc(where='fallback') # Queue full: parsing here beats waiting
+            return func(body, *args)
+        try:
+            executor = self._get_executor()
+            started = time.monotonic()
+            try:
+                result = executor.submit(func, body, *args).result()
+            except BrokenProcessPool as e:
+                logger.warning("Parse worker pool broke (%s); restarting it and parsing inline", e)
+                self._discard(executor)
+                PARSE_TASKS.inc(where='fallback')
+                return func(body, *args)
+            except RuntimeError: # Shut down underneath us (reconfigured, or the interpreter is exiting)
+                PARSE_TASKS.inc(where='fallback')
+                return func(body, *args)
+            # The worker's own spans stay in the worker; count the round trip here
+            record_phase('parse', time.monotonic() - started)
+            PARSE_TASKS.inc(where='pool')
+            return result
+        finally:
+            self._slots.release()
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+
+_pool = ParsePool(**PARSE_POOL_SETTINGS)
+
+
+def run_parse(func, body, *args):
+    """Runs func(body, *args) on the shared parse pool (see ParsePool.run)."""
+    return _pool.run(func, body, *args)
+
+
+def configure_parse_pool(**settings):
+    """Updates PARSE_POOL_SETTINGS (workers, queue_size, inline_below) and replaces the shared pool."""
+    global _pool
+    unknown = set(settings) - set(PARSE_POOL_SETTINGS)
+    if unknown:
+        raise ValueError(f"Unknown parse pool settings: {', '.join(sorted(unknown))}")
+    PARSE_POOL_SETTINGS.update(settings)
+    old_pool, _pool = _pool, ParsePool(**PARSE_POOL_SETTINGS)
+    old_pool.shutdown()
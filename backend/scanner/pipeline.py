@@ -0,0 +1,323 @@
+import asyncio
+import functools
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .context import ScanContext
+from .header_scanner import check_security_headers
+from .port_scanner import check_common_ports_async, PORT_UNSCANNED
+from .sqli_scanner import check_sqli_potential
+from .xss_scanner import check_xss_potential
+from .crawler import check_crawl
+from .tls_scanner import check_tls
+from .utils import check_deadline
+from . import timing
+
+logger = logging.getLogger(__name__)
+
+# Time budget for each check of one target, in seconds, counted from when the check starts running
+SCAN_DEADLINE = float(os.environ.get('SCAN_DEADLINE', 60))
+
+# Every check, in the order results are reported
+CHECKS = ("headers", "ports", "sqli", "xss")
+
+# Checks that only run when asked for by name
+OPTIONAL_CHECKS = ("crawl", "tls")
+
+# Checks that block (requests) and so run on the check pool; the port sweep runs natively on the event loop
+THREADED_CHECKS = tuple(name for name in CHECKS + OPTIONAL_CHECKS if name != "ports")
+
+PIPELINE_SETTINGS = {
+    # Scans expected to run at once (job workers, batch slots, direct requests); sizes the check pool
+    'scan_concurrency': int(os.environ.get('SCAN_CONCURRENCY', 8)),
+}
+
+
+def _new_executor():
+    # Room for every threaded check of every concurrent scan, so a check rarely queues. A
+    # dedicated pool (instead of the loop's default executor) means a check that overruns
+    # its deadline is abandoned rather than waited for when the loop closes.
+    return ThreadPoolExecutor(max_workers=PIPELINE_SETTINGS['scan_concurrency'] * len(THREADED_CHECKS),
+                              thread_name_prefix='scan-check')
+
+
+_http_executor = _new_executor()
+
+
+def configure_pipeline(**settings):
+    """Updates PIPELINE_SETTINGS (scan_concurrency) and replaces the check pool; running checks finish on the old one."""
+    global _http_executor
+    unknown = set(settings) - set(PIPELINE_SETTINGS)
+    if unknown:
+        raise ValueError(f"Unknown pipeline settings: {', '.join(sorted(unknown))}")
+    PIPELINE_SETTINGS.update(settings)
+    old_executor, _http_executor = _http_executor, _new_executor()
+    old_executor.shutdown(wait=False)
+
+
+# Error key used in the response for each check
+CHECK_ERROR_KEYS = {
+    "headers": "HeaderError",
+    "ports": "PortScanError",
+    "sqli": "SQLiError",
+    "xss": "XSSError",
+    "crawl": "CrawlError",
+    "tls": "TLSError",
+}
+
+
+def normalize_checks(checks=None):
+    """
+    Validates a requested check set (names from CHECKS or OPTIONAL_CHECKS,
+    any order, or None for all of CHECKS) and returns it as a tuple in that
+    order. Raises ValueError for unknown names.
+    """
+    if not checks:
+        return CHECKS
+    known = CHECKS + OPTIONAL_CHECKS
+    unknown = set(checks) - set(known)
+    if unknown:
+        raise ValueError(f"Unknown checks: {', '.join(sorted(unknown))}; use any of: {', '.join(known)}")
+    return tuple(name for name in known if name in checks)
+
+
+def check_failed(check_result):
+    """True if a check's return value reports an error or is incomplete (such results are never cached)."""
+    if not isinstance(check_result, dict):
+        return True
+    if check_result.get("error") or check_result.get("error_message"):
+        return True
+    return any(p.get("state") == PORT_UNSCANNED for p in check_result.get("port_details") or [])
+
+
+def merge_check_result(name, check_result, results, errors):
+    """Folds one check's return value into the response `results`/`errors` dicts."""
+    if name == "headers":
+        results.update(check_result)
+    elif name == "ports":
+        if isinstance(check_result, dict):
+            check_result = dict(check_result)
+            if check_result.get("error"):
+                errors["PortScanError"] = check_result.pop("error")
+            results.update(check_result)
+        else:
+            errors["PortScanFormat"] = "Unexpected port scan result format"
+    elif name == "sqli":
+        results["SQL Injection Test"] = check_result.get("SQL Injection Test", False)
+        results["sqli_details"] = check_result.get("sqli_details", [])
+        results["sqli_findings"] = check_result.get("sqli_findings", [])
+        if check_result.get("error_message"):
+            errors["SQLiError"] = check_result["error_message"]
+    elif name == "xss":
+        results["XSS Test"] = check_result.get("XSS Test", False)
+        results["xss_details"] = check_result.get("xss_details") # Assuming xss returns details string
+        if check_result.get("error_message"):
+            errors["XSSError"] = check_result["error_message"]
+    elif name == "crawl":
+        results["Crawl Test"] = check_result.get("Crawl Test", False)
+        results["crawl_details"] = check_result.get("crawl_details")
+        results["crawl_findings"] = check_result.get("crawl_findings", [])
+        if check_result.get("error_message"):
+            errors["CrawlError"] = check_result["error_message"]
+    elif name == "tls":
+        results["TLS Test"] = check_result.get("TLS Test", False)
+        results["tls_details"] = check_result.get("tls_details")
+        results["tls_findings"] = check_result.get("tls_findings", [])
+        if check_result.get("error_message"):
+            errors["TLSError"] = check_result["error_message"]
+
+
+def check_events(name, results):
+    """
+    Streaming events for a finished check, as (event, data) pairs. Data uses
+    the same keys as the final results, one item per form or finding.
+    """
+    if name == "headers":
+        yield "headers", {key: value for key, value in results.items() if key.startswith("Header of")}
+    elif name == "ports":
+        yield "ports", {"Scan Ports": results.get("Scan Ports", []), "ip_address": results.get("ip_address"),
+                        "services": results.get("services", [])}
+    elif name == "sqli":
+        for form in results.get("sqli_details") or []:
+            yield "sqli_form", form
+        for finding in results.get("sqli_findings") or []:
+            yield "sqli_finding", finding
+        yield "sqli", {"SQL Injection Test": results.get("SQL Injection Test", False)}
+    elif name == "xss":
+        for finding in results.get("xss_details") or []:
+            yield "xss_finding", finding
+        yield "xss", {"XSS Test": results.get("XSS Test", False)}
+    elif name == "crawl":
+        for finding in results.get("crawl_findings") or []:
+            yield "crawl_finding", finding
+        yield "crawl", {"Crawl Test": results.get("Crawl Test", False),
+                        "pages_crawled": (results.get("crawl_details") or {}).get("pages_crawled", 0)}
+    elif name == "tls":
+        for finding in results.get("tls_findings") or []:
+            yield "tls_finding", finding
+        details = results.get("tls_details") or {}
+        yield "tls", {"TLS Test": results.get("TLS Test", False), "protocol": details.get("protocol"),
+                      "certificate_source": details.get("certificate_source")}
+
+
+async def run_checks_async(target_url, deadline=None, on_result=None, on_event=None,
+                           checks=None, cache=None, force=False, context=None):
+    """
+    Runs the header, port, SQLi and XSS checks (or the subset named in
+    `checks`, which may also add the optional crawl stage) for one target
+    concurrently.
+
+    Every check gets the same ScanContext, so the baseline page is still
+    fetched once. on_result(name, results, errors) is called as each check
+    finishes, and on_event(event, data) receives the check_events of each
+    check plus a "port" event per open port and a "check_error" event per
+    failure. A check that raises or misses the deadline is recorded in
+    errors without losing the other results. Returns (results, errors) in
+    the shape handle_scan has always returned.
+
+    Each check has `deadline` seconds from when it starts running; time a
+    threaded check spends queued for the check pool does not count. Its
+    requests run under check_deadline, so a check abandoned at the deadline
+    stops rather than keeping its pool thread busy.
+
+    With a `cache` (get(url, name) / put(url, name, check_result)), checks
+    with a fresh cached result are not run; a "cached" event names each one.
+    Successful results are stored back. `force` skips the lookups but still
+    refreshes the cache. A ScanContext may be passed in so the caller can
+    inspect the baseline response afterwards.
+
+    Each check's wall time and failures are recorded through scanner.timing,
+    into the scan's ScanTimings if the caller is collecting one.
+    """
+    deadline = SCAN_DEADLINE if deadline is None else deadline
+    checks = normalize_checks(checks)
+    loop = asyncio.get_running_loop()
+    context = context if context is not None else ScanContext(target_url)
+    results = {"Check if the link is valid or not": True} # If validation passed, it's valid structurally
+    errors = {}
+
+    def emit(event, data):
+        if on_event:
+            on_event(event, data)
+
+    def on_port(port_state):
+        if port_state["state"] == "open":
+            emit("port", port_state)
+
+    async def in_thread(name, check):
+        started = loop.create_future()
+
+        def call():
+            started_at[name] = time.monotonic()
+            loop.call_soon_threadsafe(_resolve, started)
+            with check_deadline(started_at[name] + deadline):
+                check_result = check(target_url, context=context)
+            # Read here, not on the loop: context.response blocks while the baseline fetch is running
+            page_fetched[name] = context.response is not None
+            return check_result
+
+        # bind() carries the scan's timing collector (and the check deadline) into the worker thread
+        future = loop.run_in_executor(_http_executor, timing.bind(call))
+        await asyncio.wait({started, future}, return_when=asyncio.FIRST_COMPLETED)
+        if not future.done():
+            # The deadline runs from when a pool thread picked the check up, not from when it was queued
+            await _within(future, started_at[name] + deadline - time.monotonic())
+        return future.result()
+
+    async def on_loop(awaitable):
+        task = asyncio.ensure_future(awaitable)
+        await _within(task, deadline)
+        return task.result()
+
+    def start(name):
+        if name == "ports":
+            return on_loop(check_common_ports_async(target_url, on_port=on_port if on_event else None))
+        if name == "crawl":
+            # Stops starting new pages a little before the check deadline
+            return in_thread(name, functools.partial(check_crawl, time_budget=deadline * 0.8))
+        return in_thread(name, {"headers": check_security_headers, "sqli": check_sqli_potential,
+                                "xss": check_xss_potential, "tls": check_tls}[name])
+
+    def finish(name, check_result):
+        merge_check_result(name, check_result, results, errors)
+        for event, data in check_events(name, results):
+            emit(event, data)
+
+    tasks = {}
+    started_at = {}
+    page_fetched = {} # Threaded check name -> whether the baseline page could be fetched
+    for name in checks:
+        cached = cache.get(target_url, name) if cache is not None and not force else None
+        if cached is not None:
+            # Served from an earlier scan; the target is not contacted for this check
+            emit("cached", {"check": name})
+            finish(name, cached)
+            if on_result:
+                on_result(name, results, errors)
+        else:
+            started_at[name] = time.monotonic() # Moved to when a pool thread picks a threaded check up
+            tasks[asyncio.ensure_future(start(name))] = name
+
+    all_ok = True
+    pending = set(tasks)
+    while pending:
+        # Every task enforces its own check's deadline
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            name = tasks[task]
+            timing.record_check(name, time.monotonic() - started_at[name])
+            errors_before = dict(errors)
+            try:
+                check_result = task.result()
+                finish(name, check_result)
+                # HTTP checks of a page that could not be fetched are not worth remembering
+                fetched = name == "ports" or page_fetched.get(name, False)
+                if cache is not None and fetched and not check_failed(check_result):
+                    cache.put(target_url, name, check_result)
+                for key in errors:
+                    if key not in errors_before:
+                        timing.record_check_error(name, key) # Error reported by the check itself
+            except DeadlineMissed:
+                timing.record_check_error(name, "Timeout")
+                errors[CHECK_ERROR_KEYS[name]] = f"Check did not finish within {deadline:g}s"
+                all_ok = False
+            except Exception as e:
+                logger.exception("Error during %s check for %s: %s", name, target_url, e)
+                errors[CHECK_ERROR_KEYS[name]] = str(e)
+                timing.record_check_error(name, type(e).__name__)
+                all_ok = False
+            for key, message in errors.items():
+                if errors_before.get(key) != message:
+                    emit("check_error", {key: message})
+            if on_result:
+                on_result(name, results, errors)
+
+    results["Vulnerabilities Test"] = all_ok # Mark as Fail if any check crashed or timed out
+    return results, errors
+
+
+class DeadlineMissed(Exception):
+    """A check did not finish within its deadline and was abandoned."""
+
+
+async def _within(future, timeout):
+    """Waits up to timeout for future; cancels it and raises DeadlineMissed if it is not done by then."""
+    done, _ = await asyncio.wait({future}, timeout=max(timeout, 0))
+    if not done:
+        future.cancel() # Stops an async check; a threaded one stops on its own (see check_deadline)
+        raise DeadlineMissed()
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(True)
+
+
+def run_checks(target_url, deadline=None, on_result=None, on_event=None, checks=None, cache=None, force=False,
+               context=None):
+    """Synchronous entry point for run_checks_async (one event loop per call)."""
+    return asyncio.run(run_checks_async(target_url, deadline=deadline, on_result=on_result,
+                                        on_event=on_event, checks=checks, cache=cache, force=force,
+                                        context=context))
@@ -1,37 +1,285 @@
+import asyncio
+import os
 import socket
-from .utils import get_domain_from_url
-
-def check_common_ports(url, ports_to_check=None, timeout=1):
-    """Checks if common web ports are open on the target domain."""
-    if ports_to_check is None:
-         # ports_to_check = [80, 443, 8080, 21, 22, 23, 25, 53, 110] # Example common ports
-         ports_to_check = [80, 443, 8080, 21, 22, 23, 25, 53, 110] # Start simple, based on example/common use
-         # The example screenshot showed just port 80 for pinterest.com.
-         # You could make this configurable or focus on the most relevant ones.
-
-    domain = get_domain_from_url(url)
-    if not domain:
-        return {"open_ports": [], "error": "Invalid domain"}
-
-    open_ports = []
-    results = {}
+import time
+from .utils import get_hostname_from_url
+from .resolver import get_resolver, pick_address
+from .banner_scanner import grab_service, BANNER_TIMEOUT
+from .timing import span
+from .scheduler import get_scheduler, KIND_CONNECT
+
+# Ordered by how often the service shows up on web-facing hosts.
+COMMON_PORTS = [
+    80, 443, 8080, 21, 22, 23, 25, 53, 110, 111, 135, 139, 143, 445, 993, 995,
+    1723, 3306, 3389, 5900, 8443, 8000, 8008, 8081, 8888, 1433, 1521, 2049,
+    2082, 2083, 2086, 2087, 3000, 5000, 5432, 5601, 6379, 7001, 8009, 8181,
+    9000, 9090, 9200, 9300, 11211, 27017, 465, 587, 389, 636, 88, 119, 123,
+    161, 179, 199, 427, 513, 514, 515, 548, 554, 631, 873, 990, 1025, 1080,
+    1194, 1900, 2000, 2121, 2375, 2376, 3128, 4443, 4444, 5060, 5222, 5353,
+    5984, 6000, 6443, 7000, 7443, 8001, 8002, 8010, 8082, 8088, 8089, 8090,
+    8444, 8880, 9001, 9043, 9080, 9443, 10000, 10443,
+]
+
+DEFAULT_PORTS = [80, 443, 8080, 21, 22, 23, 25, 53, 110]
+
+PORT_OPEN = 'open'
+PORT_CLOSED = 'closed'
+PORT_FILTERED = 'filtered'
+PORT_UNSCANNED = 'unscanned' # Deadline hit before the port was tried
+
+# Sweep every address a host resolves to (IPv4 and IPv6) instead of just one
+PORT_SCAN_ALL_ADDRESSES = os.environ.get('PORT_SCAN_ALL_ADDRESSES', '').lower() in ('1', 'true', 'yes')
+# Read banners / send service probes on open ports before closing them (see banner_scanner.py)
+PORT_SCAN_FINGERPRINT = os.environ.get('PORT_SCAN_FINGERPRINT', 'true').lower() in ('1', 'true', 'yes')
+
+
+def parse_port_spec(spec):
+    """
+    Turns a port specification into an ordered, de-duplicated list of ports.
+    Accepts a list of ints, or a string such as "80,443,8000-8100",
+    "1-65535" or "top-1000". "top-N" takes COMMON_PORTS first and then
+    fills up in ascending port order.
+    """
+    if spec is None:
+        return list(DEFAULT_PORTS)
+    if isinstance(spec, (list, tuple, set)):
+        items = [str(p) for p in spec]
+    else:
+        items = [part.strip() for part in str(spec).split(',')]
+
+    ports = []
+    seen = set()
+
+    def add(port):
+        if 1 <= port <= 65535 and port not in seen:
+            seen.add(port)
+            ports.append(port)
+
+    for item in items:
+        if not item:
+            continue
+        if item.lower().startswith('top-'):
+            count = min(int(item[4:]), 65535)
+            for port in COMMON_PORTS[:count]:
+                add(port)
+            next_port = 1
+            while len(seen) < count and next_port <= 65535:
+                add(next_port)
+                next_port += 1
+        elif '-' in item:
+            start, end = (int(x) for x in item.split('-', 1))
+            for port in range(start, end + 1):
+                add(port)
+        else:
+            add(int(item))
+    return ports
+
+
+async def _probe_port(ip_address, port, timeout, family, fingerprint_timeout=None, end_time=None,
+                      server_hostname=None):
+    """
+    Attempts a single TCP connect. Returns (state, latency_ms, service).
+    With a fingerprint_timeout, an open connection is used to identify the
+    service (see grab_service, which sends server_hostname as the TLS
+    server name and HTTP Host), finishing by end_time (loop time) if given,
+    before it is closed; service is None otherwise.
+    """
+    started = time.monotonic()
+    try:
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(ip_address, port, family=family), timeout
+        )
+    except asyncio.TimeoutError:
+        return PORT_FILTERED, None, None
+    except ConnectionRefusedError:
+        return PORT_CLOSED, round((time.monotonic() - started) * 1000, 2), None
+    except OSError:
+        # Host/network unreachable and similar: treat as filtered
+        return PORT_FILTERED, None, None
+    latency_ms = round((time.monotonic() - started) * 1000, 2)
+    service = None
+    if fingerprint_timeout:
+        if end_time is not None:
+            fingerprint_timeout = min(fingerprint_timeout, end_time - asyncio.get_running_loop().time())
+        if fingerprint_timeout > 0:
+            # Same connection as the sweep, so fingerprinting costs no second connect
+            service = await grab_service(reader, writer, server_hostname or ip_address, port,
+                                         timeout=fingerprint_timeout)
+    writer.close()
     try:
-        ip_address = socket.gethostbyname(domain) # Resolve domain to IP
-        results['ip_address'] = ip_address # Good info to have
-        for port in ports_to_check:
-            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            sock.settimeout(timeout)
-            result_code = sock.connect_ex((ip_address, port)) # connect_ex returns 0 on success
-            if result_code == 0:
-                open_ports.append(port)
-            sock.close()
-        results['open_ports'] = open_ports
+        await writer.wait_closed()
+    except OSError:
+        pass
+    return PORT_OPEN, latency_ms, service
+
+
+async def scan_ports_async(ip_address, ports, timeout=1, max_in_flight=200,
+                           rate_limit=None, deadline=None, on_port=None, fingerprint=False,
+                           server_hostname=None):
+    """
+    Concurrently connects to every port on ip_address.
+
+    max_in_flight is the number of workers, and so caps simultaneous connects; rate_limit caps connects
+    started per second against the host (None = unlimited), and deadline
+    is the overall time budget in seconds (None = no budget). on_port, if
+    given, is called with each port's dict as soon as its state is known.
+    Returns a list of {'port', 'state', 'latency_ms'} dicts in the order
+    of `ports`. With fingerprint, open ports are kept open for up to
+    BANNER_TIMEOUT more (within the deadline) to identify their service,
+    and their dicts get a 'service' key ({'service', 'product', 'version',
+    'banner', 'probe', 'tls'}, or None if the port sent nothing);
+    server_hostname is the name used for TLS and HTTP probes. Every connect
+    also waits for a token from the outbound scheduler, keyed by
+    server_hostname (or the address); ports still waiting when the deadline
+    passes are left unscanned.
+    """
+    family = socket.AF_INET6 if ':' in ip_address else socket.AF_INET
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    end_time = started + deadline if deadline else None
+    interval = 1.0 / rate_limit if rate_limit else 0
+    states = {port: (PORT_UNSCANNED, None, None) for port in ports}
+    scheduler = get_scheduler()
+    target = server_hostname or ip_address
+    pending = enumerate(ports) # Shared by the workers; ports never taken stay unscanned
+
+    async def worker():
+        for index, port in pending:
+            if interval:
+                # Space out connect starts to honour the per-host rate limit
+                start_at = started + index * interval
+                if end_time is not None and start_at >= end_time:
+                    return # This port, and every later one, would start after the deadline
+                await asyncio.sleep(max(0, start_at - loop.time()))
+            if end_time is not None:
+                if await scheduler.acquire_async(target, KIND_CONNECT, end_time - loop.time()) is None:
+                    return
+            else:
+                await scheduler.acquire_async(target, KIND_CONNECT)
+            remaining = timeout
+            if end_time is not None:
+                remaining = min(timeout, end_time - loop.time())
+                if remaining <= 0:
+                    return
+            state, latency, service = await _probe_port(ip_address, port, remaining, family,
+                                                        BANNER_TIMEOUT if fingerprint else None, end_time,
+                                                        server_hostname)
+            if state == PORT_FILTERED and remaining < timeout:
+                # Cut short by the deadline rather than a full timeout window
+                state = PORT_UNSCANNED
+            states[port] = (state, latency, service)
+            if on_port:
+                on_port(_port_dict(port, states[port], fingerprint))
+
+    # A fixed set of workers rather than a task per port, so a full 1-65535 sweep stays cheap
+    await asyncio.gather(*(worker() for _ in range(max(1, min(max_in_flight, len(states))))))
+    return [_port_dict(port, states[port], fingerprint) for port in ports]
+
+
+def _port_dict(port, port_state, fingerprint):
+    state, latency, service = port_state
+    entry = {'port': port, 'state': state, 'latency_ms': latency}
+    if fingerprint and state == PORT_OPEN:
+        entry['service'] = service
+    return entry
+
+
+def service_summary(port_states):
+    """The identified services of open ports, one {'port', 'service', 'product', 'version', 'banner', 'tls'} per port."""
+    services = []
+    for port_state in port_states:
+        service = port_state.get('service')
+        if port_state['state'] != PORT_OPEN or not service:
+            continue
+        entry = {'port': port_state['port']}
+        if 'address' in port_state:
+            entry['address'] = port_state['address']
+        entry.update((key, service.get(key)) for key in ('service', 'product', 'version', 'banner', 'tls'))
+        services.append(entry)
+    return services
+
+
+def scan_ports(ip_address, ports, **kwargs):
+    """Synchronous wrapper around scan_ports_async."""
+    return asyncio.run(scan_ports_async(ip_address, ports, **kwargs))
+
+
+async def check_common_ports_async(url, ports_to_check=None, timeout=1, max_in_flight=200,
+                                   rate_limit=None, deadline=None, on_port=None, all_addresses=None,
+                                   fingerprint=None):
+    """
+    Async version of check_common_ports, for use inside a running event loop.
+    With all_addresses (default PORT_SCAN_ALL_ADDRESSES) every IPv4 and IPv6
+    address of the host is swept concurrently, each with its own
+    max_in_flight and rate_limit; port_details entries then carry an
+    'address' key and "Scan Ports" lists ports open on any address.
+    With fingerprint (default PORT_SCAN_FINGERPRINT) the service on each
+    open port is identified on the sweep's own connection and listed
+    under "services" (see service_summary).
+    """
+    ports = parse_port_spec(ports_to_check)
+    all_addresses = PORT_SCAN_ALL_ADDRESSES if all_addresses is None else all_addresses
+    fingerprint = PORT_SCAN_FINGERPRINT if fingerprint is None else fingerprint
+
+    host = get_hostname_from_url(url) # netloc without credentials or :port
+    if not host:
+        return {"Scan Ports": [], "error": "Invalid domain"}
+
+    try:
+        # Shared cached resolver; the lookup runs off the loop
+        with span('dns'):
+            addresses = await get_resolver().resolve_async(host)
     except socket.gaierror:
-        results['open_ports'] = []
-        results['error'] = f"Could not resolve domain: {domain}"
+        return {"Scan Ports": [], "error": f"Could not resolve domain: {host}"}
     except socket.error as e:
-        results['open_ports'] = []
-        results['error'] = f"Socket error: {e}"
+        return {"Scan Ports": [], "error": f"Socket error: {e}"}
+    if not addresses:
+        return {"Scan Ports": [], "error": f"Could not resolve domain: {host}"}
+
+    ip_address = pick_address(addresses)
+    if not all_addresses:
+        port_states = await scan_ports_async(ip_address, ports, timeout=timeout,
+                                             max_in_flight=max_in_flight, rate_limit=rate_limit,
+                                             deadline=deadline, on_port=on_port, fingerprint=fingerprint,
+                                             server_hostname=host)
+        open_ports = [p['port'] for p in port_states if p['state'] == PORT_OPEN]
+        result = {
+            "Scan Ports": open_ports, # Return list of open ports found
+            "ip_address": ip_address,
+            "port_details": port_states, # Per-port state and connect latency
+        }
+        if fingerprint:
+            result["services"] = service_summary(port_states)
+        return result
+
+    def address_callback(address):
+        if on_port is None:
+            return None
+        return lambda port_state: on_port(dict(port_state, address=address))
+
+    sweeps = await asyncio.gather(*(
+        scan_ports_async(address, ports, timeout=timeout, max_in_flight=max_in_flight,
+                         rate_limit=rate_limit, deadline=deadline, on_port=address_callback(address),
+                         fingerprint=fingerprint, server_hostname=host)
+        for address in addresses
+    ))
+    port_states = [dict(p, address=address) for address, states in zip(addresses, sweeps) for p in states]
+    open_ports = sorted({p['port'] for p in port_states if p['state'] == PORT_OPEN})
+    result = {
+        "Scan Ports": open_ports,
+        "ip_address": ip_address,
+        "ip_addresses": addresses,
+        "port_details": port_states,
+    }
+    if fingerprint:
+        result["services"] = service_summary(port_states)
+    return result
 
 
-    return {"Scan Ports": open_ports} # Return list of open ports found
\ No newline at end of file
+def check_common_ports(url, ports_to_check=None, **kwargs):
+    """
+    Checks if common web ports are open on the target domain.
+    ports_to_check may be a list or a spec string (see parse_port_spec);
+    other keyword arguments are passed on to scan_ports_async.
+    """
+    return asyncio.run(check_common_ports_async(url, ports_to_check, **kwargs))
@@ -0,0 +1,174 @@
+# backend/scanner/resolver.py
+# Shared DNS resolver. Every lookup made by the scanner (the port engine and,
+# through a hook in urllib3, every HTTP connection) goes through one cache,
+# so a host is resolved once per TTL instead of once per check and scan.
+
+import asyncio
+import collections
+import os
+import socket
+import threading
+import time
+import concurrent.futures
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import urllib3.util.connection
+
+from .timing import span
+
+# getaddrinfo does not report record TTLs, so positive answers are kept for
+# a fixed time (and failures for a shorter one)
+DNS_CACHE_TTL = float(os.environ.get('DNS_CACHE_TTL', 300))
+DNS_NEGATIVE_TTL = float(os.environ.get('DNS_NEGATIVE_TTL', 30))
+DNS_CACHE_MAX_ENTRIES = 4096
+DNS_LOOKUP_THREADS = 16 # Lookups in flight at once (getaddrinfo blocks)
+DNS_LOOKUP_TIMEOUT = float(os.environ.get('DNS_LOOKUP_TIMEOUT', 10)) # Longest a caller waits for one lookup
+
+
+class Resolver:
+    """
+    Caching getaddrinfo front end. resolve(host) returns every address of
+    the host, IPv4 and IPv6, in getaddrinfo order (duplicates removed), or
+    raises socket.gaierror. Concurrent lookups of the same host share a
+    single getaddrinfo call, from any thread or event loop.
+    """
+
+    def __init__(self, ttl=DNS_CACHE_TTL, negative_ttl=DNS_NEGATIVE_TTL, max_entries=DNS_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self._entries = collections.OrderedDict() # host -> (expires_at, addresses or gaierror)
+        self._in_flight = {} # host -> Future
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=DNS_LOOKUP_THREADS, thread_name_prefix='dns')
+        self._stats = collections.Counter()
+
+    def _lookup(self, host):
+        started = time.monotonic()
+        outcome = socket.gaierror(socket.EAI_FAIL, f"Lookup of {host} did not complete")
+        ttl = self.negative_ttl
+        try:
+            infos = socket.getaddrinfo(host, None, socket.AF_UNSPEC, socket.SOCK_STREAM)
+            outcome = list(dict.fromkeys(info[4][0] for info in infos))
+            ttl = self.ttl
+        except socket.gaierror as e:
+            outcome = e
+        except Exception as e:
+            # e.g. UnicodeError for an empty label ("a..com"); callers only expect gaierror
+            outcome = socket.gaierror(socket.EAI_NONAME, f"Invalid host name {host!r}: {e}")
+        finally:
+            # Whatever happened, everyone waiting on this lookup must be released
+            with self._lock:
+                self._stats['lookups'] += 1
+                self._stats['lookup_ms'] += (time.monotonic() - started) * 1000
+                self._entries[host] = (time.monotonic() + ttl, outcome)
+                self._entries.move_to_end(host)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                future = self._in_flight.pop(host, None)
+            if future is not None and not future.done():
+                if isinstance(outcome, Exception):
+                    future.set_exception(outcome)
+                else:
+                    future.set_result(outcome)
+
+    def lookup(self, host):
+        """Returns a concurrent.futures.Future for the host's address list."""
+        host = host.lower().rstrip('.')
+        with self._lock:
+            entry = self._entries.get(host)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(host)
+                self._stats['negative_hits' if isinstance(entry[1], Exception) else 'hits'] += 1
+                future = Future()
+                if isinstance(entry[1], Exception):
+                    future.set_exception(socket.gaierror(*entry[1].args)) # Fresh error, no stale traceback
+                else:
+                    future.set_result(entry[1])
+                return future
+            future = self._in_flight.get(host)
+            if future is not None:
+                self._stats['joined'] += 1 # Someone is already resolving this host
+                return future
+            self._stats['misses'] += 1
+            future = self._in_flight[host] = Future()
+        self._executor.submit(self._lookup, host)
+        return future
+
+    def resolve(self, host, timeout=DNS_LOOKUP_TIMEOUT):
+        """Blocking lookup; returns a list of address strings. Raises socket.gaierror, also after `timeout`."""
+        try:
+            return self.lookup(host).result(timeout)
+        except concurrent.futures.TimeoutError:
+            raise socket.gaierror(socket.EAI_AGAIN, f"Lookup of {host} timed out after {timeout}s") from None
+
+    async def resolve_async(self, host, timeout=DNS_LOOKUP_TIMEOUT):
+        """Lookup for use inside an event loop; the loop is never blocked."""
+        try:
+            # Shielded: giving up here must not cancel the lookup other callers share
+            return await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(self.lookup(host))), timeout)
+        except asyncio.TimeoutError:
+            raise socket.gaierror(socket.EAI_AGAIN, f"Lookup of {host} timed out after {timeout}s") from None
+
+    def prefetch(self, hosts):
+        """Starts lookups for many hosts at once (e.g. every host of a batch) without waiting."""
+        for host in hosts:
+            if host:
+                self.lookup(host)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._entries)
+        stats['lookup_ms'] = round(stats.get('lookup_ms', 0), 1)
+        return stats
+
+
+_resolver = None
+_resolver_lock = threading.Lock()
+
+
+def get_resolver():
+    """The process-wide Resolver."""
+    global _resolver
+    if _resolver is None:
+        with _resolver_lock:
+            if _resolver is None:
+                _resolver = Resolver()
+    return _resolver
+
+
+def pick_address(addresses):
+    """The address a single-address scan uses: the first IPv4 one, else the first IPv6 one."""
+    for address in addresses:
+        if ':' not in address:
+            return address
+    return addresses[0] if addresses else None
+
+
+_original_create_connection = urllib3.util.connection.create_connection
+
+
+def _create_connection(address, *args, **kwargs):
+    # Same as urllib3's, but the name comes from the shared cache; each
+    # address is tried in turn like getaddrinfo's own list would be
+    host, port = address
+    last_error = None
+    with span('dns'):
+        addresses = get_resolver().resolve(host)
+    for ip_address in addresses:
+        try:
+            with span('connect'):
+                return _original_create_connection((ip_address, port), *args, **kwargs)
+        except OSError as e:
+            last_error = e
+    raise last_error or OSError(f"No addresses for {host}")
+
+
+def install_urllib3_hook():
+    """Routes urllib3's (and so requests') connection lookups through the shared resolver."""
+    urllib3.util.connection.create_connection = _create_connection
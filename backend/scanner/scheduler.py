@@ -0,0 +1,344 @@
+# backend/scanner/scheduler.py
+# Outbound politeness scheduler. Every HTTP request (make_request, the
+# crawler) and every TCP connect (port sweep, TLS probes) takes a token
+# from its target host's bucket and from a global bucket before it goes
+# out. Requests that have to wait are queued per host and released round
+# robin across hosts, so one large target cannot starve the others. A
+# 429 or 503 pauses the host (for its Retry-After, or exponentially) and
+# halves its request rate, which then recovers step by step on success.
+
+import asyncio
+import collections
+import datetime
+import email.utils
+import logging
+import os
+import threading
+import time
+
+from .metrics import Counter, Histogram
+from .timing import record_phase
+
+logger = logging.getLogger(__name__)
+
+KIND_HTTP = 'http'
+KIND_CONNECT = 'connect'
+
+# Rates are per second; 0 means unlimited. Bursts are bucket sizes.
+SCHEDULER_SETTINGS = {
+    'host_http_rate': float(os.environ.get('SCHEDULER_HOST_RATE', 50)),
+    'host_http_burst': float(os.environ.get('SCHEDULER_HOST_BURST', 50)),
+    'global_http_rate': float(os.environ.get('SCHEDULER_GLOBAL_RATE', 500)),
+    'global_http_burst': float(os.environ.get('SCHEDULER_GLOBAL_BURST', 100)),
+    'host_connect_rate': float(os.environ.get('SCHEDULER_HOST_CONNECT_RATE', 1000)),
+    'host_connect_burst': float(os.environ.get('SCHEDULER_HOST_CONNECT_BURST', 200)),
+    'global_connect_rate': float(os.environ.get('SCHEDULER_GLOBAL_CONNECT_RATE', 5000)),
+    'global_connect_burst': float(os.environ.get('SCHEDULER_GLOBAL_CONNECT_BURST', 1000)),
+    'backoff_base': 1.0, # First pause after a 429/503 without Retry-After (seconds)
+    'max_backoff': float(os.environ.get('SCHEDULER_MAX_BACKOFF', 60)), # Longest pause, Retry-After included
+    'min_rate_factor': 0.05, # A host's request rate never drops below this fraction of host_http_rate
+    'recovery_step': 0.1, # Fraction of host_http_rate regained per successful response
+}
+SCHEDULER_MAX_HOSTS = 4096 # Idle hosts beyond this are forgotten, oldest first
+
+BACKOFF_STATUSES = (429, 503)
+
+WAIT_SECONDS = Histogram('scanner_scheduler_wait_seconds', 'Time outbound requests and connects waited for a token.',
+                         labels=('kind',))
+BACKOFFS = Counter('scanner_scheduler_backoffs', 'Host pauses triggered by 429/503 responses.', labels=('status',))
+
+
+def retry_after_seconds(value):
+    """Seconds from a Retry-After header (delta-seconds or an HTTP date), or None."""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        moment = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=datetime.timezone.utc)
+    return max(0.0, (moment - datetime.datetime.now(datetime.timezone.utc)).total_seconds())
+
+
+class TokenBucket:
+    """Classic token bucket; a rate of 0 never runs out. Not locked: the scheduler holds its lock."""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        if self.rate:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def ready_at(self, now):
+        """When the next token is available (now if there is one already)."""
+        if not self.rate:
+            return now
+        self._refill(now)
+        return now if self.tokens >= 1 else now + (1 - self.tokens) / self.rate
+
+    def take(self, now):
+        self._refill(now)
+        if self.rate:
+            self.tokens -= 1
+
+
+class _Waiter:
+    __slots__ = ('kind', 'enqueued', 'event', 'loop', 'future', 'granted')
+
+    def __init__(self, kind, loop=None):
+        self.kind = kind
+        self.enqueued = time.monotonic()
+        self.loop = loop
+        self.future = loop.create_future() if loop is not None else None
+        self.event = threading.Event() if loop is None else None
+        self.granted = False
+
+    def grant(self):
+        self.granted = True
+        if self.event is not None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(_resolve, self.future)
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(True)
+
+
+class _HostState:
+    def __init__(self, settings):
+        self.buckets = {
+            KIND_HTTP: TokenBucket(settings['host_http_rate'], settings['host_http_burst']),
+            KIND_CONNECT: TokenBucket(settings['host_connect_rate'], settings['host_connect_burst']),
+        }
+        self.waiters = collections.deque()
+        self.paused_until = 0.0 # HTTP requests to the host are held until then
+        self.strikes = 0 # Consecutive 429/503 responses
+        self.rate_factor = 1.0 # Multiplier on host_http_rate, lowered by backoffs
+
+
+class Scheduler:
+    """
+    Per-host and global token buckets for HTTP requests and TCP connects.
+    acquire() (threads) and acquire_async() (event loops) return once the
+    caller may go ahead; observe() feeds response statuses back for backoff.
+    """
+
+    def __init__(self, settings=None):
+        self.settings = dict(SCHEDULER_SETTINGS, **(settings or {}))
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._hosts = collections.OrderedDict() # host -> _HostState, least recently used first
+        self._global = {
+            KIND_HTTP: TokenBucket(self.settings['global_http_rate'], self.settings['global_http_burst']),
+            KIND_CONNECT: TokenBucket(self.settings['global_connect_rate'], self.settings['global_connect_burst']),
+        }
+        self._active = collections.deque() # Hosts with queued waiters, in round-robin order
+        self._queued = 0
+        self._dispatcher = None
+
+    def _host(self, host):
+        host = (host or '').lower()
+        state = self._hosts.get(host)
+        if state is None:
+            state = self._hosts[host] = _HostState(self.settings)
+            while len(self._hosts) > SCHEDULER_MAX_HOSTS:
+                oldest, oldest_state = next(iter(self._hosts.items()))
+                if oldest_state.waiters:
+                    break
+                del self._hosts[oldest]
+        self._hosts.move_to_end(host)
+        return host, state
+
+    def _ready_at(self, state, kind, now):
+        ready = max(state.buckets[kind].ready_at(now), self._global[kind].ready_at(now))
+        if kind == KIND_HTTP:
+            ready = max(ready, state.paused_until)
+        return ready
+
+    def _take(self, state, kind, now):
+        state.buckets[kind].take(now)
+        self._global[kind].take(now)
+
+    def _enqueue(self, host, kind, loop=None):
+        """Takes a token straight away if nothing is queued; otherwise queues a waiter. Returns the waiter or None."""
+        with self._lock:
+            host, state = self._host(host)
+            now = time.monotonic()
+            if not self._queued and self._ready_at(state, kind, now) <= now:
+                self._take(state, kind, now)
+                return None
+            waiter = _Waiter(kind, loop)
+            if not state.waiters:
+                self._active.append(host)
+            state.waiters.append(waiter)
+            self._queued += 1
+            self._ensure_dispatcher()
+            self._wakeup.notify()
+            return waiter
+
+    def _cancel(self, host, waiter):
+        with self._lock:
+            host, state = self._host(host)
+            if waiter.granted:
+                return
+            try:
+                state.waiters.remove(waiter)
+                self._queued -= 1
+            except ValueError:
+                return
+            if not state.waiters:
+                # Otherwise the next _enqueue would list the host twice and give it two turns per round
+                try:
+                    self._active.remove(host)
+                except ValueError:
+                    pass
+
+    def acquire(self, host, kind=KIND_HTTP, timeout=None):
+        """
+        Blocks until a request (or connect) to host may start. Returns the
+        seconds waited, or None if no token came within `timeout` (the
+        caller should then not send the request).
+        """
+        waiter = self._enqueue(host, kind)
+        if waiter is None:
+            return 0.0
+        if not waiter.event.wait(timeout):
+            self._cancel(host, waiter)
+            if not waiter.granted:
+                return None
+        return self._waited(waiter, kind)
+
+    async def acquire_async(self, host, kind=KIND_CONNECT, timeout=None):
+        """
+        Async acquire(). Returns the seconds waited, or None if no token came
+        within `timeout` (the caller should then not connect).
+        """
+        waiter = self._enqueue(host, kind, asyncio.get_running_loop())
+        if waiter is None:
+            return 0.0
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), timeout)
+        except asyncio.TimeoutError:
+            self._cancel(host, waiter)
+            if not waiter.granted:
+                return None
+        except asyncio.CancelledError:
+            self._cancel(host, waiter)
+            raise
+        return self._waited(waiter, kind)
+
+    def _waited(self, waiter, kind):
+        waited = time.monotonic() - waiter.enqueued
+        WAIT_SECONDS.observe(waited, kind=kind)
+        record_phase('queue', waited)
+        return waited
+
+    def observe(self, host, status_code, retry_after=None):
+        """
+        Backs off a host that answered 429/503 and lets its rate recover on
+        other answers. Returns the seconds the host is now paused for.
+        """
+        with self._lock:
+            _, state = self._host(host)
+            base_rate = self.settings['host_http_rate']
+            if status_code in BACKOFF_STATUSES:
+                state.strikes += 1
+                delay = retry_after_seconds(retry_after)
+                if delay is None:
+                    delay = self.settings['backoff_base'] * 2 ** (state.strikes - 1)
+                delay = min(delay, self.settings['max_backoff'])
+                state.paused_until = max(state.paused_until, time.monotonic() + delay)
+                state.rate_factor = max(self.settings['min_rate_factor'], state.rate_factor / 2)
+                BACKOFFS.inc(status=str(status_code))
+            elif state.strikes or state.rate_factor < 1:
+                state.strikes = 0
+                state.rate_factor = min(1.0, state.rate_factor + self.settings['recovery_step'])
+            else:
+                return 0.0
+            if base_rate:
+                state.buckets[KIND_HTTP].rate = base_rate * state.rate_factor
+            self._wakeup.notify()
+            return max(0.0, state.paused_until - time.monotonic())
+
+    def host_state(self, host):
+        """Snapshot of one host's backoff state (for diagnostics)."""
+        with self._lock:
+            _, state = self._host(host)
+            return {
+                'queued': len(state.waiters),
+                'paused_for': round(max(0.0, state.paused_until - time.monotonic()), 3),
+                'strikes': state.strikes,
+                'rate_factor': round(state.rate_factor, 3),
+            }
+
+    def _ensure_dispatcher(self):
+        if self._dispatcher is None:
+            self._dispatcher = threading.Thread(target=self._dispatch_loop, name='scheduler', daemon=True)
+            self._dispatcher.start()
+
+    def _dispatch(self, now):
+        """
+        Grants every waiter that can go now, one per host per round so hosts
+        take turns. Returns when the next blocked waiter may be ready, or None.
+        """
+        next_ready = None
+        granted = True
+        while granted and self._active:
+            granted = False
+            for _ in range(len(self._active)):
+                host = self._active.popleft()
+                state = self._hosts.get(host)
+                if state is None or not state.waiters:
+                    continue
+                waiter = state.waiters[0]
+                ready = self._ready_at(state, waiter.kind, now)
+                if ready <= now:
+                    self._take(state, waiter.kind, now)
+                    state.waiters.popleft()
+                    self._queued -= 1
+                    try:
+                        waiter.grant()
+                    except Exception: # e.g. the waiter's event loop has closed; keep dispatching the rest
+                        logger.exception("Could not hand a %s token for %s to its waiter", waiter.kind, host)
+                    granted = True
+                else:
+                    next_ready = ready if next_ready is None else min(next_ready, ready)
+                if state.waiters:
+                    self._active.append(host)
+        return next_ready
+
+    def _dispatch_loop(self):
+        with self._lock:
+            while True:
+                next_ready = self._dispatch(time.monotonic())
+                timeout = None if next_ready is None else max(0.0, next_ready - time.monotonic())
+                self._wakeup.wait(timeout)
+
+
+_scheduler = Scheduler()
+
+
+def get_scheduler():
+    """The process-wide Scheduler."""
+    return _scheduler
+
+
+def configure_scheduler(**settings):
+    """Updates SCHEDULER_SETTINGS (rates, bursts, backoff) and replaces the shared scheduler."""
+    global _scheduler
+    unknown = set(settings) - set(SCHEDULER_SETTINGS)
+    if unknown:
+        raise ValueError(f"Unknown scheduler settings: {', '.join(sorted(unknown))}")
+    SCHEDULER_SETTINGS.update(settings)
+    _scheduler = Scheduler()
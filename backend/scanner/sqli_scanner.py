@@ -1,88 +1,298 @@
 # backend/scanner/sqli_scanner.py
-import requests
-from bs4 import BeautifulSoup
-# Make sure urljoin is imported
-from urllib.parse import urljoin, urlparse
-from .utils import make_request
-import json # Import json for potential future use if needed, not strictly required here
-
-def check_sqli_potential(url):
+import hashlib
+import html
+import logging
+import re
+from urllib.parse import urlencode
+from .context import get_context, iter_injection_points
+from .utils import make_request, run_per_host, TEXT_CONTENT_TYPES
+from .parse_pool import run_parse
+
+logger = logging.getLogger(__name__)
+
+# Database error strings that should never appear in a healthy response
+SQL_ERROR_PATTERNS = re.compile('|'.join([
+    r"You have an error in your SQL syntax",
+    r"Warning: mysqli?_",
+    r"MySqlException",
+    r"valid MySQL result",
+    r"PostgreSQL.{0,40}ERROR",
+    r"pg_query\(\)",
+    r"PSQLException",
+    r"unterminated quoted string at or near",
+    r"ORA-\d{5}",
+    r"Oracle error",
+    r"Microsoft OLE DB Provider for",
+    r"ODBC SQL Server Driver",
+    r"Unclosed quotation mark after the character string",
+    r"SQLServerException",
+    r"SQLite3?::",
+    r"sqlite3\.OperationalError",
+    r"SQLITE_ERROR",
+    r"SQLSTATE\[",
+    r"quoted string not properly terminated",
+]), re.IGNORECASE)
+
+ERROR_PAYLOADS = ["'", "\"", "')", "';--"]
+
+# (true condition, false condition) appended to the original value
+BOOLEAN_PAYLOADS = [
+    ("' AND '1'='1", "' AND '1'='2"),
+    (" AND 1=1", " AND 1=2"),
+]
+
+# {delay} is filled in with SQLI_TIME_DELAY seconds
+TIME_PAYLOADS = [
+    "' AND SLEEP({delay})-- -",
+    "'; WAITFOR DELAY '0:0:{delay}'--",
+    "' AND 1=(SELECT 1 FROM PG_SLEEP({delay}))--",
+]
+
+SQLI_TIME_DELAY = 3 # Seconds a time-based payload asks the database to sleep
+SQLI_MAX_TIMEOUT = 10 # Upper bound for the adaptive time-based probe timeout
+SQLI_MAX_IN_FLIGHT_PER_HOST = 8
+SQLI_MAX_INJECTION_POINTS = 40
+
+# Length difference (as a fraction) below which two pages count as the same
+SIMILARITY_TOLERANCE = 0.02
+
+
+def _fingerprint(text, injected=None):
+    """
+    (length, md5) of a response body. The injected value (raw and
+    HTML-escaped) is removed first so a reflected payload alone does not
+    make two otherwise identical pages look different.
+    """
+    if injected:
+        text = text.replace(injected, '').replace(html.escape(injected), '')
+    body = text.encode('utf-8', errors='replace')
+    return len(body), hashlib.md5(body).hexdigest()
+
+
+def _decode(body, encoding):
+    # The same decoding as requests' response.text, minus its charset detection
+    try:
+        return str(body, encoding or 'utf-8', errors='replace')
+    except (LookupError, TypeError):
+        return str(body, 'utf-8', errors='replace')
+
+
+def analyze_body(body, encoding=None, injected=None, fingerprint=True, errors=True):
     """
-    Performs a *very basic* check for potential SQLi entry points by
-    identifying HTML forms and their details. Does NOT attempt injection.
-    Returns a dictionary containing a boolean test result and details
-    about the forms found.
+    The comparisons the probes make on one raw body, in a form that can run
+    in a parse worker: (fingerprint or None, the first database error
+    message in it or None).
+    """
+    text = _decode(body, encoding)
+    match = SQL_ERROR_PATTERNS.search(text) if errors else None
+    return (_fingerprint(text, injected) if fingerprint else None), (match.group(0) if match else None)
+
+
+def _analyze(response, injected=None, fingerprint=True, errors=True):
+    return run_parse(analyze_body, response.content, response.encoding, injected, fingerprint, errors)
+
+
+def _similar(fp_a, fp_b):
+    if fp_a[1] == fp_b[1]:
+        return True
+    longest = max(fp_a[0], fp_b[0]) or 1
+    return abs(fp_a[0] - fp_b[0]) / longest <= SIMILARITY_TOLERANCE
+
+
+def _get_url(action_url, params):
+    query = urlencode(params, doseq=True)
+    return f"{action_url}?{query}" if query else action_url
+
+
+def _send(method, action_url, params, timeout=10):
+    """
+    Sends one probe; returns (response or None, elapsed seconds or None).
+    Elapsed is the server's response time (to the headers, redirects
+    included), never time spent queued by the scheduler or backed off
+    after a 429/503; it is None when no response came back.
+    """
+    if method == 'POST':
+        response = make_request(action_url, timeout=timeout, method='POST', data=params, allow_errors=True,
+                                accept=TEXT_CONTENT_TYPES)
+    else:
+        response = make_request(_get_url(action_url, params), timeout=timeout, allow_errors=True,
+                                accept=TEXT_CONTENT_TYPES)
+    if response is None:
+        return None, None
+    return response, sum((r.elapsed.total_seconds() for r in response.history + [response]), 0.0)
+
+
+def _probe_point(point, baselines):
+    """Runs the error, boolean and time-based probes against one injection point."""
+    location, method, action_url, base_params, param = point
+    baseline = baselines.get((method, action_url))
+    if baseline is None:
+        return [] # Baseline request failed; nothing reliable to compare against
+    baseline_fp, baseline_has_errors, baseline_latency = baseline
+    original = base_params.get(param, '')
+    findings = []
+
+    def finding(technique, payload, evidence):
+        return {
+            'parameter': param,
+            'location': location,
+            'method': method,
+            'url': action_url,
+            'technique': technique,
+            'payload': payload,
+            'evidence': evidence
+        }
+
+    def send(value, timeout=10):
+        params = dict(base_params)
+        params[param] = value
+        return _send(method, action_url, params, timeout=timeout)
+
+    # Error-based: a database error that the baseline did not show
+    if not baseline_has_errors:
+        for payload in ERROR_PAYLOADS:
+            response, _ = send(original + payload)
+            if response is not None:
+                _, error = _analyze(response, fingerprint=False)
+                if error:
+                    findings.append(finding('error-based', payload, error))
+                    break
+
+    # Boolean-based: the "true" variant matches the baseline, the "false" one does not
+    if not findings:
+        for true_payload, false_payload in BOOLEAN_PAYLOADS:
+            true_response, _ = send(original + true_payload)
+            if true_response is None:
+                continue
+            true_fp, _ = _analyze(true_response, original + true_payload, errors=False)
+            if not _similar(true_fp, baseline_fp):
+                continue
+            false_response, _ = send(original + false_payload)
+            if false_response is None:
+                continue
+            false_fp, _ = _analyze(false_response, original + false_payload, errors=False)
+            if not _similar(false_fp, baseline_fp):
+                findings.append(finding('boolean-based', f"{true_payload} / {false_payload}",
+                                        f"Response length {baseline_fp[0]} vs {false_fp[0]} bytes"))
+                break
+
+    # Time-based: only the payload's sleep, not a slow target, should trip this.
+    # The timeout adapts to the baseline latency so a slow host cannot stall the run.
+    if not findings:
+        timeout = min(SQLI_TIME_DELAY + max(2, 3 * baseline_latency), SQLI_MAX_TIMEOUT)
+        for template in TIME_PAYLOADS:
+            payload = template.format(delay=SQLI_TIME_DELAY)
+            _, elapsed = send(original + payload, timeout=timeout)
+            if elapsed is None or elapsed < SQLI_TIME_DELAY + baseline_latency * 0.5:
+                continue # A timeout is no evidence: the timeout leaves room for the sleep itself
+            # Confirm with a zero delay: a page that is just slow stays slow
+            _, control_elapsed = send(original + template.format(delay=0), timeout=timeout)
+            if control_elapsed is not None and control_elapsed < SQLI_TIME_DELAY:
+                findings.append(finding('time-based', payload,
+                                        f"Response took {elapsed:.1f}s (baseline {baseline_latency:.1f}s)"))
+                break
+
+    return findings
+
+
+def probe_sqli(url, context):
+    """
+    Active stage: sends error-based, boolean-based and time-based payloads to
+    every URL parameter and form field, concurrently per host. Responses are
+    compared with a cached baseline by length and hash rather than by
+    re-parsing. Returns a list of findings.
+    """
+    points = list(iter_injection_points(url, context))[:SQLI_MAX_INJECTION_POINTS]
+    if not points:
+        return []
+
+    # One baseline per (method, action): the page as it looks with untouched values
+    baselines = {}
+    targets = {}
+    for _, method, action_url, base_params, _ in points:
+        targets.setdefault((method, action_url), base_params)
+
+    def fetch_baseline(target):
+        (method, action_url), params = target
+        if method == 'GET' and context.response is not None and _get_url(action_url, params) == url:
+            response = context.response # The scan's own baseline fetch
+            elapsed = response.elapsed.total_seconds()
+        else:
+            response, elapsed = _send(method, action_url, params)
+        if response is None:
+            return None
+        fingerprint, error = _analyze(response)
+        return fingerprint, error is not None, elapsed
+
+    target_items = list(targets.items())
+    for (key, _), baseline in zip(target_items, run_per_host(target_items, fetch_baseline,
+                                                               url_of=lambda item: item[0][1],
+                                                               per_host_limit=SQLI_MAX_IN_FLIGHT_PER_HOST)):
+        if baseline is not None:
+            baselines[key] = baseline
+
+    results = run_per_host(points, lambda point: _probe_point(point, baselines),
+                           url_of=lambda point: point[2], per_host_limit=SQLI_MAX_IN_FLIGHT_PER_HOST)
+    return [finding for point_findings in results for finding in point_findings]
+
+
+def check_sqli_potential(url, context=None, active=True):
+    """
+    Checks for SQL injection. Lists the HTML forms on the page (potential
+    entry points) and, when `active` is set, probes every form field and
+    URL parameter with injection payloads. "SQL Injection Test" is True only
+    for confirmed findings in active mode, or when forms exist in passive
+    mode. Reuses the baseline page in `context` if given.
     """
     potential_forms = [] # Store details of forms found
-    details_message = "No forms found or error during request." # Default message
 
-    response = make_request(url)
-    if not response or not response.text:
+    context = get_context(url, context)
+    if not context.response or not context.text:
         return {
             "SQL Injection Test": False,
             # Keep sqli_details consistent, return empty list or specific message
-            "sqli_details": [] # Or you could return [{"error": details_message}]
-            # "error_message": details_message # Or add a specific error field
+            "sqli_details": [],
+            "sqli_findings": []
         }
 
     try:
-        soup = BeautifulSoup(response.text, 'lxml') # Use lxml if installed
-        forms = soup.find_all('form')
-
-        if forms:
-            details_message = f"Found {len(forms)} form(s) which might be potential SQLi entry points."
-            for form in forms:
-                # Get form action URL, resolve relative paths
-                action = form.get('action')
-                # Resolve action URL relative to the base URL
-                absolute_action = urljoin(url, action) if action else url
-
-                # Get form method (default to GET if not specified)
-                method = form.get('method', 'get').upper()
-
-                # Find all input fields within the form
-                inputs = []
-                for input_tag in form.find_all(['input', 'textarea', 'select']):
-                    input_name = input_tag.get('name')
-                    # Include inputs even if they don't have a name, as they might be manipulated
-                    # if input_name: # Optional: only include inputs with names
-                    input_type = input_tag.get('type', 'text') # Default type if not input or missing
-                    if input_tag.name == 'textarea':
-                         input_type = 'textarea'
-                    elif input_tag.name == 'select':
-                         input_type = 'select'
-
-                    inputs.append({
-                        'name': input_name or '(No Name)',
-                        'type': input_type
-                    })
-
-                potential_forms.append({
-                    'action': absolute_action,
-                    'method': method,
-                    'inputs': inputs
-                })
-
-            # Return True if forms are found, along with the structured details
-            return {
-                "SQL Injection Test": True,
-                "sqli_details": potential_forms
-            }
-        else:
-            details_message = "No standard HTML forms found on the page."
-            # Return False, indicate no forms found in details
+        forms = context.forms # Extracted once per scan and shared with the XSS check
+
+        for form in forms:
+            # Include inputs even if they don't have a name, as they might be manipulated
+            inputs = [{'name': field['name'] or '(No Name)', 'type': field['type']}
+                      for field in form['inputs']]
+
+            potential_forms.append({
+                'action': form['action'],
+                'method': form['method'],
+                'inputs': inputs
+            })
+
+        if not active:
             return {
-                "SQL Injection Test": False,
-                "sqli_details": [] # Return empty list when no forms found
-                # "info_message": details_message # Or add an info field
+                "SQL Injection Test": bool(potential_forms),
+                "sqli_details": potential_forms,
+                "sqli_findings": []
             }
 
+        findings = probe_sqli(url, context)
+        for finding in findings:
+            logger.info("Potential SQL injection (%s) in %s parameter '%s'",
+                        finding['technique'], finding['location'], finding['parameter'])
+        return {
+            "SQL Injection Test": bool(findings),
+            "sqli_details": potential_forms,
+            "sqli_findings": findings
+        }
+
     except Exception as e:
-        details_message = f"Error parsing HTML: {e}"
-        print(details_message)
+        details_message = f"Error during SQLi check: {e}"
+        logger.warning("SQLi check for %s failed: %s", url, e)
         # Return False on error, include error details
         return {
             "SQL Injection Test": False,
-            "sqli_details": [], # Return empty list on error
+            "sqli_details": potential_forms,
+            "sqli_findings": [],
             "error_message": details_message # Add a specific error field
-        }
\ No newline at end of file
+        }
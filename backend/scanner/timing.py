@@ -0,0 +1,167 @@
+# backend/scanner/timing.py
+# Timing spans for scans. Every outbound HTTP request is broken into phases
+# (DNS, connect, TLS, time to first byte, download) and every parse and
+# check is timed. Each span goes to the process-wide metrics and, when a
+# scan is collecting (see collect()), into that scan's ScanTimings, which
+# is saved with its scan_results row.
+#
+# The current scan is tracked in a context variable. asyncio tasks inherit
+# it on their own; work handed to a thread pool must be wrapped with bind().
+
+import contextlib
+import contextvars
+import functools
+import threading
+import time
+
+import urllib3.connection
+
+from .metrics import Counter, Histogram, Summary
+
+# Phases of an outbound request (queue is time spent waiting on the scheduler), plus HTML parsing
+PHASES = ('queue', 'dns', 'connect', 'tls', 'ttfb', 'download', 'parse')
+
+PHASE_SECONDS = Histogram('scanner_phase_seconds', 'Time spent per request phase (queue, dns, connect, tls, ttfb, download, parse).',
+                          labels=('phase',))
+HTTP_REQUESTS = Counter('scanner_http_requests', 'Outbound HTTP requests by method and status class.',
+                        labels=('method', 'status'))
+HTTP_REQUEST_ERRORS = Counter('scanner_http_request_errors', 'Outbound HTTP requests that failed, by exception type.',
+                              labels=('type',))
+CHECK_SECONDS = Histogram('scanner_check_duration_seconds', 'Wall time of each check that ran.', labels=('check',))
+CHECK_LATENCY = Summary('scanner_check_latency_seconds', 'Recent per-check latency percentiles.', labels=('check',))
+CHECK_ERRORS = Counter('scanner_check_errors', 'Check failures by check and error type.', labels=('check', 'type'))
+
+_current = contextvars.ContextVar('scan_timings', default=None)
+
+
+class ScanTimings:
+    """Spans collected for one scan: wall time per check and totals per request phase."""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.finished = None
+        self._lock = threading.Lock()
+        self._checks = {}
+        self._phases = {}
+        self._requests = 0
+        self._request_errors = 0
+
+    def add_phase(self, phase, seconds):
+        with self._lock:
+            entry = self._phases.setdefault(phase, {'count': 0, 'total_ms': 0.0, 'max_ms': 0.0})
+            entry['count'] += 1
+            entry['total_ms'] += seconds * 1000
+            entry['max_ms'] = max(entry['max_ms'], seconds * 1000)
+
+    def add_check(self, name, seconds):
+        with self._lock:
+            self._checks[name] = round(seconds * 1000, 1)
+
+    def add_request(self, failed=False):
+        with self._lock:
+            self._requests += 1
+            self._request_errors += bool(failed)
+
+    def finish(self):
+        self.finished = time.monotonic()
+        return self
+
+    def as_dict(self):
+        """JSON-ready summary: {'total_ms', 'checks', 'phases', 'requests', 'request_errors'}."""
+        with self._lock:
+            phases = {phase: {'count': entry['count'], 'total_ms': round(entry['total_ms'], 1),
+                              'max_ms': round(entry['max_ms'], 1)}
+                      for phase, entry in self._phases.items()}
+            checks = dict(self._checks)
+            requests, request_errors = self._requests, self._request_errors
+        end = self.finished if self.finished is not None else time.monotonic()
+        return {
+            'total_ms': round((end - self.started) * 1000, 1),
+            'checks': checks,
+            'phases': {phase: phases[phase] for phase in PHASES if phase in phases},
+            'requests': requests,
+            'request_errors': request_errors,
+        }
+
+
+@contextlib.contextmanager
+def collect(timings):
+    """Spans recorded inside the block (and in work bound to it) go into `timings`."""
+    token = _current.set(timings)
+    try:
+        yield timings
+    finally:
+        _current.reset(token)
+
+
+def current():
+    """The ScanTimings being collected in this context, or None."""
+    return _current.get()
+
+
+def bind(func):
+    """Wraps func to run in a copy of the caller's context, so spans it records reach the caller's scan."""
+    return functools.partial(contextvars.copy_context().run, func)
+
+
+def record_phase(phase, seconds):
+    PHASE_SECONDS.observe(seconds, phase=phase)
+    timings = _current.get()
+    if timings is not None:
+        timings.add_phase(phase, seconds)
+
+
+@contextlib.contextmanager
+def span(phase):
+    """Times the block as one `phase` span."""
+    started = time.monotonic()
+    try:
+        yield
+    finally:
+        record_phase(phase, time.monotonic() - started)
+
+
+def record_check(name, seconds):
+    CHECK_SECONDS.observe(seconds, check=name)
+    CHECK_LATENCY.observe(seconds, check=name)
+    timings = _current.get()
+    if timings is not None:
+        timings.add_check(name, seconds)
+
+
+def record_check_error(name, error_type):
+    CHECK_ERRORS.inc(check=name, type=error_type)
+
+
+def record_request(method, response=None, error=None, download_seconds=None):
+    """
+    Counts one outbound request. With a response, its time to first byte
+    (requests' `elapsed`: from sending until the headers were parsed,
+    including connection setup if a new connection was opened) and the
+    body download time are recorded as spans.
+    """
+    if response is not None:
+        HTTP_REQUESTS.inc(method=method, status=f'{response.status_code // 100}xx')
+        record_phase('ttfb', response.elapsed.total_seconds())
+        if download_seconds is not None:
+            record_phase('download', download_seconds)
+    else:
+        HTTP_REQUESTS.inc(method=method, status='error')
+        HTTP_REQUEST_ERRORS.inc(type=type(error).__name__ if error is not None else 'Unknown')
+    timings = _current.get()
+    if timings is not None:
+        timings.add_request(failed=response is None)
+
+
+_original_ssl_wrap = getattr(urllib3.connection, '_ssl_wrap_socket_and_match_hostname', None)
+
+
+def _timed_ssl_wrap(*args, **kwargs):
+    with span('tls'):
+        return _original_ssl_wrap(*args, **kwargs)
+
+
+def install_urllib3_timing():
+    """Times TLS handshakes of urllib3's HTTPS connections (urllib3 2.x; a no-op on other versions)."""
+    if _original_ssl_wrap is not None:
+        urllib3.connection._ssl_wrap_socket_and_match_hostname = _timed_ssl_wrap
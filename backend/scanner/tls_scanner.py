@@ -0,0 +1,452 @@
+# backend/scanner/tls_scanner.py
+# TLS and certificate analysis: protocol versions and weak cipher groups the
+# server accepts, and the certificate chain, expiry, trust and SAN coverage
+# for the scanned host name.
+#
+# The certificate comes from a handshake that already happened where
+# possible: the baseline request over the pooled HTTPS session, or the port
+# sweep's fingerprinting of TLS ports (see handshakes.py). Version and
+# cipher support belong to the endpoint, not the host name, so they are
+# probed concurrently once per IP:port and cached; virtual hosts sharing an
+# endpoint (e.g. a batch over one load balancer) reuse the first analysis.
+
+import asyncio
+import collections
+import datetime
+import ipaddress
+import os
+import socket
+import ssl
+import threading
+import time
+from concurrent.futures import Future
+from urllib.parse import urlparse
+
+from .context import get_context
+from .handshakes import get_handshakes, describe_handshake, SOURCE_PROBE
+from .resolver import get_resolver, pick_address
+from .scheduler import get_scheduler, KIND_CONNECT
+
+TLS_CACHE_TTL = float(os.environ.get('TLS_CACHE_TTL', 900)) # Per-endpoint analyses (seconds)
+TLS_CACHE_MAX_ENTRIES = 4096
+TLS_PROBE_TIMEOUT = float(os.environ.get('TLS_PROBE_TIMEOUT', 5)) # Per handshake
+TLS_EXPIRY_WARNING_DAYS = int(os.environ.get('TLS_EXPIRY_WARNING_DAYS', 30))
+
+PROTOCOLS = [
+    ('TLSv1', ssl.TLSVersion.TLSv1),
+    ('TLSv1.1', ssl.TLSVersion.TLSv1_1),
+    ('TLSv1.2', ssl.TLSVersion.TLSv1_2),
+    ('TLSv1.3', ssl.TLSVersion.TLSv1_3),
+]
+WEAK_PROTOCOLS = ('TLSv1', 'TLSv1.1')
+
+# OpenSSL cipher strings offered on their own over TLS 1.2 and below; a
+# server that accepts any of them is reported
+WEAK_CIPHER_GROUPS = {
+    'null': 'eNULL', # No encryption
+    'anonymous': 'aNULL', # No server authentication
+    'export': 'EXPORT',
+    'rc4': 'RC4',
+    'des': 'DES:3DES',
+    'static_rsa': 'kRSA', # No forward secrecy
+}
+
+# Old protocols and weak ciphers are disabled at OpenSSL's default security level
+_LEGACY_SECURITY = '@SECLEVEL=0'
+# Handshake failures that mean this client could not offer what was asked for
+_CLIENT_UNSUPPORTED = {'NO_PROTOCOLS_AVAILABLE', 'NO_CIPHERS_AVAILABLE', 'NO_SUITABLE_SIGNATURE_ALGORITHM'}
+
+_NAME_ABBREVIATIONS = {
+    'commonName': 'CN', 'organizationName': 'O', 'organizationalUnitName': 'OU',
+    'countryName': 'C', 'stateOrProvinceName': 'ST', 'localityName': 'L',
+}
+
+
+# --- Probes ---
+
+def _probe_context(minimum=None, maximum=None, ciphers=None, verify=False):
+    """Client context for one probe. Raises ssl.SSLError if this OpenSSL cannot offer `ciphers`."""
+    if verify:
+        context = ssl.create_default_context()
+        context.check_hostname = False # Coverage is checked separately, against the SAN list
+    else:
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+    if minimum is not None:
+        context.minimum_version = minimum
+    if maximum is not None:
+        context.maximum_version = maximum
+    if ciphers:
+        context.set_ciphers(ciphers)
+    return context
+
+
+async def _handshake(ip_address, port, server_name, context, timeout=None):
+    """One TLS handshake; returns its describe_handshake record. Raises ssl.SSLError, OSError or TimeoutError."""
+    timeout = TLS_PROBE_TIMEOUT if timeout is None else timeout
+    if await get_scheduler().acquire_async(server_name or ip_address, KIND_CONNECT, timeout) is None:
+        raise asyncio.TimeoutError(f"No connect slot for {server_name or ip_address} within {timeout}s")
+    _, writer = await asyncio.wait_for(
+        asyncio.open_connection(ip_address, port, ssl=context, server_hostname=server_name or ip_address,
+                                ssl_handshake_timeout=timeout),
+        timeout,
+    )
+    try:
+        verified = context.verify_mode == ssl.CERT_REQUIRED or None
+        return describe_handshake(writer.get_extra_info('ssl_object'), writer.get_extra_info('peername'),
+                                  verified, SOURCE_PROBE)
+    finally:
+        writer.transport.abort() # No close_notify exchange; the answer is already in
+
+
+async def _accepts(ip_address, port, server_name, **context_options):
+    """True/False: whether the server completes a handshake with these options; None if it could not be tested."""
+    try:
+        context = _probe_context(**context_options)
+    except (ssl.SSLError, ValueError):
+        return None # This OpenSSL build cannot offer it
+    try:
+        await _handshake(ip_address, port, server_name, context)
+        return True
+    except ssl.SSLError as e:
+        return None if e.reason in _CLIENT_UNSUPPORTED else False
+    except (ConnectionResetError, ConnectionAbortedError, asyncio.IncompleteReadError):
+        return False # Dropped mid-handshake: the usual refusal of an old protocol
+    except (OSError, asyncio.TimeoutError):
+        return None
+
+
+async def probe_endpoint(ip_address, port, server_name, known_protocols=None):
+    """
+    Which protocol versions and weak cipher groups ip_address:port accepts,
+    each tested with its own handshake, all concurrently. Versions in
+    known_protocols (e.g. the one an earlier handshake negotiated) are not
+    probed again. Values are True/False, or None where they could not be
+    tested (timeouts, or an OpenSSL build without that protocol/cipher).
+    """
+    known_protocols = known_protocols or {}
+    names = [name for name, _ in PROTOCOLS if name not in known_protocols]
+    protocol_results = await asyncio.gather(*(
+        _accepts(ip_address, port, server_name, minimum=version, maximum=version,
+                 ciphers=f'ALL:{_LEGACY_SECURITY}' if name in WEAK_PROTOCOLS else None)
+        for name, version in PROTOCOLS if name in names
+    ))
+    protocols = dict(known_protocols, **dict(zip(names, protocol_results)))
+    protocols = {name: protocols.get(name) for name, _ in PROTOCOLS}
+
+    weak_ciphers = {group: None for group in WEAK_CIPHER_GROUPS}
+    if any(protocols[name] for name in ('TLSv1', 'TLSv1.1', 'TLSv1.2')):
+        # Cipher suites are only negotiable below TLS 1.3
+        cipher_results = await asyncio.gather(*(
+            _accepts(ip_address, port, server_name, maximum=ssl.TLSVersion.TLSv1_2,
+                     ciphers=f'{ciphers}:{_LEGACY_SECURITY}')
+            for ciphers in WEAK_CIPHER_GROUPS.values()
+        ))
+        weak_ciphers = dict(zip(WEAK_CIPHER_GROUPS, cipher_results))
+    return {
+        'protocols': protocols,
+        'weak_ciphers': weak_ciphers,
+        'analysed_at': datetime.datetime.now(datetime.timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ'),
+    }
+
+
+async def certificate_handshake(ip_address, port, server_name):
+    """
+    A handshake record for server_name on ip_address:port that says whether
+    the chain verifies: a verifying handshake first, and if verification
+    fails, an unverified one to still read the chain. None if no handshake
+    completes at all.
+    """
+    try:
+        return await _handshake(ip_address, port, server_name, _probe_context(verify=True))
+    except ssl.SSLCertVerificationError as e:
+        verify_error = e.verify_message
+    except (ssl.SSLError, OSError, asyncio.TimeoutError):
+        verify_error = None
+    try:
+        handshake = await _handshake(ip_address, port, server_name, _probe_context(ciphers=f'ALL:{_LEGACY_SECURITY}'))
+    except (ssl.SSLError, OSError, asyncio.TimeoutError):
+        return None
+    handshake['verified'] = False if verify_error else None
+    handshake['verify_error'] = verify_error
+    return handshake
+
+
+# --- Per-endpoint cache ---
+
+class EndpointCache:
+    """
+    probe_endpoint() results per (ip, port) for `ttl` seconds. Concurrent
+    checks of the same endpoint, from any thread or event loop, share one
+    analysis: the first caller runs it and the others wait for its Future.
+    """
+
+    def __init__(self, ttl=TLS_CACHE_TTL, max_entries=TLS_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = collections.OrderedDict() # (ip, port) -> (expires_at, analysis)
+        self._in_flight = {} # (ip, port) -> Future
+        self._lock = threading.Lock()
+        self._stats = collections.Counter()
+
+    def claim(self, ip_address, port):
+        """
+        Returns (future, owner). When owner is True the caller must run the
+        analysis and pass its result (or exception) to finish().
+        """
+        key = (ip_address, port)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self._stats['hits'] += 1
+                future = Future()
+                future.set_result(entry[1])
+                return future, False
+            if key in self._in_flight:
+                self._stats['joined'] += 1
+                return self._in_flight[key], False
+            self._stats['misses'] += 1
+            future = self._in_flight[key] = Future()
+            return future, True
+
+    def finish(self, ip_address, port, analysis=None, error=None):
+        key = (ip_address, port)
+        with self._lock:
+            future = self._in_flight.pop(key)
+            # An endpoint where nothing could be tested (unreachable) is retried next time
+            if error is None and any(value is not None for value in analysis['protocols'].values()):
+                self._entries[key] = (time.monotonic() + self.ttl, analysis)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(analysis)
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, entries=len(self._entries))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_endpoints = EndpointCache()
+
+
+def get_endpoint_cache():
+    """The process-wide EndpointCache."""
+    return _endpoints
+
+
+async def _endpoint_analysis(ip_address, port, server_name, known_protocols):
+    """This endpoint's analysis: cached, joined with one already running, or probed now. Returns (analysis, cached)."""
+    future, owner = _endpoints.claim(ip_address, port)
+    if not owner:
+        return await asyncio.wrap_future(future), True
+    try:
+        analysis = await probe_endpoint(ip_address, port, server_name, known_protocols)
+    except BaseException as e:
+        _endpoints.finish(ip_address, port, error=e if isinstance(e, Exception) else RuntimeError(str(e)))
+        raise
+    _endpoints.finish(ip_address, port, analysis)
+    return analysis, False
+
+
+# --- Certificate report ---
+
+def _name_text(name):
+    pairs = [pair for rdn in name or () for pair in rdn]
+    return ', '.join(f'{_NAME_ABBREVIATIONS.get(key, key)}={value}' for key, value in pairs) or None
+
+
+def _common_name(name):
+    for rdn in name or ():
+        for key, value in rdn:
+            if key == 'commonName':
+                return value
+    return None
+
+
+def _cert_time(value):
+    seconds = ssl.cert_time_to_seconds(value)
+    return datetime.datetime.fromtimestamp(seconds, datetime.timezone.utc)
+
+
+def _dns_name_matches(pattern, hostname):
+    pattern = pattern.lower().rstrip('.')
+    if pattern.startswith('*.'):
+        # A wildcard covers exactly one left-most label
+        head, _, rest = hostname.partition('.')
+        return bool(head) and rest == pattern[2:]
+    return pattern == hostname
+
+
+def hostname_covered(certificate, hostname):
+    """True if the certificate's SAN entries (or, without DNS SANs, its CN) cover hostname."""
+    hostname = hostname.lower().rstrip('.')
+    san = certificate.get('subjectAltName') or ()
+    try:
+        address = ipaddress.ip_address(hostname)
+    except ValueError:
+        address = None
+    if address is not None:
+        for kind, value in san:
+            if kind == 'IP Address':
+                try:
+                    if ipaddress.ip_address(value.strip()) == address:
+                        return True
+                except ValueError:
+                    continue
+        return False
+    try:
+        hostname = hostname.encode('idna').decode('ascii')
+    except UnicodeError:
+        pass
+    names = [value for kind, value in san if kind == 'DNS']
+    if not names and _common_name(certificate.get('subject')):
+        names = [_common_name(certificate.get('subject'))]
+    return any(_dns_name_matches(name, hostname) for name in names)
+
+
+def certificate_report(chain, hostname, now=None):
+    """Summary of a chain (leaf first): names, validity, SANs, coverage of hostname and each chain member."""
+    now = now or datetime.datetime.now(datetime.timezone.utc)
+    leaf = chain[0]
+    report = {
+        'subject': _name_text(leaf.get('subject')),
+        'issuer': _name_text(leaf.get('issuer')),
+        'serial': leaf.get('serialNumber'),
+        'not_before': None,
+        'not_after': None,
+        'days_remaining': None,
+        'san': [value for kind, value in leaf.get('subjectAltName') or () if kind in ('DNS', 'IP Address')],
+        'hostname_covered': hostname_covered(leaf, hostname),
+        'self_signed': leaf.get('subject') == leaf.get('issuer'),
+        'chain': [{'subject': _name_text(cert.get('subject')), 'issuer': _name_text(cert.get('issuer')),
+                   'not_after': cert.get('notAfter')} for cert in chain],
+    }
+    try:
+        not_before, not_after = _cert_time(leaf['notBefore']), _cert_time(leaf['notAfter'])
+        report['not_before'] = not_before.strftime('%Y-%m-%dT%H:%M:%SZ')
+        report['not_after'] = not_after.strftime('%Y-%m-%dT%H:%M:%SZ')
+        report['days_remaining'] = (not_after - now).days
+        report['not_yet_valid'] = not_before > now
+    except (KeyError, ValueError):
+        pass
+    return report
+
+
+def tls_findings(certificate, handshake, analysis):
+    """The problems worth reporting, as {'issue', 'detail'} dicts."""
+    findings = []
+
+    def add(issue, detail):
+        findings.append({'issue': issue, 'detail': detail})
+
+    if certificate is not None:
+        days = certificate['days_remaining']
+        if days is not None and days < 0:
+            add('certificate_expired', f"Certificate expired on {certificate['not_after']}")
+        elif days is not None and days < TLS_EXPIRY_WARNING_DAYS:
+            add('certificate_expires_soon', f"Certificate expires on {certificate['not_after']} ({days} days)")
+        if certificate.get('not_yet_valid'):
+            add('certificate_not_yet_valid', f"Certificate is not valid before {certificate['not_before']}")
+        if not certificate['hostname_covered']:
+            add('hostname_mismatch', f"Certificate does not cover the host name (SAN: {', '.join(certificate['san']) or 'none'})")
+        if certificate['self_signed']:
+            add('self_signed', "Certificate is self-signed")
+    if handshake.get('verified') is False:
+        add('certificate_untrusted', f"Certificate chain does not verify: {handshake.get('verify_error') or 'unknown error'}")
+    protocols = analysis['protocols']
+    for name in WEAK_PROTOCOLS:
+        if protocols.get(name):
+            add('weak_protocol', f"Server accepts {name}")
+    if protocols.get('TLSv1.2') is False and protocols.get('TLSv1.3') is False:
+        add('no_modern_protocol', "Server accepts neither TLSv1.2 nor TLSv1.3")
+    for group, accepted in analysis['weak_ciphers'].items():
+        if accepted:
+            add('weak_cipher', f"Server accepts {group} cipher suites ({WEAK_CIPHER_GROUPS[group]})")
+    return findings
+
+
+# --- Check ---
+
+def _endpoint_of(url):
+    """(host, port, is_https) of a URL; plain-HTTP targets are checked on port 443."""
+    parsed = urlparse(url)
+    if parsed.scheme == 'https':
+        return parsed.hostname, parsed.port or 443, True
+    return parsed.hostname, 443, False
+
+
+async def _analyse(host, ip_address, port, handshake):
+    """Endpoint analysis plus, if no usable earlier handshake exists, a certificate handshake, concurrently."""
+    known = {handshake['protocol']: True} if handshake and handshake.get('protocol') else None
+    need_certificate = handshake is None or not handshake['chain'] or handshake['verified'] is None
+    tasks = [_endpoint_analysis(ip_address, port, host, known)]
+    if need_certificate:
+        tasks.append(certificate_handshake(ip_address, port, host))
+    results = await asyncio.gather(*tasks)
+    (analysis, cached), probed = results[0], results[1] if need_certificate else None
+    if probed is not None:
+        handshake = probed if handshake is None or not handshake['chain'] else dict(
+            handshake, verified=probed['verified'], verify_error=probed['verify_error'])
+        get_handshakes().record(host, port, handshake)
+    return analysis, cached, handshake
+
+
+def check_tls(url, context=None):
+    """
+    TLS and certificate analysis of the target's HTTPS endpoint (port 443
+    for http:// URLs). Reuses the baseline request's handshake from
+    `context` when there is one. Returns {'TLS Test' (True if any issue
+    was found), 'tls_details', 'tls_findings'}, or an 'error_message'.
+    """
+    host, port, is_https = _endpoint_of(url)
+    if not host:
+        return {"TLS Test": False, "tls_details": None, "tls_findings": [], "error_message": "Invalid URL"}
+    if is_https:
+        # Shared baseline fetch: its handshake on the pooled session is recorded in the handshake store
+        get_context(url, context).response
+
+    handshake = get_handshakes().get(host, port)
+    try:
+        ip_address = handshake['ip'] if handshake else pick_address(get_resolver().resolve(host))
+    except socket.gaierror:
+        return {"TLS Test": False, "tls_details": None, "tls_findings": [],
+                "error_message": f"Could not resolve domain: {host}"}
+
+    analysis, cached, handshake = asyncio.run(_analyse(host, ip_address, port, handshake))
+    if handshake is None or not handshake['chain']:
+        details = {'host': host, 'ip_address': ip_address, 'port': port, 'available': False}
+        if is_https:
+            return {"TLS Test": False, "tls_details": details, "tls_findings": [],
+                    "error_message": f"No TLS handshake with {host}:{port}"}
+        return {"TLS Test": False, "tls_details": details, "tls_findings": []} # Plain-HTTP site without HTTPS
+
+    certificate = certificate_report(handshake['chain'], host)
+    findings = tls_findings(certificate, handshake, analysis)
+    return {
+        "TLS Test": bool(findings),
+        "tls_details": {
+            'host': host,
+            'ip_address': ip_address,
+            'port': port,
+            'available': True,
+            'protocol': handshake['protocol'],
+            'cipher': handshake['cipher'],
+            'trusted': handshake['verified'],
+            'verify_error': handshake['verify_error'],
+            'certificate': certificate,
+            'protocols': analysis['protocols'],
+            'weak_ciphers': analysis['weak_ciphers'],
+            'certificate_source': handshake['source'], # 'http' or 'port_scan' when an earlier handshake was reused
+            'endpoint_cached': cached, # Versions and ciphers came from an earlier analysis of this IP:port
+        },
+        "tls_findings": findings,
+    }
@@ -1,6 +1,159 @@
 import requests
+import contextlib
+import contextvars
+import logging
+import os
 import urllib.parse
 import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.cookiejar import DefaultCookiePolicy
+from requests.adapters import HTTPAdapter
+import urllib3.exceptions
+from urllib3.util.retry import Retry
+from .resolver import install_urllib3_hook
+from .timing import install_urllib3_timing, record_request, bind
+from .handshakes import install_urllib3_capture
+from .scheduler import get_scheduler, BACKOFF_STATUSES
+
+logger = logging.getLogger(__name__)
+
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36 ToniaVulnScanner/1.0'
+
+# Connection pool / retry defaults for the shared session (see configure_http)
+HTTP_SETTINGS = {
+    'pool_connections': 32, # Number of hosts kept in the pool
+    'pool_maxsize': 16, # Keep-alive connections kept per host
+    'retries': 2, # Retries on connection errors and 502/503/504
+    'backoff_factor': 0.3, # 0.3s, 0.6s, ... between retries
+    # Most body bytes (after Content-Encoding is undone) kept per response; the rest is never read
+    'max_body_bytes': int(os.environ.get('HTTP_MAX_BODY_BYTES', 2 * 1024 * 1024)),
+}
+
+RETRY_METHODS = frozenset(['GET', 'HEAD'])
+
+BODY_CHUNK_SIZE = 64 * 1024
+
+# Bodies worth reading for the HTML and injection checks; anything else (images, archives,
+# media, ...) is dropped after the headers. A response without a Content-Type is read.
+TEXT_CONTENT_TYPES = ('text/', 'application/xhtml+xml', 'application/xml', 'application/json',
+                      'application/javascript', 'application/x-javascript', 'application/ld+json')
+
+# Why a body was not read in full (response.body_cut)
+CUT_SIZE = 'size'
+CUT_DEADLINE = 'deadline'
+CUT_CONTENT_TYPE = 'content_type'
+
+_session = None
+_session_lock = threading.Lock()
+
+# time.monotonic() by which the running check must be done (see check_deadline)
+_check_end_time = contextvars.ContextVar('check_end_time', default=None)
+
+
+@contextlib.contextmanager
+def check_deadline(end_time):
+    """
+    Every make_request in the block, and in threads it starts through
+    timing.bind, is cut short at end_time and fails once it has passed, so
+    a check abandoned at its deadline stops instead of holding its thread.
+    """
+    token = _check_end_time.set(end_time)
+    try:
+        yield
+    finally:
+        _check_end_time.reset(token)
+
+
+def check_time_left():
+    """Seconds until the running check's deadline, or None if it has none."""
+    end_time = _check_end_time.get()
+    return None if end_time is None else end_time - time.monotonic()
+
+
+class HostLimiter:
+    """One BoundedSemaphore of per_host_limit slots per host, created on first use."""
+
+    def __init__(self, per_host_limit):
+        self.per_host_limit = per_host_limit
+        self._lock = threading.Lock()
+        self._slots = {}
+
+    def slot(self, host):
+        with self._lock:
+            return self._slots.setdefault(host, threading.BoundedSemaphore(self.per_host_limit))
+
+
+_host_limiter = contextvars.ContextVar('host_limiter', default=None)
+
+
+@contextlib.contextmanager
+def shared_host_limit(per_host_limit):
+    """
+    At most per_host_limit requests from make_request are in flight per host
+    across the block and every thread it starts through timing.bind, however
+    many fan-outs are nested inside it. An enclosing limit is kept as is.
+    """
+    if _host_limiter.get() is not None:
+        yield
+        return
+    token = _host_limiter.set(HostLimiter(per_host_limit))
+    try:
+        yield
+    finally:
+        _host_limiter.reset(token)
+
+
+def _build_session():
+    install_urllib3_hook() # New connections resolve through the shared DNS cache
+    install_urllib3_timing() # TLS handshakes are timed as spans
+    install_urllib3_capture() # ... and recorded for the TLS check
+    session = requests.Session()
+    session.headers.update({'User-Agent': USER_AGENT}) # Add a user-agent to mimic a browser slightly
+    # Never carry cookies from one target (or one scan) into the next
+    session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+    retry = Retry(
+        total=HTTP_SETTINGS['retries'],
+        backoff_factor=HTTP_SETTINGS['backoff_factor'],
+        status_forcelist=(502, 504), # 429/503 are retried by make_request, through the scheduler
+        allowed_methods=RETRY_METHODS,
+        respect_retry_after_header=False,
+        raise_on_status=False, # Let raise_for_status below decide
+    )
+    adapter = HTTPAdapter(pool_connections=HTTP_SETTINGS['pool_connections'],
+                          pool_maxsize=HTTP_SETTINGS['pool_maxsize'],
+                          max_retries=retry)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def get_session():
+    """
+    Returns the process-wide requests.Session. Its urllib3 pools are
+    thread-safe, so every scanner module and worker thread shares it and
+    reuses keep-alive connections to the same host.
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = _build_session()
+    return _session
+
+
+def configure_http(**settings):
+    """Updates HTTP_SETTINGS (pool sizes, retries, backoff) and rebuilds the shared session."""
+    global _session
+    unknown = set(settings) - set(HTTP_SETTINGS)
+    if unknown:
+        raise ValueError(f"Unknown HTTP settings: {', '.join(sorted(unknown))}")
+    with _session_lock:
+        HTTP_SETTINGS.update(settings)
+        old_session, _session = _session, _build_session()
+    if old_session is not None:
+        old_session.close()
 
 def validate_and_normalize_url(url_string):
     """
@@ -24,21 +177,169 @@ def validate_and_normalize_url(url_string):
     except ValueError:
         return None
 
-def make_request(url, timeout=10):
-    """Makes a GET request to the URL and returns the response object."""
+def content_type_of(response):
+    """The response's media type, lower-cased and without parameters ('' if there is none)."""
+    return response.headers.get('Content-Type', '').split(';')[0].strip().lower()
+
+
+def _set_read_timeout(response, seconds):
+    # Bounds the next socket read, so one stalled read cannot outlast the deadline
+    connection = getattr(response.raw, 'connection', None) # urllib3 2.x
+    sock = getattr(connection, 'sock', None)
+    if sock is not None:
+        sock.settimeout(max(seconds, 0.001))
+
+
+def read_body(response, max_bytes=None, end_time=None, accept=None, on_chunk=None):
+    """
+    Reads a streamed response's body into memory, stopping at max_bytes
+    (default HTTP_SETTINGS['max_body_bytes']) or at end_time (a
+    time.monotonic() value). Content-Encoding is undone chunk by chunk, so
+    the cap counts decoded bytes and a compression bomb is cut off like any
+    other large body. If `accept` is given and the Content-Type starts with
+    none of its entries, the body is not read at all. on_chunk, if given,
+    is called as on_chunk(response, chunk) with each decoded chunk as it
+    arrives (e.g. to parse the page while it downloads). The result is stored
+    as response.content; response.body_cut is None for a complete body,
+    else CUT_SIZE, CUT_DEADLINE or CUT_CONTENT_TYPE. Raises
+    requests.exceptions.RequestException if the connection fails mid-body.
+    """
+    max_bytes = HTTP_SETTINGS['max_body_bytes'] if max_bytes is None else max_bytes
+    content_type = content_type_of(response)
+    body = bytearray()
+    cut = None
+    if accept and content_type and not content_type.startswith(tuple(accept)):
+        cut = CUT_CONTENT_TYPE
+    elif not hasattr(response.raw, 'read1'): # urllib3 1.x: read1 is missing, fall back to whole chunks
+        for chunk in response.iter_content(BODY_CHUNK_SIZE):
+            body += chunk
+            if on_chunk:
+                on_chunk(response, chunk)
+            if len(body) >= max_bytes or (end_time is not None and time.monotonic() >= end_time):
+                cut = CUT_SIZE if len(body) >= max_bytes else CUT_DEADLINE
+                break
+    else:
+        try:
+            while len(body) < max_bytes:
+                if end_time is not None:
+                    remaining = end_time - time.monotonic()
+                    if remaining <= 0:
+                        cut = CUT_DEADLINE
+                        break
+                    _set_read_timeout(response, remaining)
+                chunk = response.raw.read1(min(BODY_CHUNK_SIZE, max_bytes - len(body)), decode_content=True)
+                if not chunk:
+                    break
+                body += chunk
+                if on_chunk:
+                    on_chunk(response, chunk)
+            else:
+                cut = CUT_SIZE
+        except urllib3.exceptions.ReadTimeoutError:
+            if end_time is None or time.monotonic() < end_time:
+                raise requests.exceptions.ConnectionError("Read timed out", response=response)
+            cut = CUT_DEADLINE
+        except (urllib3.exceptions.HTTPError, OSError) as e:
+            raise requests.exceptions.ConnectionError(e, response=response)
+    response._content = bytes(body)
+    response._content_consumed = True
+    response.body_cut = cut
+    if response.encoding is None and body:
+        # requests would detect the charset by scanning the whole body; UTF-8 is what HTML defaults to
+        response.encoding = 'utf-8'
+    # Closing drops the connection if the body was not read to the end; otherwise it is back in the pool
+    response.close()
+    if cut is not None:
+        logger.debug("Body of %s cut short (%s) after %d bytes", response.url, cut, len(body))
+    return response
+
+
+def make_request(url, timeout=10, method='GET', data=None, allow_errors=False, headers=None,
+                 max_bytes=None, accept=None, deadline=None, on_chunk=None):
+    """
+    Makes a request (GET unless `method` says otherwise, with optional form
+    `data` and extra `headers`) and returns the response object, or None on
+    failure. 4xx/5xx responses count as failures unless allow_errors is True.
+    Time to first byte and download time are recorded as timing spans.
+    Every request first waits its turn with the outbound scheduler, which
+    backs the host off when it answers 429 or 503; GET and HEAD are then
+    retried (up to HTTP_SETTINGS['retries'] times) once the pause is over,
+    unless the pause outlasts the deadline.
+
+    The body is streamed (see read_body): at most max_bytes of it are kept,
+    it is skipped when its Content-Type matches none of `accept`, each
+    chunk is handed to on_chunk (see read_body; its time is not counted as
+    download time), and reading stops once `deadline` seconds (default `timeout`) have passed
+    since make_request was called, keeping whatever arrived by then. That
+    deadline covers every attempt: scheduler waits, backoff pauses, retries
+    and socket timeouts are all capped by the time left, and a request that
+    cannot get a token before it passes fails like a timed-out one.
+    Inside check_deadline both are capped by the check's remaining time,
+    and inside shared_host_limit each attempt waits for a free slot on its host.
+    """
+    host = get_hostname_from_url(url)
+    scheduler = get_scheduler()
+    deadline = timeout if deadline is None else deadline
+    time_left = check_time_left()
+    if time_left is not None:
+        if time_left <= 0:
+            logger.debug("Check deadline passed; not requesting %s", url)
+            return None
+        timeout, deadline = min(timeout, time_left), min(deadline, time_left)
+    end_time = time.monotonic() + deadline
+    limiter = _host_limiter.get()
+    handler_seconds = 0.0
+
+    def handle_chunk(chunk_response, chunk):
+        nonlocal handler_seconds
+        handler_started = time.monotonic()
+        on_chunk(chunk_response, chunk)
+        handler_seconds += time.monotonic() - handler_started
+
     try:
-        # Add a user-agent to mimic a browser slightly
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36 ToniaVulnScanner/1.0'
-        }
-        response = requests.get(url, timeout=timeout, headers=headers, allow_redirects=True)
-        response.raise_for_status() # Raise HTTPError for bad responses (4xx or 5xx)
+        for attempt in range(HTTP_SETTINGS['retries'] + 1):
+            if scheduler.acquire(host, timeout=end_time - time.monotonic()) is None:
+                raise requests.exceptions.Timeout(f"No request slot for {host} within {deadline:g}s")
+            # The shared per-host slot is only held while this attempt is on the wire,
+            # never while waiting on the scheduler or a backoff pause
+            slot = limiter.slot(host) if limiter is not None else None
+            if slot is not None and not slot.acquire(timeout=max(end_time - time.monotonic(), 0)):
+                raise requests.exceptions.Timeout(f"No free slot for {host} within {deadline:g}s")
+            try:
+                remaining = end_time - time.monotonic()
+                if remaining <= 0:
+                    raise requests.exceptions.Timeout(f"No time left for {url} within {deadline:g}s")
+                # Pooled keep-alive session shared by all checks
+                try:
+                    response = get_session().request(method, url, data=data, headers=headers,
+                                                     timeout=min(timeout, remaining), allow_redirects=True, stream=True)
+                except requests.exceptions.RequestException as e:
+                    record_request(method, error=e)
+                    raise
+                paused_for = scheduler.observe(host, response.status_code, response.headers.get('Retry-After'))
+                if (response.status_code not in BACKOFF_STATUSES or method.upper() not in RETRY_METHODS
+                        or attempt == HTTP_SETTINGS['retries'] or paused_for >= end_time - time.monotonic()):
+                    download_started = time.monotonic()
+                    try:
+                        read_body(response, max_bytes, end_time, accept, handle_chunk if on_chunk else None)
+                    except requests.exceptions.RequestException as e:
+                        record_request(method, error=e)
+                        raise
+                    break
+            finally:
+                if slot is not None:
+                    slot.release()
+            record_request(method, response)
+            response.close()
+        record_request(method, response, download_seconds=time.monotonic() - download_started - handler_seconds)
+        if not allow_errors:
+            response.raise_for_status() # Raise HTTPError for bad responses (4xx or 5xx)
         return response
     except requests.exceptions.Timeout:
-        print(f"Error: Request timed out for {url}")
+        logger.debug("Request timed out for %s", url)
         return None
     except requests.exceptions.RequestException as e:
-        print(f"Error making request to {url}: {e}")
+        logger.debug("Error making request to %s: %s", url, e)
         return None
 
 def get_domain_from_url(url_string):
@@ -47,4 +348,34 @@ def get_domain_from_url(url_string):
         parsed = urllib.parse.urlparse(url_string)
         return parsed.netloc
     except ValueError:
-        return None
\ No newline at end of file
+        return None
+
+def get_hostname_from_url(url_string):
+    """Extracts the bare host name (no credentials or port) from a URL."""
+    try:
+        return urllib.parse.urlparse(url_string).hostname
+    except ValueError:
+        return None
+
+
+def run_per_host(items, func, url_of, per_host_limit=8):
+    """
+    Calls func(item) for every item concurrently, with at most
+    per_host_limit calls in flight against the host of url_of(item).
+    Returns the results in the order of `items`.
+    """
+    if not items:
+        return []
+    host_slots = {}
+    for item in items:
+        host_slots.setdefault(get_hostname_from_url(url_of(item)), threading.BoundedSemaphore(per_host_limit))
+
+    def call(item):
+        with host_slots[get_hostname_from_url(url_of(item))]:
+            return func(item)
+
+    workers = min(len(items), per_host_limit * len(host_slots))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        # Each call runs in the caller's context, so its timing spans count towards the caller's scan
+        futures = [executor.submit(bind(call), item) for item in items]
+        return [future.result() for future in futures]
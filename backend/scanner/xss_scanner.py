@@ -1,80 +1,109 @@
 # WARNING: Basic XSS check. Real detection is much more complex.
-# This looks for simple reflections of basic script tags in non-standard places.
+# This looks for unescaped reflections of a small set of payloads in URL
+# parameters and form fields.
 
-import requests
-from bs4 import BeautifulSoup
-from urllib.parse import urljoin, urlparse, parse_qs, urlencode, urlunparse
-from .utils import make_request
+import logging
+import uuid
+from urllib.parse import urlencode
+from .utils import make_request, run_per_host, TEXT_CONTENT_TYPES
+from .context import get_context, iter_injection_points
+from .html_parser import reflection_context, declared_encoding
+from .parse_pool import run_parse
 
-def check_xss_potential(url):
+logger = logging.getLogger(__name__)
+
+# Each payload carries a unique marker so a reflection can be traced back to
+# the exact parameter and payload that caused it.
+XSS_PAYLOADS = [
+    "<script>alert('{marker}')</script>",
+    "\"><svg onload=alert('{marker}')>",
+    "'><img src=x onerror=alert('{marker}')>",
+    "';alert('{marker}');//",
+    "javascript:alert('{marker}')",
+]
+
+# Probes in flight against one host, and the most probes sent per check
+XSS_MAX_IN_FLIGHT_PER_HOST = 8
+XSS_MAX_PROBES = 200
+
+
+def _new_marker():
+    return 'tvx' + uuid.uuid4().hex[:10]
+
+
+def _classify_reflection(body, payload, marker, encoding=None):
+    """
+    Decides how a reflected marker landed in the page. The cheap substring
+    checks run first on the raw bytes; the page is only parsed when the
+    full payload came back unescaped. Returns a context name, or None if it
+    is not exploitable.
+    """
+    if marker.encode() not in body:
+        return None
+    if payload.encode() not in body:
+        return None # Marker reflected but the payload was escaped/filtered
+    return run_parse(reflection_context, body, marker, encoding)
+
+
+def _send_probe(method, action_url, params):
+    if method == 'POST':
+        return make_request(action_url, method='POST', data=params, allow_errors=True, accept=TEXT_CONTENT_TYPES)
+    query = urlencode(params, doseq=True)
+    return make_request(f"{action_url}?{query}" if query else action_url, allow_errors=True,
+                        accept=TEXT_CONTENT_TYPES)
+
+
+def check_xss_potential(url, context=None, payloads=None):
     """
-    Performs a *very basic* check for reflected XSS by injecting a simple
-    payload into URL parameters if they exist.
+    Performs a *basic* check for reflected XSS by injecting marker payloads
+    into every URL parameter and form field, concurrently. Every parameter
+    is tested with every payload (no first-hit-and-stop). Reuses the
+    baseline response and forms in `context` if given.
     """
-    is_vulnerable = False
-    details = "No obvious reflection found or no parameters to test."
-    test_payload = "<script>alert('ToniaVulnXSS')</script>"
-    encoded_payload = requests.utils.quote(test_payload) # URL-encode the payload
-
-    original_response = make_request(url)
-    if not original_response:
-        return {"XSS Test": False, "details": "Could not fetch original URL."}
-
-    parsed_url = urlparse(url)
-    query_params = parse_qs(parsed_url.query)
-
-    if not query_params:
-        # Try finding forms and testing their inputs (more complex)
-        # For now, if no URL params, report as likely not vulnerable via this method
-        details = "No URL parameters found to test for reflected XSS."
-        return {"XSS Test": False, "details": details}
-
-    # Test each parameter
-    for param in query_params:
-        # Create a copy of params to modify
-        test_params = parse_qs(parsed_url.query)
-        # Inject payload (replace existing value)
-        test_params[param] = [encoded_payload] # Use the encoded payload here
-
-        # Rebuild the URL with the injected parameter
-        test_query = urlencode(test_params, doseq=True)
-        test_url_parts = list(parsed_url)
-        test_url_parts[4] = test_query # Index 4 is the query string
-        test_url = urlunparse(test_url_parts)
-
-        print(f"Testing XSS with URL: {test_url}") # For debugging
-        test_response = make_request(test_url)
-
-        if test_response and test_response.text:
-            # Check if the *exact* payload string appears unescaped in the response HTML
-            # This is a weak check, real XSS can be much subtler
-            if test_payload in test_response.text:
-                 # Basic check passed - needs further investigation
-                # Check if it's inside a safe context (like a <textarea> or properly escaped)
-                # Using BeautifulSoup to see if the <script> tag exists as a tag (not just text)
-                try:
-                    soup = BeautifulSoup(test_response.text, 'lxml')
-                    scripts = soup.find_all('script')
-                    found_in_script_tag = any('ToniaVulnXSS' in str(s) for s in scripts)
-
-                    if found_in_script_tag:
-                         is_vulnerable = True
-                         details = f"Potential reflected XSS found in parameter '{param}'. Payload '{test_payload}' reflected in response's script tags."
-                         print(details) # For debugging
-                         break # Found one, no need to check others for this basic scan
-                    elif test_payload in test_response.text:
-                         # Reflected as text, maybe less severe but still notable
-                         is_vulnerable = True # Still flag as potential
-                         details = f"Potential reflected XSS found in parameter '{param}'. Payload '{test_payload}' reflected as plain text in response."
-                         print(details) # For debugging
-                         break
-
-                except Exception as e:
-                    print(f"Error parsing response for XSS check: {e}")
-
-
-    if not is_vulnerable and details == "No obvious reflection found or no parameters to test.":
-         details = "No simple reflected XSS found in URL parameters."
-
-
-    return {"XSS Test": is_vulnerable, "details": details}
\ No newline at end of file
+    payloads = payloads or XSS_PAYLOADS
+
+    context = get_context(url, context)
+    if not context.response:
+        return {"XSS Test": False, "xss_details": [], "error_message": "Could not fetch original URL."}
+
+    probes = []
+    for location, method, action_url, base_params, param in iter_injection_points(url, context):
+        for template in payloads:
+            marker = _new_marker()
+            payload = template.format(marker=marker)
+            params = dict(base_params)
+            params[param] = payload
+            probes.append((location, method, action_url, params, param, payload, marker))
+    if not probes:
+        return {"XSS Test": False, "xss_details": []}
+    if len(probes) > XSS_MAX_PROBES:
+        logger.info("XSS check for %s: limiting %d probes to %d", url, len(probes), XSS_MAX_PROBES)
+        probes = probes[:XSS_MAX_PROBES]
+
+    def run_probe(probe):
+        location, method, action_url, params, param, payload, marker = probe
+        response = _send_probe(method, action_url, params)
+        if response is None or not response.content:
+            return None
+        reflection = _classify_reflection(response.content, payload, marker, declared_encoding(response))
+        if reflection is None:
+            return None
+        return {
+            'parameter': param,
+            'location': location,
+            'method': method,
+            'url': action_url,
+            'payload': payload,
+            'context': reflection
+        }
+
+    # Probes to the same host share a capped set of pooled keep-alive connections
+    outcomes = run_per_host(probes, run_probe, url_of=lambda probe: probe[2],
+                            per_host_limit=XSS_MAX_IN_FLIGHT_PER_HOST)
+    findings = [f for f in outcomes if f]
+
+    for finding in findings:
+        logger.info("Potential reflected XSS in %s parameter '%s' (%s context)",
+                    finding['location'], finding['parameter'], finding['context'])
+
+    return {"XSS Test": bool(findings), "xss_details": findings}
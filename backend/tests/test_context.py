@@ -0,0 +1,29 @@
+# backend/tests/test_context.py
+# Run from backend/: python -m pytest tests
+
+from scanner.context import ScanContext, iter_injection_points
+
+
+def _form(action, *names, method='POST'):
+    return {'action': action, 'method': method,
+            'inputs': [{'name': name, 'type': 'text', 'value': ''} for name in names]}
+
+
+def test_cross_origin_form_is_skipped():
+    url = 'https://shop.example/login?next=home'
+    forms = [
+        _form('https://shop.example/login', 'user'),
+        _form('https://idp.example/authorize', 'username'), # External identity provider
+        _form('http://shop.example/search', 'q', method='GET'), # Same host, other scheme
+        _form('https://shop.example:8443/admin', 'token'), # Same host, other port
+        _form('https://shop.example:443/comment', 'body'), # Explicit default port is the same origin
+    ]
+    context = ScanContext.from_page(url, None, forms)
+
+    points = [(location, action_url, param) for location, _, action_url, _, param in iter_injection_points(url, context)]
+
+    assert points == [
+        ('query', 'https://shop.example/login', 'next'),
+        ('form', 'https://shop.example/login', 'user'),
+        ('form', 'https://shop.example:443/comment', 'body'),
+    ]
@@ -0,0 +1,22 @@
+# backend/tests/test_history.py
+# Run from backend/: python -m pytest tests
+
+import pytest
+
+from history import HistoryQueryError, build_history_query
+
+
+def _time_param(**args):
+    return build_history_query(args)[1][0]
+
+
+def test_since_and_until_are_compared_in_utc():
+    assert _time_param(since='2024-01-31') == '2024-01-31 00:00:00'
+    assert _time_param(since='2024-01-31T12:00:00Z') == '2024-01-31 12:00:00'
+    assert _time_param(since='2024-01-31T12:00:00+02:00') == '2024-01-31 10:00:00'
+    assert _time_param(until='2024-01-31T23:30:00-05:00') == '2024-02-01 04:30:00'
+
+
+def test_bad_date_is_rejected():
+    with pytest.raises(HistoryQueryError):
+        build_history_query({'since': 'yesterday'})
@@ -30,6 +30,7 @@ const resultLabels = {
     "Vulnerabilities Test": "Vulnerability Scan Status",
     "SQL Injection Test": "SQL Injection Potential",
     "XSS Test": "XSS Potential (Reflected)",
+    "Crawl Test": "Findings on Crawled Pages",
     "Scan Ports": "Open Ports Found",
     "Header of x-frame": "X-Frame-Options Header",
     "Header of hsts": "Strict-Transport-Security (HSTS) Header",
@@ -46,14 +47,22 @@ function ResultsDisplay({ data }) {
     const results = data.results;
     const errors = data.errors;
 
+    // services and ip_addresses are shown with the ports, not as rows of their own
     const mainResultKeys = Object.keys(results).filter(key =>
-        !key.endsWith('_details') && key !== 'ip_address'
+        !key.endsWith('_details') && !key.endsWith('_findings') &&
+        !['ip_address', 'ip_addresses', 'services'].includes(key)
     );
 
     const sqliFormDetails = results.sqli_details;
+    const sqliFindings = results.sqli_findings;
     const xssDetails = results.xss_details;
+    const crawlFindings = results.crawl_findings;
+    const crawlDetails = results.crawl_details;
+    const services = results.services;
 
-    const showDetailsSection = (sqliFormDetails && sqliFormDetails.length > 0) || xssDetails;
+    const showDetailsSection = (sqliFormDetails && sqliFormDetails.length > 0) ||
+        (sqliFindings && sqliFindings.length > 0) || (xssDetails && xssDetails.length > 0) ||
+        (crawlFindings && crawlFindings.length > 0) || (services && services.length > 0);
 
     return (
         // Added results-card class
@@ -87,7 +96,9 @@ function ResultsDisplay({ data }) {
                                             ? results[key].join(', ')
                                             : (Array.isArray(results[key]) ? <span className="text-muted">None found</span> : renderResult(results[key]))
                                         }
-                                        {results['ip_address'] && ` (IP: ${results['ip_address']})`}
+                                        {results['ip_addresses'] && results['ip_addresses'].length > 1
+                                            ? ` (IPs: ${results['ip_addresses'].join(', ')})`
+                                            : (results['ip_address'] && ` (IP: ${results['ip_address']})`)}
                                     </td>
                                 ) : (
                                      <td>{renderResult(results[key])}</td>
@@ -103,6 +114,38 @@ function ResultsDisplay({ data }) {
                         {/* <hr />  Removed HR as section styling provides separation */}
                         <h5>Check Details:</h5>
 
+                        {/* Services identified on open ports */}
+                        {services && services.length > 0 && (
+                            <div className="mb-3">
+                                <strong>Services on Open Ports:</strong>
+                                <ul style={{ fontSize: '0.9em' }}>
+                                    {services.map((service, index) => (
+                                        <li key={index}>
+                                            Port <code>{service.port}</code>{service.address && <> on <code>{service.address}</code></>}:
+                                            {' '}{service.service || 'unknown'}{service.tls ? ' (TLS)' : ''}
+                                            {service.product && <> &mdash; {service.product}{service.version ? ` ${service.version}` : ''}</>}
+                                            {service.banner && <> <code>{service.banner}</code></>}
+                                        </li>
+                                    ))}
+                                </ul>
+                            </div>
+                        )}
+
+                        {/* SQLi Confirmed Findings */}
+                        {sqliFindings && sqliFindings.length > 0 && (
+                            <div className="mb-3">
+                                <strong>SQL Injection Findings:</strong>
+                                <ul style={{ fontSize: '0.9em' }}>
+                                    {sqliFindings.map((finding, index) => (
+                                        <li key={index}>
+                                            {finding.technique} injection in {finding.location === 'form' ? 'form field' : 'URL parameter'} <code>{finding.parameter}</code>
+                                            {' '}({finding.method} <code>{finding.url}</code>) with <code>{finding.payload}</code>: {finding.evidence}
+                                        </li>
+                                    ))}
+                                </ul>
+                            </div>
+                        )}
+
                         {/* SQLi Detailed Form Info */}
                         {sqliFormDetails && sqliFormDetails.length > 0 && (
                             <div className="mb-3">
@@ -132,12 +175,35 @@ function ResultsDisplay({ data }) {
                         )} {/* Closing div for SQLi details */}
 
                         {/* XSS Details */}
-                        {xssDetails && (
+                        {xssDetails && xssDetails.length > 0 && (
                             <div>
-                                <p><small><strong>XSS Details:</strong> {xssDetails}</small></p>
+                                <strong>Reflected XSS Findings:</strong>
+                                <ul style={{ fontSize: '0.9em' }}>
+                                    {xssDetails.map((finding, index) => (
+                                        <li key={index}>
+                                            {finding.location === 'form' ? 'Form field' : 'URL parameter'} <code>{finding.parameter}</code>
+                                            {' '}({finding.method} <code>{finding.url}</code>) reflected <code>{finding.payload}</code> in {finding.context} context
+                                        </li>
+                                    ))}
+                                </ul>
                             </div>
                         )} {/* Closing div for XSS details */}
 
+                        {/* Findings on pages discovered by the crawler */}
+                        {crawlFindings && crawlFindings.length > 0 && (
+                            <div className="mt-3">
+                                <strong>Findings on Crawled Pages{crawlDetails ? ` (${crawlDetails.pages_crawled} pages crawled)` : ''}:</strong>
+                                <ul style={{ fontSize: '0.9em' }}>
+                                    {crawlFindings.map((finding, index) => (
+                                        <li key={index}>
+                                            {finding.check === 'sqli' ? `${finding.technique} SQL injection` : `Reflected XSS (${finding.context} context)`} in
+                                            {' '}{finding.location === 'form' ? 'form field' : 'URL parameter'} <code>{finding.parameter}</code> on <code>{finding.page}</code>
+                                        </li>
+                                    ))}
+                                </ul>
+                            </div>
+                        )}
+
                     </div> /* Closing check-details-section div */
                 )} {/* Closing outer conditional block for details */}
 
@@ -6,6 +6,52 @@ import ResultsDisplay from '../components/ResultsDisplay';
 // Define the backend API URL
 const API_URL = process.env.REACT_APP_API_URL || 'http://localhost:5000/api/scan'; // Use environment variable or default
 
+// Results are streamed as Server-Sent Events; each check shows up as soon as it finishes.
+// Resolves with the final summary (same shape as the blocking scan response).
+const streamScan = (url, onPartial) => new Promise((resolve, reject) => {
+  const source = new EventSource(`${API_URL}/stream?url=${encodeURIComponent(url)}`);
+  const partial = {
+    message: "Scan in progress",
+    results: { "Check if the link is valid or not": true },
+    errors: null
+  };
+  let started = false;
+
+  const publish = () => onPartial({ ...partial, results: { ...partial.results } });
+  const appendTo = (key, item) => {
+    partial.results[key] = [...(partial.results[key] || []), item];
+  };
+  const on = (eventName, handler) => source.addEventListener(eventName, (event) => {
+    handler(JSON.parse(event.data));
+    publish();
+  });
+
+  source.addEventListener('started', () => { started = true; });
+  // Whole-check events carry the final result keys for that check
+  ['headers', 'ports', 'sqli', 'xss'].forEach((eventName) =>
+    on(eventName, (data) => Object.assign(partial.results, data)));
+  on('port', (port) => {
+    if (!(partial.results["Scan Ports"] || []).includes(port.port)) {
+      appendTo("Scan Ports", port.port);
+    }
+  });
+  on('sqli_form', (form) => appendTo("sqli_details", form));
+  on('sqli_finding', (finding) => appendTo("sqli_findings", finding));
+  on('xss_finding', (finding) => appendTo("xss_details", finding));
+  // Not 'error': an event by that name would also fire source.onerror and end the stream
+  on('check_error', (error) => { partial.errors = { ...partial.errors, ...error }; });
+  source.addEventListener('summary', (event) => {
+    source.close();
+    resolve(JSON.parse(event.data));
+  });
+  source.onerror = () => {
+    source.close();
+    const err = new Error("Lost connection to the scanner while streaming results.");
+    err.streamUnavailable = !started; // e.g. rejected before the scan started (invalid URL)
+    reject(err);
+  };
+});
+
 function ScanPage() {
   const [results, setResults] = useState(null);
   const [isLoading, setIsLoading] = useState(false);
@@ -32,8 +78,18 @@ function ScanPage() {
 
 
     try {
-      // Step 4: Send via POST request
-      const response = await axios.post(API_URL, { url: url });
+      // Step 4: Start the scan and show results as they stream in
+      let data;
+      try {
+        data = await streamScan(url, setResults);
+      } catch (streamError) {
+        if (!streamError.streamUnavailable) {
+          throw streamError;
+        }
+        // Fall back to the blocking request, which also reports validation errors properly
+        ({ data } = await axios.post(API_URL, { url: url, wait: true }));
+      }
+      const response = { data };
       // Step 7: Receive result
       console.log("API Response:", response.data); // Log the response
 